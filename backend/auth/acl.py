@@ -0,0 +1,83 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from models import User, UserGroupRole
+
+# How many users' realm roles are kept in memory; least recently used entries are dropped first
+ACL_CACHE_SIZE = int(os.getenv("ACL_CACHE_SIZE", "10000"))
+
+RealmRoles = Dict[str, List[str]]
+
+
+def build_realm_roles(session: Session, user_id: int) -> RealmRoles:
+    """
+    Map each group the user belongs to (as a string id) to the user's lowercase roles in it.
+    """
+    group_roles = session.exec(select(UserGroupRole).where(UserGroupRole.user_id == user_id)).all()
+
+    acl = {}
+    for group_role in group_roles:
+        group_id = str(group_role.group_id)
+        role = group_role.role.value.lower()
+        if group_id not in acl:
+            acl[group_id] = []
+        acl[group_id].append(role)
+    return acl
+
+
+class ACLCache:
+    """
+    Per-user cache of realm roles, as put into the `realm_roles` token claim.
+
+    Entries are stamped with the user's `acl_version` column, which role changes bump in the same
+    transaction. An entry is only used while its stamp matches the version of the user being issued
+    a token, so every process agrees on the version and a restart or eviction does not change it.
+    """
+
+    def __init__(self, max_entries: int = ACL_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Tuple[int, RealmRoles]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session: Session, user: User) -> Tuple[RealmRoles, int]:
+        """
+        Return the user's realm roles and their version, building them if not cached for that version.
+        """
+        with self._lock:
+            entry = self._entries.get(user.id)
+            if entry is not None and entry[0] == user.acl_version:
+                self._entries.move_to_end(user.id)
+                self.hits += 1
+                return {group_id: list(roles) for group_id, roles in entry[1].items()}, entry[0]
+            self.misses += 1
+
+        version = user.acl_version
+        acl = build_realm_roles(session, user.id)
+
+        with self._lock:
+            self._entries[user.id] = (version, acl)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return {group_id: list(roles) for group_id, roles in acl.items()}, version
+
+    def version(self, session: Session, user_id: int) -> Optional[int]:
+        """
+        The current version of the user's realm roles, or None if there is no such user.
+        """
+        return session.exec(select(User.acl_version).where(User.id == user_id)).first()
+
+    def invalidate(self, user_ids: Iterable[int]):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
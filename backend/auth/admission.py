@@ -0,0 +1,229 @@
+import ipaddress
+import math
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set
+
+from hashing import PasswordHasher
+
+# --- Login Admission Control ---
+# Password logins are admitted through token buckets before any bcrypt work is done:
+# - per username and per client IP, so a credential-stuffing burst is shed early
+# - one global bucket refilled at the rate the hashing workers can sustain, so logins cannot use
+#   more than LOGIN_CPU_SHARE of the hashing capacity and starve the other endpoints
+LOGIN_USERNAME_BURST = int(os.getenv("LOGIN_USERNAME_BURST", "10"))
+LOGIN_USERNAME_PER_MINUTE = float(os.getenv("LOGIN_USERNAME_PER_MINUTE", "30"))
+LOGIN_IP_BURST = int(os.getenv("LOGIN_IP_BURST", "50"))
+LOGIN_IP_PER_MINUTE = float(os.getenv("LOGIN_IP_PER_MINUTE", "300"))
+LOGIN_CPU_SHARE = float(os.getenv("LOGIN_CPU_SHARE", "0.75"))
+# Seconds of full hashing capacity that may be admitted at once
+LOGIN_CPU_BURST_SECONDS = float(os.getenv("LOGIN_CPU_BURST_SECONDS", "2"))
+# Most usernames / IPs tracked at once; least recently seen ones are dropped first
+LOGIN_BUCKETS_MAX = int(os.getenv("LOGIN_BUCKETS_MAX", "100000"))
+# Header carrying the client address set by the reverse proxy (proxy/nginx.conf sets X-Real-IP);
+# empty to always use the peer address
+LOGIN_CLIENT_IP_HEADER = os.getenv("LOGIN_CLIENT_IP_HEADER", "X-Real-IP")
+# Peers whose LOGIN_CLIENT_IP_HEADER is believed: comma-separated addresses, networks (CIDR) or
+# host names (the compose stack's proxy is `nginx`). Any other peer's header is ignored, since a
+# client reaching auth directly could otherwise claim a fresh address on every attempt.
+LOGIN_TRUSTED_PROXIES = [entry.strip() for entry in os.getenv("LOGIN_TRUSTED_PROXIES", "").split(",") if entry.strip()]
+# How long host names in LOGIN_TRUSTED_PROXIES keep resolving to the same addresses
+TRUSTED_PROXY_RESOLVE_SECONDS = 60
+
+
+class TrustedProxies:
+    """
+    The peers allowed to name the client address in LOGIN_CLIENT_IP_HEADER. Host names are
+    resolved again every TRUSTED_PROXY_RESOLVE_SECONDS, as a proxy container may change address.
+    """
+
+    def __init__(self, entries: Iterable[str], resolve_seconds: float = TRUSTED_PROXY_RESOLVE_SECONDS):
+        self.entries = set(entries)
+        self.networks = []
+        self.hostnames = []
+        for entry in self.entries:
+            try:
+                self.networks.append(ipaddress.ip_network(entry, strict=False))
+            except ValueError:
+                self.hostnames.append(entry)
+        self.resolve_seconds = resolve_seconds
+        self._lock = threading.Lock()
+        self._resolved: Set[str] = set()
+        self._resolved_at: Optional[float] = None
+
+    def __bool__(self) -> bool:
+        return bool(self.entries)
+
+    def is_trusted(self, peer: Optional[str]) -> bool:
+        """
+        Whether `peer` is a trusted proxy. May resolve host names, so it can block.
+        """
+        if not peer:
+            return False
+        if peer in self.entries:
+            return True
+        try:
+            address = ipaddress.ip_address(peer)
+        except ValueError:
+            return False
+        if any(address in network for network in self.networks):
+            return True
+        return bool(self.hostnames) and str(address) in self._hostname_addresses()
+
+    def _hostname_addresses(self) -> Set[str]:
+        now = time.monotonic()
+        with self._lock:
+            if self._resolved_at is not None and now - self._resolved_at < self.resolve_seconds:
+                return self._resolved
+        addresses = set()
+        for hostname in self.hostnames:
+            try:
+                addresses.update(str(ipaddress.ip_address(info[4][0])) for info in socket.getaddrinfo(hostname, None))
+            except (socket.gaierror, ValueError):
+                # Not resolvable (yet): trust nothing for it until the next resolution
+                continue
+        with self._lock:
+            self._resolved = addresses
+            self._resolved_at = now
+        return addresses
+
+
+class LoginThrottled(Exception):
+    """Raised when a login attempt is not admitted; retry_after is in whole seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Login throttled by {reason} limit")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, capacity: float, rate: float, now: float):
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def wait_seconds(self, rate: float) -> float:
+        """Seconds until one token is available, 0 if one is available now."""
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / rate
+
+
+class KeyedBuckets:
+    """
+    One token bucket per key in a bounded LRU map. Callers hold the admission lock.
+    """
+
+    def __init__(self, capacity: float, per_minute: float, max_entries: int):
+        self.capacity = capacity
+        self.rate = per_minute / 60
+        self.max_entries = max_entries
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def bucket(self, key: str, now: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.capacity, now)
+            if len(self._buckets) > self.max_entries:
+                # A dropped bucket was idle longest, so it would have been full again anyway
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.refill(self.capacity, self.rate, now)
+        return bucket
+
+    def clear(self):
+        self._buckets.clear()
+
+
+class LoginAdmission:
+    """
+    Admission controller for POST /login, sized from the hasher's measured bcrypt cost.
+    """
+
+    def __init__(
+        self,
+        hasher: PasswordHasher,
+        cpu_share: float = LOGIN_CPU_SHARE,
+        cpu_burst_seconds: float = LOGIN_CPU_BURST_SECONDS,
+        max_entries: int = LOGIN_BUCKETS_MAX,
+    ):
+        self.hasher = hasher
+        self.cpu_share = cpu_share
+        self.cpu_burst_seconds = cpu_burst_seconds
+        self.usernames = KeyedBuckets(LOGIN_USERNAME_BURST, LOGIN_USERNAME_PER_MINUTE, max_entries)
+        self.ips = KeyedBuckets(LOGIN_IP_BURST, LOGIN_IP_PER_MINUTE, max_entries)
+        self._cpu_bucket: Optional[TokenBucket] = None
+        self._lock = threading.Lock()
+        self.admitted_hashes = 0
+        self.rejected = {"username": 0, "ip": 0, "cpu": 0}
+
+    def cpu_rate(self) -> float:
+        """Verifications per second the login budget allows at the current hash cost."""
+        return self.cpu_share * self.hasher.max_workers / self.hasher.hash_cost_seconds()
+
+    def _reject(self, reason: str, wait: float):
+        self.rejected[reason] += 1
+        raise LoginThrottled(reason, max(1, math.ceil(wait)))
+
+    def admit_client(self, username: str, client_ip: Optional[str]):
+        """
+        Charge the attempt to the username's and the client IP's buckets.
+
+        Raises:
+            LoginThrottled: If either bucket is empty; neither is charged then.
+        """
+        now = time.monotonic()
+        with self._lock:
+            username_bucket = self.usernames.bucket(username, now)
+            ip_bucket = self.ips.bucket(client_ip, now) if client_ip else None
+            if ip_bucket and ip_bucket.tokens < 1:
+                self._reject("ip", ip_bucket.wait_seconds(self.ips.rate))
+            if username_bucket.tokens < 1:
+                self._reject("username", username_bucket.wait_seconds(self.usernames.rate))
+            username_bucket.tokens -= 1
+            if ip_bucket:
+                ip_bucket.tokens -= 1
+
+    def admit_hash(self):
+        """
+        Charge one password verification to the global CPU budget, just before it is queued.
+
+        Raises:
+            LoginThrottled: If the budget is used up.
+        """
+        now = time.monotonic()
+        with self._lock:
+            rate = self.cpu_rate()
+            capacity = max(1.0, rate * self.cpu_burst_seconds)
+            if self._cpu_bucket is None:
+                self._cpu_bucket = TokenBucket(capacity, now)
+            else:
+                self._cpu_bucket.refill(capacity, rate, now)
+            if self._cpu_bucket.tokens < 1:
+                self._reject("cpu", self._cpu_bucket.wait_seconds(rate))
+            self._cpu_bucket.tokens -= 1
+            self.admitted_hashes += 1
+
+    def clear(self):
+        with self._lock:
+            self.usernames.clear()
+            self.ips.clear()
+            self._cpu_bucket = None
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            metrics = {
+                "auth_login_hash_admitted_total": self.admitted_hashes,
+                "auth_login_cpu_budget_per_second": round(self.cpu_rate(), 3),
+            }
+            for reason, count in self.rejected.items():
+                metrics[f'auth_login_rejected_total{{reason="{reason}"}}'] = count
+            return metrics
@@ -0,0 +1,138 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlmodel import Session, select
+
+from models import User, UserCreate, Group, UserGroupRole, GlobalRole, GroupRole, BulkUserResult
+
+# Most rows accepted by one POST /admin/users/bulk request
+BULK_USER_LIMIT = int(os.getenv("BULK_USER_LIMIT", "50000"))
+# Bound parameters per IN query / multi-row insert, below the SQLite and PostgreSQL limits
+BULK_CHUNK_SIZE = 1000
+
+CSV_CONTENT_TYPES = ("text/csv", "application/csv")
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+class BulkImportError(ValueError):
+    """Raised when the request body as a whole cannot be imported."""
+
+
+def parse_user_rows(body: bytes, content_type: str) -> List[dict]:
+    """
+    Parse a CSV (header row with username, password, global_role) or NDJSON body into raw rows.
+
+    Raises:
+        BulkImportError: If the format is unsupported, the body is malformed or has too many rows.
+    """
+    media_type = content_type.split(";")[0].strip().lower()
+    text = body.decode("utf-8-sig")
+    if media_type in CSV_CONTENT_TYPES:
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames or "username" not in reader.fieldnames:
+            raise BulkImportError("CSV header must include a username column.")
+        # Empty cells mean "not given", e.g. no password for accounts that only use Google login
+        rows = [{key: value for key, value in row.items() if value not in (None, "")} for row in reader]
+    elif media_type in NDJSON_CONTENT_TYPES:
+        rows = []
+        for line_number, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                raise BulkImportError(f"Line {line_number} is not valid JSON: {e.msg}")
+    else:
+        raise BulkImportError(
+            f"Unsupported content type {media_type or 'none'}; send text/csv or application/x-ndjson."
+        )
+    if len(rows) > BULK_USER_LIMIT:
+        raise BulkImportError(f"At most {BULK_USER_LIMIT} users can be imported at once.")
+    return rows
+
+
+def validate_user_rows(rows: List[dict]) -> List[BulkUserResult]:
+    """
+    Validate every row as a UserCreate and flag repeated usernames within the upload.
+
+    Returns one result per row; rows that can be created are left with status "pending".
+    """
+    results = []
+    seen = set()
+    for index, row in enumerate(rows):
+        try:
+            if not isinstance(row, dict):
+                raise ValueError("row must be an object")
+            user_create = UserCreate.model_validate(row)
+        except (ValidationError, ValueError) as e:
+            detail = "; ".join(error["msg"] for error in e.errors()) if isinstance(e, ValidationError) else str(e)
+            results.append(BulkUserResult(row=index, username=str(row.get("username", "")) if isinstance(row, dict) else "",
+                                          status="invalid", detail=detail))
+            continue
+        if user_create.username in seen:
+            results.append(BulkUserResult(row=index, username=user_create.username, status="duplicate",
+                                          detail="Username repeated in this upload."))
+            continue
+        seen.add(user_create.username)
+        results.append(BulkUserResult(row=index, username=user_create.username, status="pending",
+                                      user_create=user_create))
+    return results
+
+
+def _chunks(items: list, size: int = BULK_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def find_existing_usernames(session: Session, usernames: List[str]) -> set:
+    existing = set()
+    for chunk in _chunks(usernames):
+        existing.update(session.exec(select(User.username).where(User.username.in_(chunk))).all())
+    return existing
+
+
+def insert_users(session: Session, results: List[BulkUserResult], password_hashes: Dict[int, Optional[str]]) -> List[int]:
+    """
+    Insert the pending rows with multi-row inserts, plus their default group membership.
+
+    Fills in id and status on each result and returns the ids of the created users.
+    """
+    pending = [result for result in results if result.status == "pending"]
+    now = datetime.now(timezone.utc)
+    ids_by_username = {}
+    for chunk in _chunks(pending):
+        created = session.exec(
+            insert(User).returning(User.id, User.username),
+            params=[
+                {
+                    "username": result.username,
+                    "password": password_hashes.get(result.row),
+                    "global_role": result.user_create.global_role or GlobalRole.USER,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for result in chunk
+            ],
+        ).all()
+        ids_by_username.update({username: user_id for user_id, username in created})
+
+    default_group = session.exec(select(Group).where(Group.group_name == "default")).first()
+    if default_group:
+        for chunk in _chunks(list(ids_by_username.values())):
+            session.exec(
+                insert(UserGroupRole),
+                params=[{"user_id": user_id, "group_id": default_group.id, "role": GroupRole.USER} for user_id in chunk],
+            )
+    session.commit()
+
+    for result in pending:
+        result.id = ids_by_username[result.username]
+        result.status = "created"
+        result.user_create = None
+    return list(ids_by_username.values())
@@ -0,0 +1,92 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List
+
+from sqlmodel import Session, select
+
+from models import User, Group
+
+# Entries kept per kind (users, groups); least recently used entries are dropped first
+DIRECTORY_CACHE_SIZE = int(os.getenv("DIRECTORY_CACHE_SIZE", "50000"))
+# Most ids accepted by one lookup request
+DIRECTORY_LOOKUP_LIMIT = int(os.getenv("DIRECTORY_LOOKUP_LIMIT", "500"))
+# How long browsers may reuse a lookup response
+DIRECTORY_MAX_AGE = int(os.getenv("DIRECTORY_MAX_AGE", "300"))
+
+# kind -> (model, name column)
+DIRECTORY_KINDS = {
+    "user": (User, User.username),
+    "group": (Group, Group.group_name),
+}
+
+
+class DirectoryCache:
+    """
+    In-process LRU cache of user id -> username and group id -> group name.
+
+    Misses are resolved with one IN query per lookup. Ids that do not exist are not cached, so a
+    user or group created later is found on the next lookup.
+    """
+
+    def __init__(self, max_entries: int = DIRECTORY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: Dict[str, "OrderedDict[int, str]"] = {kind: OrderedDict() for kind in DIRECTORY_KINDS}
+        # Bumped by every invalidation; names read by a query that overlapped one are not cached
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, session: Session, kind: str, ids: Iterable[int]) -> Dict[int, str]:
+        entries = self._entries[kind]
+        names = {}
+        missing: List[int] = []
+        with self._lock:
+            for entity_id in dict.fromkeys(ids):
+                name = entries.get(entity_id)
+                if name is None:
+                    missing.append(entity_id)
+                else:
+                    entries.move_to_end(entity_id)
+                    names[entity_id] = name
+            self.hits += len(names)
+            self.misses += len(missing)
+            generation = self._generation
+
+        if missing:
+            model, name_column = DIRECTORY_KINDS[kind]
+            rows = session.exec(select(model.id, name_column).where(model.id.in_(missing))).all()
+            found = dict(rows)
+            names.update(found)
+            with self._lock:
+                if generation == self._generation:
+                    entries.update(found)
+                    while len(entries) > self.max_entries:
+                        entries.popitem(last=False)
+        return names
+
+    def invalidate(self, kind: str, ids: Iterable[int]):
+        with self._lock:
+            self._generation += 1
+            for entity_id in ids:
+                self._entries[kind].pop(entity_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            for entries in self._entries.values():
+                entries.clear()
+
+
+def parse_lookup_ids(ids: str) -> List[int]:
+    """
+    Parse a comma-separated id list such as "1,2,3".
+
+    Raises:
+        ValueError: If an id is not an integer or more than DIRECTORY_LOOKUP_LIMIT are given.
+    """
+    parsed = [int(part) for part in ids.split(",") if part.strip()]
+    if len(parsed) > DIRECTORY_LOOKUP_LIMIT:
+        raise ValueError(f"At most {DIRECTORY_LOOKUP_LIMIT} ids may be looked up at once.")
+    return parsed
@@ -0,0 +1,174 @@
+import asyncio
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from passlib.context import CryptContext
+
+# --- Password Hashing Setup ---
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# bcrypt releases the GIL, so a thread pool hashes in parallel without blocking the event loop.
+# HASH_WORKERS caps how many hashes run at once; HASH_MAX_QUEUE caps how many may wait for a worker.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_MAX_QUEUE = int(os.getenv("HASH_MAX_QUEUE", "64"))
+# Weight of the latest hash in the running estimate of the bcrypt cost
+HASH_COST_SMOOTHING = 0.1
+# Bulk imports hash on their own process pool so they never queue ahead of interactive logins.
+# By default it only gets the cores the interactive pool leaves over (at least one), so an import
+# does not take the CPU the login budget (see admission.py) counts on.
+BULK_HASH_WORKERS = int(os.getenv("BULK_HASH_WORKERS", str(max(1, (os.cpu_count() or 1) - HASH_WORKERS))))
+
+
+class HashingOverloaded(Exception):
+    """Raised when the hashing queue is full and the request should be retried later."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification on a bounded pool of worker threads and keeps
+    queue-depth and timing metrics.
+    """
+
+    def __init__(self, max_workers: int = HASH_WORKERS, max_queue: int = HASH_MAX_QUEUE):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.max_queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.hash_seconds = 0.0
+        # Moving average of one hash or verify, in seconds
+        self._hash_cost: Optional[float] = None
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(pwd_context.hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._submit(pwd_context.verify, plain_password, hashed_password)
+
+    async def _submit(self, fn: Callable, *args):
+        with self._lock:
+            # Idle workers pick up queued jobs first; beyond them at most max_queue jobs may wait
+            if self.queued >= self.max_queue + self.max_workers - self.in_flight:
+                self.rejected += 1
+                raise HashingOverloaded()
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hash")
+            executor = self._executor
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, self._run, time.perf_counter(), fn, *args)
+
+    def _run(self, submitted_at: float, fn: Callable, *args):
+        started_at = time.perf_counter()
+        with self._lock:
+            self.queued -= 1
+            self.in_flight += 1
+            self.wait_seconds += started_at - submitted_at
+        try:
+            return fn(*args)
+        finally:
+            finished_at = time.perf_counter()
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+                self.hash_seconds += finished_at - started_at
+                elapsed = finished_at - started_at
+                if self._hash_cost is None:
+                    self._hash_cost = elapsed
+                else:
+                    self._hash_cost += HASH_COST_SMOOTHING * (elapsed - self._hash_cost)
+
+    def hash_cost_seconds(self) -> float:
+        """
+        Measured cost of one hash or verify. Until a request has been served it is measured with
+        a single calibration hash, which the startup hook triggers.
+        """
+        if self._hash_cost is None:
+            started_at = time.perf_counter()
+            pwd_context.hash("calibration")
+            elapsed = time.perf_counter() - started_at
+            with self._lock:
+                if self._hash_cost is None:
+                    self._hash_cost = elapsed
+        return self._hash_cost
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "auth_password_hash_workers": self.max_workers,
+                "auth_password_hash_in_flight": self.in_flight,
+                "auth_password_hash_queue_depth": self.queued,
+                "auth_password_hash_queue_depth_max": self.max_queued,
+                "auth_password_hash_completed_total": self.completed,
+                "auth_password_hash_rejected_total": self.rejected,
+                "auth_password_hash_wait_seconds_total": round(self.wait_seconds, 6),
+                "auth_password_hash_seconds_total": round(self.hash_seconds, 6),
+                "auth_password_hash_cost_seconds": round(self._hash_cost or 0.0, 6),
+            }
+
+    def shutdown(self):
+        # The pool is started again by the next hash or verify
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    return [pwd_context.hash(password) for password in passwords]
+
+
+class BulkPasswordHasher:
+    """
+    Hashes large batches of passwords across a pool of worker processes.
+
+    The pool is started on first use. Passwords are sent in a few chunks per worker, not one
+    task per password, to keep pickling and scheduling overhead low.
+    """
+
+    def __init__(self, max_workers: int = BULK_HASH_WORKERS):
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn, since forking the threaded server process is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    async def hash_many(self, passwords: List[str]) -> List[str]:
+        if not passwords:
+            return []
+        chunk_size = max(1, math.ceil(len(passwords) / (self.max_workers * 4)))
+        chunks = [passwords[start:start + chunk_size] for start in range(0, len(passwords), chunk_size)]
+        loop = asyncio.get_running_loop()
+        pool = self._pool()
+        hashed = await asyncio.gather(*(loop.run_in_executor(pool, hash_passwords, chunk) for chunk in chunks))
+        return [password_hash for chunk in hashed for password_hash in chunk]
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,145 @@
+import json
+import os
+from enum import Enum
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import literal, tuple_
+from sqlmodel import Session, SQLModel, select
+
+from models import User, UserRead, Group, GroupRead, UserGroupRole, UserGroupRoleRead, GroupRole
+
+# Largest page a client may ask for with ?limit=
+LISTING_PAGE_LIMIT = int(os.getenv("LISTING_PAGE_LIMIT", "1000"))
+# Rows fetched per round-trip while streaming
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "1000"))
+
+
+class ListingFormat(str, Enum):
+    JSON = "json"
+    NDJSON = "ndjson"
+
+
+class Listing:
+    """
+    A table listed in keyset order.
+
+    Rows are ordered by key_columns, and a cursor encodes the key of the last row returned.
+    The next page is then a range scan on the primary key index, however deep the client pages.
+    """
+
+    def __init__(
+        self,
+        model,
+        key_columns: Sequence,
+        read_model: type,
+        parse_cursor: Callable[[str], Tuple],
+        format_cursor: Callable[[SQLModel], str],
+    ):
+        self.model = model
+        self.key_columns = list(key_columns)
+        self.read_model = read_model
+        self.parse_cursor = parse_cursor
+        self.format_cursor = format_cursor
+
+    def statement(self, after: Optional[str]):
+        statement = select(self.model).order_by(*self.key_columns)
+        if after is None:
+            return statement
+        try:
+            key = self.parse_cursor(after)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid cursor: {after}"
+            )
+        if len(self.key_columns) == 1:
+            return statement.where(self.key_columns[0] > key[0])
+        # Typed literals, so e.g. enum keys are bound the way the column stores them
+        key_values = [literal(value, type_=column.type) for column, value in zip(self.key_columns, key)]
+        return statement.where(tuple_(*self.key_columns) > tuple_(*key_values))
+
+    def serialize(self, row) -> dict:
+        return self.read_model.model_validate(row, from_attributes=True).model_dump(mode="json")
+
+
+def _parse_user_group_role_cursor(cursor: str) -> Tuple[int, int, GroupRole]:
+    user_id, group_id, role = cursor.split(":")
+    return int(user_id), int(group_id), GroupRole(role)
+
+
+USER_LISTING = Listing(
+    User, [User.id], UserRead,
+    parse_cursor=lambda cursor: (int(cursor),),
+    format_cursor=lambda user: str(user.id),
+)
+GROUP_LISTING = Listing(
+    Group, [Group.id], GroupRead,
+    parse_cursor=lambda cursor: (int(cursor),),
+    format_cursor=lambda group: str(group.id),
+)
+USER_GROUP_ROLE_LISTING = Listing(
+    UserGroupRole, [UserGroupRole.user_id, UserGroupRole.group_id, UserGroupRole.role], UserGroupRoleRead,
+    parse_cursor=_parse_user_group_role_cursor,
+    format_cursor=lambda row: f"{row.user_id}:{row.group_id}:{row.role.value}",
+)
+
+
+def _stream_rows(bind, listing: Listing, after: Optional[str], ndjson: bool) -> Iterator[bytes]:
+    # The request's session may be closed before the body is sent, so the stream owns a session.
+    # yield_per fetches rows in batches from a server-side cursor (on PostgreSQL) instead of
+    # loading the whole result.
+    statement = listing.statement(after).execution_options(yield_per=STREAM_BATCH_SIZE)
+    with Session(bind) as session:
+        if not ndjson:
+            yield b"["
+        first = True
+        for row in session.exec(statement):
+            line = json.dumps(listing.serialize(row)).encode()
+            if ndjson:
+                yield line + b"\n"
+            else:
+                yield line if first else b"," + line
+            first = False
+            # Streamed rows are not needed again; keep the identity map from growing
+            session.expunge(row)
+        if not ndjson:
+            yield b"]"
+
+
+def list_rows(
+    session: Session,
+    listing: Listing,
+    response: Response,
+    limit: Optional[int],
+    after: Optional[str],
+    listing_format: ListingFormat,
+):
+    """
+    Serve a listing as one keyset page, or stream every row after the cursor.
+
+    - With `limit`, returns at most that many rows; the `X-Next-Cursor` header carries the cursor
+      for the next page and is absent on the last page.
+    - Without `limit`, streams the rows as a JSON array, or as NDJSON (one object per line) with
+      `format=ndjson`.
+    """
+    if limit is None:
+        ndjson = listing_format == ListingFormat.NDJSON
+        # Validate the cursor before the response starts streaming
+        listing.statement(after)
+        return StreamingResponse(
+            _stream_rows(session.get_bind(), listing, after, ndjson),
+            media_type="application/x-ndjson" if ndjson else "application/json",
+        )
+
+    rows: List = list(session.exec(listing.statement(after).limit(limit + 1)).all())
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = listing.format_cursor(rows[-1])
+    if listing_format == ListingFormat.NDJSON:
+        body = b"".join(json.dumps(listing.serialize(row)).encode() + b"\n" for row in rows)
+        return Response(body, media_type="application/x-ndjson", headers=headers)
+    response.headers.update(headers)
+    return rows
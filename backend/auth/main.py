@@ -1,16 +1,38 @@
 import os
-import httpx
+from urllib.parse import urlencode
 from jose import jwt
 from dotenv import load_dotenv
-from fastapi import FastAPI, Depends, HTTPException, status, Header
+from fastapi import FastAPI, Depends, HTTPException, status, Header, Response, Query, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from fastapi.responses import RedirectResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse, PlainTextResponse
 from sqlmodel import Session, create_engine, select, SQLModel
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional, Annotated, Dict
 from datetime import datetime, timezone, timedelta
-from google.oauth2 import id_token
-from google.auth.transport import requests
-from passlib.context import CryptContext
+from oauth import GoogleOAuth
+from admission import LoginAdmission, LoginThrottled, TrustedProxies, LOGIN_CLIENT_IP_HEADER, LOGIN_TRUSTED_PROXIES
+from hashing import PasswordHasher, BulkPasswordHasher, HashingOverloaded, hash_password, verify_password
+from bulk_users import (
+    BulkImportError, parse_user_rows, validate_user_rows, find_existing_usernames, insert_users
+)
+from acl import ACLCache
+from directory import DirectoryCache, DIRECTORY_MAX_AGE, parse_lookup_ids
+from listings import (
+    ListingFormat, LISTING_PAGE_LIMIT, list_rows,
+    USER_LISTING, GROUP_LISTING, USER_GROUP_ROLE_LISTING
+)
+from role_assignments import (
+    BULK_ASSIGNMENT_LIMIT, resolve_assignments, insert_group_roles, delete_group_roles, affected_user_ids,
+    bump_acl_versions
+)
+from role_claims import ROLE_CLAIM, encode_realm_roles, realm_roles_from_claims
+from signing import SigningKeys, JWKS_MAX_AGE
+from refresh_tokens import (
+    InvalidRefreshToken,
+    issue_refresh_token, rotate_refresh_token, revoke_refresh_token, revoke_user_refresh_tokens
+)
 
 # Import all models and enums from models.py
 from models import (
@@ -18,7 +40,10 @@ from models import (
     User, UserCreate, UserRead,
     Group, GroupCreate, GroupRead,
     UserGroupRole, GroupRoleAssignment,
-    PasswordUpdate
+    PasswordUpdate,
+    RefreshTokenRequest,
+    BulkUserImportResult,
+    BulkGroupRoleAssignment
 )
 
 # --- Database Setup ---
@@ -26,34 +51,122 @@ load_dotenv()
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 GOOGLE_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI")
+# Google OAuth endpoints, overridable so a local OpenID provider can stand in for tests and load tests
+GOOGLE_AUTH_URL = os.getenv("GOOGLE_AUTH_URL", "https://accounts.google.com/o/oauth2/auth")
+GOOGLE_TOKEN_URL = os.getenv("GOOGLE_TOKEN_URL", "https://oauth2.googleapis.com/token")
+GOOGLE_CERTS_URL = os.getenv("GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v1/certs")
+GOOGLE_ISSUERS = os.getenv("GOOGLE_ISSUERS", "accounts.google.com,https://accounts.google.com").split(",")
 FRONTEND_URL = os.getenv("FRONTEND_URL")
 FRONTEND_REDIRECT_PATH = os.getenv("FRONTEND_REDIRECT_PATH")
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = os.getenv("ALGORITHM")
 DATABASE_URL = os.getenv("DATABASE_URL","sqlite:///./auth_microservice.db")
 engine = create_engine(DATABASE_URL, echo=True)
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    # create_all does not alter tables that already exist; add the columns added since
+    user_columns = {column["name"] for column in inspect(engine).get_columns(User.__tablename__)}
+    if "acl_version" not in user_columns:
+        with engine.begin() as connection:
+            connection.execute(text(f'ALTER TABLE "{User.__tablename__}" ADD COLUMN acl_version INTEGER NOT NULL DEFAULT 0'))
 
 def get_session():
     with Session(engine) as session:
         yield session
 
+# Database access is blocking. Endpoints that only query the database are plain `def`, so FastAPI
+# runs them in its threadpool; `async def` endpoints that also await other work (password hashing,
+# the Google token exchange) hand their queries to the threadpool through run_in_threadpool.
+def get_user_by_username(session: Session, username: str) -> Optional[User]:
+    return session.exec(select(User).where(User.username == username)).first()
+
+# Access tokens are signed with a private key; other services verify them against the public keys
+# served at /.well-known/jwks.json
+signing_keys = SigningKeys.from_env()
+
+def create_access_token(user: User, acl: Dict[str, List[str]], acl_version: int) -> str:
+    # Set token expiration (e.g., 1 hour)
+    expiration = datetime.now(timezone.utc) + timedelta(hours=1)
+    return signing_keys.sign({
+        "uid": user.id,
+        # Packed group roles; a JSON object here grows by ~25 bytes per group in every request header
+        ROLE_CLAIM: encode_realm_roles(acl),
+        "username": user.username,
+        "global_role": user.global_role.value.lower(),
+        "acl_version": acl_version,
+        "exp": int(expiration.timestamp())
+    })
+
+def save(session: Session, instance):
+    session.add(instance)
+    session.commit()
+
+# Realm roles put into issued tokens; every write to UserGroupRole must invalidate the affected users
+acl_cache = ACLCache()
+# Id -> username and id -> group name for the frontend; user and group writes invalidate it
+directory_cache = DirectoryCache()
+
 # --- Password Hashing Setup ---
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Request handlers hash and verify through this bounded worker pool instead of on the event loop
+password_hasher = PasswordHasher()
+# Token buckets in front of the password path of /login, sized from the measured hash cost
+login_admission = LoginAdmission(password_hasher)
+trusted_proxies = TrustedProxies(LOGIN_TRUSTED_PROXIES)
+# Separate process pool for POST /admin/users/bulk
+bulk_password_hasher = BulkPasswordHasher()
+
+def hashing_overloaded() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Password hashing is overloaded, please retry.",
+        headers={"Retry-After": "1"},
+    )
+
+async def hash_password_async(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except HashingOverloaded:
+        raise hashing_overloaded()
+
+def login_throttled(e: LoginThrottled) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many login attempts, please retry later.",
+        headers={"Retry-After": str(e.retry_after)},
+    )
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except HashingOverloaded:
+        raise hashing_overloaded()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+# --- Google OAuth Setup ---
+# Pooled client and cached signing certificates shared by every SSO login
+google_oauth = GoogleOAuth(
+    client_id=GOOGLE_CLIENT_ID,
+    client_secret=GOOGLE_CLIENT_SECRET,
+    redirect_uri=GOOGLE_REDIRECT_URI,
+    token_url=GOOGLE_TOKEN_URL,
+    certs_url=GOOGLE_CERTS_URL,
+    issuers=GOOGLE_ISSUERS,
+)
 
 # --- FastAPI App ---
 app = FastAPI(title="Auth Microservice")
 
+@app.on_event("shutdown")
+def on_shutdown():
+    password_hasher.shutdown()
+    bulk_password_hasher.shutdown()
+
+@app.on_event("shutdown")
+async def close_oauth_client():
+    await google_oauth.aclose()
+
 @app.on_event("startup")
 def on_startup():
+    # Measure the bcrypt cost that sizes the login budget before serving requests
+    password_hasher.hash_cost_seconds()
     create_db_and_tables()
     with Session(engine) as session:
         admin_user = session.exec(select(User).where(User.username == "admin")).first()
@@ -110,7 +223,7 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
 # --- Google OAuth2 Endpoints ---
 @app.get("/oauth/google/login")
 async def login():
-    google_auth_url = f"https://accounts.google.com/o/oauth2/auth?client_id={GOOGLE_CLIENT_ID}&redirect_uri={GOOGLE_REDIRECT_URI}&response_type=code&scope=openid email profile"
+    google_auth_url = f"{GOOGLE_AUTH_URL}?client_id={GOOGLE_CLIENT_ID}&redirect_uri={GOOGLE_REDIRECT_URI}&response_type=code&scope=openid email profile"
     return RedirectResponse(url=google_auth_url)
 
 @app.get("/oauth/google/callback")
@@ -118,34 +231,12 @@ async def auth_google(
     code: str,
     session: Session = Depends(get_session)
 ):
-    token_url = "https://oauth2.googleapis.com/token"
-    data = {
-        "code": code,
-        "client_id": GOOGLE_CLIENT_ID,
-        "client_secret": GOOGLE_CLIENT_SECRET,
-        "redirect_uri": GOOGLE_REDIRECT_URI,
-        "grant_type": "authorization_code",
-    }
-
-    async with httpx.AsyncClient() as client:
-        response = await client.post(token_url, data=data)
-        response.raise_for_status()
-        token_response = response.json()
-        # if response.status_code != 200:
-        #     raise HTTPException(status_code=401, detail="Failed to retrieve tokens from Google")
-        # token_data = response.json()
-
-    id_token_value = token_response.get("id_token")
+    id_token_value = await google_oauth.exchange_code(code)
     if not id_token_value:
         raise HTTPException(status_code=400, detail="No ID token received")
 
     try:
-        payload = id_token.verify_oauth2_token(
-            id_token_value,
-            requests.Request(),
-            GOOGLE_CLIENT_ID
-        )
-        print(payload)
+        payload = await google_oauth.verify_id_token(id_token_value)
 
         sub = payload.get("sub")
         email = payload.get("email")
@@ -155,42 +246,26 @@ async def auth_google(
             raise HTTPException(status_code=401, detail="Invalid token content")
 
         # Check if user exists
-        user = session.exec(select(User).where(User.username == name)).first()
+        user = await run_in_threadpool(get_user_by_username, session, name)
         if not user:
             user_create = UserCreate(
                 username=name,
                 password=None,
                 global_role=GlobalRole.USER
             )
-            user = create_user(user_create, session)
-
-        group_roles = session.exec(
-            select(UserGroupRole).where(UserGroupRole.user_id == user.id)
-        ).all()
-
-        acl = {}
-        for group_role in group_roles:
-            group_id = str(group_role.group_id)
-            role = group_role.role.value.lower()
-            if group_id not in acl:
-                acl[group_id] = []
-            acl[group_id].append(role)
-
-        # Set token expiration (e.g., 1 hour)
-        expiration = datetime.now(timezone.utc) + timedelta(hours=1)
-        our_jwt_token = jwt.encode({
-            "uid": user.id,
-            "realm_roles": acl,
-            "username": user.username,
-            "global_role": user.global_role.value.lower(),
-            "exp": int(expiration.timestamp())
-        }, SECRET_KEY, algorithm=ALGORITHM)
+            user = await run_in_threadpool(create_user, user_create, session)
+
+        acl, acl_version = await run_in_threadpool(acl_cache.get, session, user)
+        our_jwt_token = create_access_token(user, acl, acl_version)
+        refresh_token = await run_in_threadpool(issue_refresh_token, session, user.id)
 
         # return {
         #     "access_token": our_jwt_token,
         #     "token_type": "bearer"
         # }
-        front_end_redirect_url = f"{FRONTEND_URL}{FRONTEND_REDIRECT_PATH}?token={our_jwt_token}"
+        # Tokens go in the fragment, which browsers send to no server (access logs, proxies)
+        # and leave out of Referer headers
+        front_end_redirect_url = f"{FRONTEND_URL}{FRONTEND_REDIRECT_PATH}#{urlencode({'token': our_jwt_token, 'refresh_token': refresh_token})}"
         return RedirectResponse(url=front_end_redirect_url)
 
     except ValueError as e:
@@ -200,51 +275,116 @@ async def auth_google(
 # --- Local Login Endpoint ---
 @app.post("/login")
 async def login(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
     session: Session = Depends(get_session)
 ):
-    user = session.exec(
-        select(User).where(User.username == form_data.username)
-    ).first()
-    
-    if not user or not user.password or not verify_password(form_data.password, user.password):
+    client_ip = request.client.host if request.client else None
+    # Only the reverse proxy may name another client address
+    if LOGIN_CLIENT_IP_HEADER and trusted_proxies and await run_in_threadpool(trusted_proxies.is_trusted, client_ip):
+        client_ip = request.headers.get(LOGIN_CLIENT_IP_HEADER) or client_ip
+    try:
+        # Shed excess attempts before the user lookup and the bcrypt verify
+        login_admission.admit_client(form_data.username, client_ip)
+    except LoginThrottled as e:
+        raise login_throttled(e)
+    user = await run_in_threadpool(get_user_by_username, session, form_data.username)
+
+    if user and user.password:
+        try:
+            login_admission.admit_hash()
+        except LoginThrottled as e:
+            raise login_throttled(e)
+
+    if not user or not user.password or not await verify_password_async(form_data.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    group_roles = session.exec(select(UserGroupRole).where(UserGroupRole.user_id == user.id)).all()
-
-    acl = {}
-    for group_role in group_roles:
-        group_id = str(group_role.group_id)
-        role = group_role.role.value.lower()
-        if group_id not in acl:
-            acl[group_id] = []
-        acl[group_id].append(role)
-
-    # Set token expiration (e.g., 1 hour)
-    expiration = datetime.now(timezone.utc) + timedelta(hours=1)
-    our_jwt_token = jwt.encode({
-        "uid": user.id,
-        "realm_roles": acl,
-        "username": user.username,
-        "global_role": user.global_role.value.lower(),
-        "exp": int(expiration.timestamp())
-    }, SECRET_KEY, algorithm=ALGORITHM)
+    acl, acl_version = await run_in_threadpool(acl_cache.get, session, user)
+    our_jwt_token = create_access_token(user, acl, acl_version)
+    refresh_token = await run_in_threadpool(issue_refresh_token, session, user.id)
 
     return {
         "access_token": our_jwt_token,
-        "token_type": "bearer"
+        "token_type": "bearer",
+        "refresh_token": refresh_token
     }
     # front_end_redirect_url = f"{FRONTEND_URL}{FRONTEND_REDIRECT_PATH}?token={our_jwt_token}"
     # return RedirectResponse(url=front_end_redirect_url)
 
+# --- Refresh Token Endpoints ---
+@app.post("/token/refresh")
+def refresh_access_token(
+    refresh_request: RefreshTokenRequest,
+    session: Session = Depends(get_session)
+):
+    """
+    Exchange a refresh token for a new access token and a new refresh token.
+
+    No password is checked; the realm roles come from the ACL cache, so role changes made since
+    the last login are included. The presented refresh token is revoked (rotation).
+
+    Args:
+        refresh_request: RefreshTokenRequest with the refresh token from /login or the OAuth callback.
+        session: Database session.
+
+    Returns:
+        dict: access_token, token_type and the rotated refresh_token.
+
+    Raises:
+        HTTPException: If the refresh token is unknown, expired, revoked or reused.
+    """
+    try:
+        user_id, refresh_token = rotate_refresh_token(session, refresh_request.refresh_token)
+    except InvalidRefreshToken as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e),
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = session.get(User, user_id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User no longer exists",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    acl, acl_version = acl_cache.get(session, user)
+
+    return {
+        "access_token": create_access_token(user, acl, acl_version),
+        "token_type": "bearer",
+        "refresh_token": refresh_token
+    }
+
+@app.post("/token/revoke", response_model=dict)
+def revoke_token(
+    refresh_request: RefreshTokenRequest,
+    session: Session = Depends(get_session)
+):
+    """
+    Revoke a refresh token and every token rotated from the same login (logout).
+    """
+    revoke_refresh_token(session, refresh_request.refresh_token)
+    return {"message": "Refresh token revoked"}
+
 def create_user(
     user_create: UserCreate,
-    session: Session
+    session: Session,
+    password_hash: Optional[str] = None
 ) -> User:
+    """
+    Create a user and add it to the default group.
+
+    Args:
+        user_create: UserCreate model with username, optional password, and optional global_role.
+        session: Database session.
+        password_hash: Hash of user_create.password if the caller already computed it
+            (request handlers do so off the event loop); otherwise it is hashed here.
+    """
 
     existing_user = session.exec(select(User).where(User.username == user_create.username)).first()
     if existing_user:
@@ -254,8 +394,8 @@ def create_user(
         )
     
     # Create new user
-    hashed_password = None
-    if user_create.password:
+    hashed_password = password_hash
+    if user_create.password and not hashed_password:
         hashed_password = hash_password(user_create.password)
     # print(user_create.password,verify_password(user_create.password, hashed_password))
     user = User(
@@ -266,6 +406,7 @@ def create_user(
     session.add(user)
     session.commit()
     session.refresh(user)
+    directory_cache.invalidate("user", [user.id])
 
     default_group = session.exec(select(Group).where(Group.group_name == "default")).first()
     if default_group:
@@ -276,6 +417,7 @@ def create_user(
         )
         session.add(user_group_role)
         session.commit()
+        acl_cache.invalidate([user.id])
     return user
 
 @app.post("/admin/users/", response_model=UserRead, status_code=status.HTTP_201_CREATED)
@@ -297,24 +439,161 @@ async def user_create(
     Raises:
         HTTPException: If the username already exists.
     """
-    user = create_user(user_create, session)
+    password_hash = await hash_password_async(user_create.password) if user_create.password else None
+    user = await run_in_threadpool(create_user, user_create, session, password_hash)
     return UserRead.from_orm(user)
 
+@app.post("/admin/users/bulk", response_model=BulkUserImportResult)
+async def bulk_user_create(
+    request: Request,
+    session: Session = Depends(get_session)
+):
+    """
+    Create many users from a CSV or NDJSON upload (admin only).
+
+    The body is either `text/csv` with a header row (username, password, global_role) or
+    `application/x-ndjson` with one UserCreate object per line. Rows without a password are
+    created for Google login only.
+
+    Args:
+        request: The upload; its Content-Type selects the format.
+        session: Database session.
+
+    Returns:
+        BulkUserImportResult: Counts and one result per row, in upload order, with status
+            created, exists (username taken), duplicate (repeated in the upload) or invalid.
+
+    Raises:
+        HTTPException: If the body cannot be parsed or has too many rows (400), or a concurrent
+            request created one of the usernames first (409).
+    """
+    # 1. Parse and validate the upload
+    try:
+        rows = parse_user_rows(await request.body(), request.headers.get("content-type", ""))
+    except BulkImportError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    results = validate_user_rows(rows)
+
+    # 2. Skip usernames that already exist, found with batched IN queries
+    pending = [result for result in results if result.status == "pending"]
+    existing = await run_in_threadpool(find_existing_usernames, session, [result.username for result in pending])
+    for result in pending:
+        if result.username in existing:
+            result.status = "exists"
+            result.detail = f"User with UID {result.username} already exists."
+            result.user_create = None
+    pending = [result for result in pending if result.status == "pending"]
+
+    # 3. Hash the passwords across the bulk process pool
+    with_password = [result for result in pending if result.user_create.password]
+    password_hashes = await bulk_password_hasher.hash_many([result.user_create.password for result in with_password])
+    hashes_by_row = {result.row: password_hash for result, password_hash in zip(with_password, password_hashes)}
+
+    # 4. Insert users and default group memberships with multi-row inserts
+    try:
+        created_ids = await run_in_threadpool(insert_users, session, results, hashes_by_row)
+    except IntegrityError:
+        await run_in_threadpool(session.rollback)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Some usernames were created concurrently; nothing was imported, retry the upload."
+        )
+    acl_cache.invalidate(created_ids)
+    directory_cache.invalidate("user", created_ids)
+
+    return BulkUserImportResult(
+        created=len(created_ids),
+        skipped=len(results) - len(created_ids),
+        results=results
+    )
+
 @app.get("/admin/users/{user_id}/username", response_model=dict)
-async def get_username_by_id(
+def get_username_by_id(
     user_id: int,
     session: Session = Depends(get_session)
 ):
-    user = session.exec(select(User).where(User.id == user_id)).first()
-    if not user:
+    username = directory_cache.lookup(session, "user", [user_id]).get(user_id)
+    if username is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"User with ID {user_id} not found."
+        )
+    return {"username": username}
+
+def lookup_directory(kind: str, ids: str, response: Response, session: Session) -> Dict[str, str]:
+    try:
+        parsed_ids = parse_lookup_ids(ids)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid ids: {e}"
+        )
+    names = directory_cache.lookup(session, kind, parsed_ids)
+    response.headers["Cache-Control"] = f"private, max-age={DIRECTORY_MAX_AGE}"
+    return {str(entity_id): names[entity_id] for entity_id in parsed_ids if entity_id in names}
+
+@app.get("/admin/users/lookup", response_model=Dict[str, str])
+def lookup_usernames(
+    ids: str,
+    response: Response,
+    session: Session = Depends(get_session)
+):
+    """
+    Resolve many user ids to usernames in one request.
+
+    Args:
+        ids: Comma-separated user ids, e.g. "1,2,3" (at most DIRECTORY_LOOKUP_LIMIT).
+        session: Database session.
+
+    Returns:
+        dict: Map of user id (as a string) to username. Unknown ids are omitted.
+
+    Raises:
+        HTTPException: If an id is not an integer or too many ids are given.
+    """
+    return lookup_directory("user", ids, response, session)
+
+@app.get("/admin/groups/lookup", response_model=Dict[str, str])
+def lookup_group_names(
+    ids: str,
+    response: Response,
+    session: Session = Depends(get_session)
+):
+    """
+    Resolve many group ids to group names in one request.
+
+    Args:
+        ids: Comma-separated group ids, e.g. "1,2,3" (at most DIRECTORY_LOOKUP_LIMIT).
+        session: Database session.
+
+    Returns:
+        dict: Map of group id (as a string) to group name. Unknown ids are omitted.
+
+    Raises:
+        HTTPException: If an id is not an integer or too many ids are given.
+    """
+    return lookup_directory("group", ids, response, session)
+
+@app.get("/admin/users/{user_id}/acl-version", response_model=dict)
+def get_acl_version(
+    user_id: int,
+    session: Session = Depends(get_session)
+):
+    """
+    Return the current version stamp of a user's realm roles.
+
+    A token whose `acl_version` claim differs from this value carries outdated realm roles.
+    """
+    acl_version = acl_cache.version(session, user_id)
+    if acl_version is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"User with ID {user_id} not found."
         )
-    return {"username": user.username}
+    return {"user_id": user_id, "acl_version": acl_version}
 
 @app.post("/admin/groups/", response_model=GroupRead, status_code=status.HTTP_201_CREATED)
-async def create_group(
+def create_group(
     group_create: GroupCreate,
     # admin_user_id: Annotated[int, Depends(verify_admin_role)],
     session: Session = Depends(get_session)
@@ -345,6 +624,7 @@ async def create_group(
     session.add(group)
     session.commit()
     session.refresh(group)
+    directory_cache.invalidate("group", [group.id])
 
     admin_user = session.exec(select(User).where(User.username == "admin")).first()
     if admin_user:
@@ -354,11 +634,13 @@ async def create_group(
             role=GroupRole.ADMIN
         )
         session.add(user_group_role)
+        bump_acl_versions(session, [admin_user.id])
         session.commit()
+        acl_cache.invalidate([admin_user.id])
     return group
 
 @app.delete("/admin/groups/delete/{group_name}", status_code=status.HTTP_200_OK, response_model=dict)
-async def delete_group(
+def delete_group(
     group_name: str,
     # admin_user_id: Annotated[int, Depends(verify_admin_role)],
     session: Session = Depends(get_session)
@@ -380,17 +662,23 @@ async def delete_group(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Group with ID {group_name} not found."
         )
+    member_ids = session.exec(
+        select(UserGroupRole.user_id).where(UserGroupRole.group_id == group.id)
+    ).all()
     session.exec(
         UserGroupRole.__table__.delete().where(
             UserGroupRole.group_id == group.id
         )
     )
     session.delete(group)
+    bump_acl_versions(session, member_ids)
     session.commit()
+    acl_cache.invalidate(member_ids)
+    directory_cache.invalidate("group", [group.id])
     return {"message": f"Group {group_name} deleted successfully"}
 
 @app.post("/admin/groups/assign-roles", status_code=status.HTTP_201_CREATED, response_model=dict)
-async def assign_group_roles(
+def assign_group_roles(
     assignment: GroupRoleAssignment,
     # admin_user_id: Annotated[int, Depends(verify_admin_role)],
     session: Session = Depends(get_session)
@@ -431,20 +719,13 @@ async def assign_group_roles(
             detail=f"Invalid roles: {invalid_roles}. Valid roles are {valid_roles}."
         )
     
-    # Create new role assignments
-    for role in assignment.roles:
-        user_group_role = UserGroupRole(
-            user_id=user.id,
-            group_id=group.id,
-            role=role
-        )
-        session.add(user_group_role)
-    
-    session.commit()
+    # Create new role assignments; roles the user already has are left as they are
+    insert_group_roles(session, [(user.id, group.id, role) for role in assignment.roles])
+    acl_cache.invalidate([user.id])
     return {"message": f"Roles {assignment.roles} assigned to user {assignment.username} in group {assignment.group_name}"}
 
 @app.delete("/admin/groups/remove-roles", status_code=status.HTTP_200_OK, response_model=dict)
-async def remove_group_roles(
+def remove_group_roles(
     assignment: GroupRoleAssignment,
     # admin_user_id: Annotated[int, Depends(verify_admin_role)],
     session: Session = Depends(get_session)
@@ -494,19 +775,98 @@ async def remove_group_roles(
                 UserGroupRole.role == role
             )
         )
-    
+    bump_acl_versions(session, [user.id])
     session.commit()
+    acl_cache.invalidate([user.id])
     return {"message": f"Roles {assignment.roles} removed for user {assignment.username} in group {assignment.group_name}"}
 
+def check_bulk_assignment_size(bulk: BulkGroupRoleAssignment):
+    if len(bulk.assignments) > BULK_ASSIGNMENT_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {BULK_ASSIGNMENT_LIMIT} assignments can be sent at once."
+        )
+
+@app.post("/admin/groups/assign-roles:bulk", status_code=status.HTTP_200_OK, response_model=dict)
+def bulk_assign_group_roles(
+    bulk: BulkGroupRoleAssignment,
+    session: Session = Depends(get_session)
+):
+    """
+    Assign roles for many (username, group_name, roles) entries at once (admin only).
+
+    Idempotent: roles a user already has in a group are skipped, so the same request can be
+    repeated safely. Nothing is written if any username or group name is unknown.
+
+    Args:
+        bulk: BulkGroupRoleAssignment with a list of GroupRoleAssignment entries.
+        session: Database session.
+
+    Returns:
+        dict: How many role rows were requested, newly assigned, and already present.
+
+    Raises:
+        HTTPException: If any user or group is not found, or too many entries are sent.
+    """
+    check_bulk_assignment_size(bulk)
+    rows = resolve_assignments(session, bulk.assignments)
+    assigned = insert_group_roles(session, rows)
+    acl_cache.invalidate(affected_user_ids(rows))
+    return {"requested": len(rows), "assigned": assigned, "already_present": len(rows) - assigned}
+
+@app.delete("/admin/groups/remove-roles:bulk", status_code=status.HTTP_200_OK, response_model=dict)
+def bulk_remove_group_roles(
+    bulk: BulkGroupRoleAssignment,
+    session: Session = Depends(get_session)
+):
+    """
+    Remove roles for many (username, group_name, roles) entries at once (admin only).
+
+    Idempotent: roles that are not assigned are ignored. Nothing is removed if any username or
+    group name is unknown.
+
+    Args:
+        bulk: BulkGroupRoleAssignment with a list of GroupRoleAssignment entries.
+        session: Database session.
+
+    Returns:
+        dict: How many role rows were requested, removed, and already absent.
+
+    Raises:
+        HTTPException: If any user or group is not found, or too many entries are sent.
+    """
+    check_bulk_assignment_size(bulk)
+    rows = resolve_assignments(session, bulk.assignments)
+    removed = delete_group_roles(session, rows)
+    acl_cache.invalidate(affected_user_ids(rows))
+    return {"requested": len(rows), "removed": removed, "already_absent": len(rows) - removed}
+
 @app.get("/admin/users/", response_model=List[UserRead])
-async def get_all_users(
+def get_all_users(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=LISTING_PAGE_LIMIT),
+    after: Optional[str] = None,
+    format: ListingFormat = ListingFormat.JSON,
     session: Session = Depends(get_session)
 ):
-    users = session.exec(select(User)).all()
-    return [UserRead.from_orm(user) for user in users]
+    """
+    List users in id order.
+
+    Args:
+        limit: Page size; the X-Next-Cursor response header holds the `after` value for the next page.
+            Without it every user is streamed.
+        after: Cursor from X-Next-Cursor; only users after it are listed.
+        format: `json` (array) or `ndjson` (one user per line).
+        session: Database session.
+    """
+    return list_rows(session, USER_LISTING, response, limit, after, format)
 
 @app.get("/admin/groups/all/", response_model=List[GroupRead])
-async def get_all_groups(
+def get_all_groups(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=LISTING_PAGE_LIMIT),
+    after: Optional[str] = None,
+    format: ListingFormat = ListingFormat.JSON,
     session: Session = Depends(get_session)
 ):
     """
@@ -514,16 +874,23 @@ async def get_all_groups(
     
     Args:
         admin_user_info: User info from JWT, verified to have admin role.
+        limit: Page size; the X-Next-Cursor response header holds the `after` value for the next page.
+            Without it every group is streamed.
+        after: Cursor from X-Next-Cursor; only groups after it are listed.
+        format: `json` (array) or `ndjson` (one group per line).
         session: Database session.
     
     Returns:
-        List[GroupRead]: List of all groups in the database.
+        List[GroupRead]: Groups in id order.
     """
-    groups = session.exec(select(Group)).all()
-    return [GroupRead.from_orm(group) for group in groups]
+    return list_rows(session, GROUP_LISTING, response, limit, after, format)
 
 @app.get("/admin/user-group-roles/", response_model=List[UserGroupRole])
-async def get_all_user_group_roles(
+def get_all_user_group_roles(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=LISTING_PAGE_LIMIT),
+    after: Optional[str] = None,
+    format: ListingFormat = ListingFormat.JSON,
     session: Session = Depends(get_session)
 ):
     """
@@ -531,13 +898,16 @@ async def get_all_user_group_roles(
     
     Args:
         admin_user_info: User info from JWT, verified to have admin role.
+        limit: Page size; the X-Next-Cursor response header holds the `after` value
+            ("user_id:group_id:role") for the next page. Without it every assignment is streamed.
+        after: Cursor from X-Next-Cursor; only assignments after it are listed.
+        format: `json` (array) or `ndjson` (one assignment per line).
         session: Database session.
     
     Returns:
-        List[UserGroupRole]: List of all user-group-role assignments in the database.
+        List[UserGroupRole]: Assignments ordered by user, group and role.
     """
-    user_group_roles = session.exec(select(UserGroupRole)).all()
-    return user_group_roles
+    return list_rows(session, USER_GROUP_ROLE_LISTING, response, limit, after, format)
 
 @app.post("/admin/password", status_code=status.HTTP_200_OK, response_model=dict)
 async def update_password(
@@ -555,7 +925,7 @@ async def update_password(
     Raises:
         HTTPException: If the user is not found.
     """
-    user = session.exec(select(User).where(User.username == password_update.username)).first()
+    user = await run_in_threadpool(get_user_by_username, session, password_update.username)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -563,29 +933,28 @@ async def update_password(
         )
     
     # Hash the new password
-    user.password = hash_password(password_update.new_password)
-    session.add(user)
-    session.commit()
+    user.password = await hash_password_async(password_update.new_password)
+    await run_in_threadpool(save, session, user)
+    # Sessions started with the old password must log in again
+    await run_in_threadpool(revoke_user_refresh_tokens, session, user.id)
     return {"message": f"Password updated successfully for user {password_update.username}"}
 
 @app.get("/admin/groups/names", response_model=dict)
-async def get_group_names(
+def get_group_names(
     token: str = Depends(oauth2_scheme),
     session: Session = Depends(get_session)
 ):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        realm_roles = payload.get("realm_roles", {})
+        payload = signing_keys.verify(token)
+        realm_roles = realm_roles_from_claims(payload)
         
         if not realm_roles:
             return {}
         
         group_ids = [int(gid) for gid in realm_roles.keys()]
-        groups = session.exec(
-            select(Group).where(Group.id.in_(group_ids))
-        ).all()
+        group_names = directory_cache.lookup(session, "group", group_ids)
         
-        group_name_map = {str(group.id): group.group_name for group in groups}
+        group_name_map = {str(group_id): group_name for group_id, group_name in group_names.items()}
         return group_name_map
 
     except jwt.ExpiredSignatureError:
@@ -600,7 +969,7 @@ async def get_group_names(
         )
 
 @app.get("/admin/groups/{group_id}/reviewers", response_model=dict)
-async def get_group_reviewers(
+def get_group_reviewers(
     group_id: int,
     session: Session = Depends(get_session)
 ):
@@ -623,13 +992,31 @@ async def get_group_reviewers(
     
     return {str(user_id): username for user_id, username in reviewers}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Expose service metrics in the Prometheus text format.
+    """
+    metrics = {**password_hasher.metrics(), **login_admission.metrics()}
+    return "".join(f"{name} {value}\n" for name, value in metrics.items())
+
+@app.get("/.well-known/jwks.json")
+def get_jwks(response: Response) -> dict:
+    """
+    Publish the public keys that verify access tokens, matched to tokens by their `kid` header.
+
+    During a key rotation the retired key stays listed until the tokens it signed have expired.
+    """
+    response.headers["Cache-Control"] = f"public, max-age={JWKS_MAX_AGE}"
+    return signing_keys.jwks()
+
 @app.get("/me")
 async def get_current_user(
     token: str,
 ) -> dict:
     try:
         # Decode JWT with validation
-        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        payload = signing_keys.verify(token)
         user_id: str = payload.get("uid")
         username: str = payload.get("username")
         global_role: str = payload.get("global_role")
@@ -639,7 +1026,11 @@ async def get_current_user(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid token payload: missing user_id, username, or global_role"
             )
-        
+
+        # Callers get the roles as a group id -> role names object, as in tokens issued before
+        # the compact claim
+        payload["realm_roles"] = realm_roles_from_claims(payload)
+        payload.pop(ROLE_CLAIM, None)
         return payload
 
     except jwt.ExpiredSignatureError:
@@ -26,6 +26,8 @@ class User(UserBase, table=True):
         default_factory=lambda: datetime.now(timezone.utc),
         sa_column_kwargs={"onupdate": datetime.now(timezone.utc)}
     )
+    # Bumped whenever the user's group roles change; access tokens carry it as `acl_version`
+    acl_version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
     groups: List["UserGroupRole"] = Relationship(back_populates="user")
 
 class UserCreate(SQLModel):
@@ -71,7 +73,46 @@ class UserGroupRole(SQLModel, table=True):
     user: User = Relationship(back_populates="groups")
     group: Group = Relationship(back_populates="users")
 
+class UserGroupRoleRead(SQLModel):
+    user_id: int
+    group_id: int
+    role: GroupRole
+
 class GroupRoleAssignment(SQLModel):
     username: str
     group_name: str
-    roles: List[GroupRole]
\ No newline at end of file
+    roles: List[GroupRole]
+
+class BulkGroupRoleAssignment(SQLModel):
+    assignments: List[GroupRoleAssignment]
+
+class RefreshToken(SQLModel, table=True):
+    """
+    Long-lived opaque refresh token, stored as a SHA-256 digest.
+
+    Every refresh rotates the token: the presented one is revoked and a new one with the same
+    family_id is issued. Presenting a revoked token again revokes the whole family.
+    """
+    id: Optional[int] = Field(default=None, primary_key=True)
+    token_hash: str = Field(index=True, sa_column_kwargs={"unique": True})
+    family_id: str = Field(index=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    expires_at: datetime
+    revoked_at: Optional[datetime] = None
+
+class RefreshTokenRequest(SQLModel):
+    refresh_token: str
+
+class BulkUserResult(SQLModel):
+    row: int
+    username: str
+    status: str  # created, exists, duplicate or invalid
+    id: Optional[int] = None
+    detail: Optional[str] = None
+    user_create: Optional[UserCreate] = Field(default=None, exclude=True)
+
+class BulkUserImportResult(SQLModel):
+    created: int
+    skipped: int
+    results: List[BulkUserResult]
@@ -0,0 +1,155 @@
+import asyncio
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+from google.auth import jwt as google_jwt
+from jose import jwt
+
+# Timeout for calls to the OAuth provider (token exchange, certificate fetch)
+OAUTH_TIMEOUT_SECONDS = float(os.getenv("OAUTH_TIMEOUT_SECONDS", "10"))
+# Connections kept open to the provider between logins
+OAUTH_MAX_CONNECTIONS = int(os.getenv("OAUTH_MAX_CONNECTIONS", "20"))
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+def cache_max_age(cache_control: Optional[str]) -> int:
+    """
+    Seconds a response may be cached according to its Cache-Control header, 0 if not cacheable.
+    """
+    if not cache_control or "no-store" in cache_control or "no-cache" in cache_control:
+        return 0
+    match = _MAX_AGE.search(cache_control)
+    return int(match.group(1)) if match else 0
+
+
+class ProviderCertificates:
+    """
+    The provider's ID token signing certificates ({key id: PEM}), cached for as long as its
+    Cache-Control max-age allows. Concurrent logins on an expired cache share one fetch.
+    """
+
+    def __init__(self, oauth: "GoogleOAuth", url: str):
+        self.oauth = oauth
+        self.url = url
+        self._certs: Dict[str, str] = {}
+        self._expires_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.fetches = 0
+
+    async def get(self, refresh: bool = False) -> Dict[str, str]:
+        if not refresh and time.monotonic() < self._expires_at:
+            return self._certs
+        fetches = self.fetches
+        loop = asyncio.get_running_loop()
+        if self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        async with self._lock:
+            # Another login refreshed the certificates while this one waited
+            if self.fetches != fetches or (not refresh and time.monotonic() < self._expires_at):
+                return self._certs
+            response = await self.oauth.client().get(self.url)
+            response.raise_for_status()
+            self._certs = response.json()
+            self._expires_at = time.monotonic() + cache_max_age(response.headers.get("Cache-Control"))
+            self.fetches += 1
+            return self._certs
+
+    def clear(self):
+        self._certs = {}
+        self._expires_at = 0.0
+
+
+class GoogleOAuth:
+    """
+    Google OAuth 2.0 / OpenID Connect client for the login callback.
+
+    One pooled HTTP client serves every login, and ID tokens are verified against cached
+    certificates in the threadpool, so a login normally costs a single upstream call: the
+    authorization code exchange.
+    """
+
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str,
+        redirect_uri: str,
+        token_url: str,
+        certs_url: str,
+        issuers: List[str],
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.redirect_uri = redirect_uri
+        self.token_url = token_url
+        self.issuers = issuers
+        self.transport = transport
+        self.certificates = ProviderCertificates(self, certs_url)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        # Pooled connections belong to the event loop that opened them
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                transport=self.transport,
+                timeout=OAUTH_TIMEOUT_SECONDS,
+                limits=httpx.Limits(max_connections=OAUTH_MAX_CONNECTIONS),
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            if self._client_loop is asyncio.get_running_loop():
+                await self._client.aclose()
+            self._client = None
+            self._client_loop = None
+
+    async def exchange_code(self, code: str) -> Optional[str]:
+        """
+        Exchange an authorization code for the provider's ID token.
+
+        Raises:
+            httpx.HTTPStatusError: If the provider rejects the code.
+        """
+        response = await self.client().post(self.token_url, data={
+            "code": code,
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "redirect_uri": self.redirect_uri,
+            "grant_type": "authorization_code",
+        })
+        response.raise_for_status()
+        return response.json().get("id_token")
+
+    async def verify_id_token(self, id_token: str) -> dict:
+        """
+        Verify the ID token's signature, expiry, audience and issuer, and return its claims.
+
+        A key id missing from the cached certificates means the provider rotated its keys, so
+        the certificates are refetched once before the token is rejected.
+
+        Raises:
+            ValueError: If the token is invalid.
+        """
+        try:
+            kid = jwt.get_unverified_header(id_token).get("kid")
+        except Exception as e:
+            raise ValueError(f"Malformed ID token: {e}")
+        certs = await self.certificates.get()
+        if kid and kid not in certs:
+            certs = await self.certificates.get(refresh=True)
+        # Signature verification is CPU work; keep it off the event loop
+        payload = await run_in_threadpool(google_jwt.decode, id_token, certs=certs, audience=self.client_id)
+        if payload.get("iss") not in self.issuers:
+            raise ValueError(f"Wrong issuer {payload.get('iss')}")
+        return payload
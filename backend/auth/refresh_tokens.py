@@ -0,0 +1,116 @@
+import hashlib
+import os
+import secrets
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from models import RefreshToken
+
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+
+
+class InvalidRefreshToken(Exception):
+    """Raised when a refresh token is unknown, expired, revoked or reused."""
+
+
+def digest_refresh_token(token: str) -> str:
+    # Tokens carry 256 random bits, so a fast digest is enough; a slow password hash would
+    # give back the CPU that refreshing is meant to save
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite returns naive datetimes
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def issue_refresh_token(session: Session, user_id: int, family_id: Optional[str] = None) -> str:
+    """
+    Create and store a new refresh token for the user, starting a new family unless one is given.
+
+    Returns:
+        str: The opaque token. Only its digest is stored.
+    """
+    token = secrets.token_urlsafe(32)
+    now = datetime.now(timezone.utc)
+    session.add(RefreshToken(
+        token_hash=digest_refresh_token(token),
+        family_id=family_id or uuid.uuid4().hex,
+        user_id=user_id,
+        created_at=now,
+        expires_at=now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    session.commit()
+    return token
+
+
+def rotate_refresh_token(session: Session, token: str) -> Tuple[int, str]:
+    """
+    Revoke the presented refresh token and issue its successor in the same family.
+
+    Returns:
+        Tuple[int, str]: The user id and the new refresh token.
+
+    Raises:
+        InvalidRefreshToken: If the token is unknown or expired, or was already used. Reuse
+            revokes the whole family, since either the client or an attacker holds a stolen token.
+    """
+    stored = session.exec(
+        select(RefreshToken).where(RefreshToken.token_hash == digest_refresh_token(token))
+    ).first()
+    if not stored:
+        raise InvalidRefreshToken("Unknown refresh token")
+
+    now = datetime.now(timezone.utc)
+    if _as_utc(stored.expires_at) <= now:
+        raise InvalidRefreshToken("Refresh token has expired")
+
+    # Conditional update, so of two concurrent refreshes with the same token only one wins
+    result = session.exec(
+        update(RefreshToken)
+        .where(RefreshToken.id == stored.id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=now)
+    )
+    if result.rowcount != 1:
+        session.rollback()
+        revoke_refresh_token_family(session, stored.family_id)
+        raise InvalidRefreshToken("Refresh token has already been used")
+
+    return stored.user_id, issue_refresh_token(session, stored.user_id, stored.family_id)
+
+
+def revoke_refresh_token_family(session: Session, family_id: str) -> int:
+    result = session.exec(
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.now(timezone.utc))
+    )
+    session.commit()
+    return result.rowcount
+
+
+def revoke_refresh_token(session: Session, token: str) -> bool:
+    """
+    Revoke the family of the given refresh token (logout). Returns False for unknown tokens.
+    """
+    stored = session.exec(
+        select(RefreshToken).where(RefreshToken.token_hash == digest_refresh_token(token))
+    ).first()
+    if not stored:
+        return False
+    revoke_refresh_token_family(session, stored.family_id)
+    return True
+
+
+def revoke_user_refresh_tokens(session: Session, user_id: int) -> int:
+    result = session.exec(
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.now(timezone.utc))
+    )
+    session.commit()
+    return result.rowcount
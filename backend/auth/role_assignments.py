@@ -0,0 +1,136 @@
+import os
+from typing import Dict, Iterable, List, Set, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, insert, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+
+from models import User, Group, UserGroupRole, GroupRoleAssignment
+
+# Most (username, group, roles) entries accepted by one bulk request
+BULK_ASSIGNMENT_LIMIT = int(os.getenv("BULK_ASSIGNMENT_LIMIT", "10000"))
+# Rows per multi-row statement, below the SQLite and PostgreSQL bound parameter limits
+ASSIGNMENT_CHUNK_SIZE = 1000
+
+RoleRow = Tuple[int, int, object]  # (user_id, group_id, GroupRole)
+
+
+def _chunks(items: list, size: int = ASSIGNMENT_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def resolve_assignments(session: Session, assignments: List[GroupRoleAssignment]) -> List[RoleRow]:
+    """
+    Turn (username, group_name, roles) entries into distinct (user_id, group_id, role) rows.
+
+    Usernames and group names are resolved with one IN query each.
+
+    Raises:
+        HTTPException: 404 listing every unknown username and group name.
+    """
+    usernames = sorted({assignment.username for assignment in assignments})
+    group_names = sorted({assignment.group_name for assignment in assignments})
+    user_ids: Dict[str, int] = {}
+    group_ids: Dict[str, int] = {}
+    for chunk in _chunks(usernames):
+        user_ids.update({username: user_id for user_id, username in session.exec(
+            select(User.id, User.username).where(User.username.in_(chunk))
+        ).all()})
+    for chunk in _chunks(group_names):
+        group_ids.update({group_name: group_id for group_id, group_name in session.exec(
+            select(Group.id, Group.group_name).where(Group.group_name.in_(chunk))
+        ).all()})
+
+    missing_users = [username for username in usernames if username not in user_ids]
+    missing_groups = [group_name for group_name in group_names if group_name not in group_ids]
+    if missing_users or missing_groups:
+        problems = []
+        if missing_users:
+            problems.append(f"users not found: {missing_users}")
+        if missing_groups:
+            problems.append(f"groups not found: {missing_groups}")
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="; ".join(problems)
+        )
+
+    rows = {}
+    for assignment in assignments:
+        for role in assignment.roles:
+            row = (user_ids[assignment.username], group_ids[assignment.group_name], role)
+            rows[row] = None
+    return list(rows)
+
+
+def _insert_ignoring_duplicates(session: Session):
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql_insert(UserGroupRole).on_conflict_do_nothing()
+    if dialect == "sqlite":
+        return sqlite_insert(UserGroupRole).on_conflict_do_nothing()
+    return None
+
+
+def insert_group_roles(session: Session, rows: List[RoleRow]) -> int:
+    """
+    Insert the role rows, skipping those that already exist. Returns how many were inserted.
+
+    Uses INSERT ... ON CONFLICT DO NOTHING, so a repeated or concurrent assignment cannot fail
+    on the composite primary key.
+    """
+    statement = _insert_ignoring_duplicates(session)
+    inserted = 0
+    for chunk in _chunks(rows):
+        if statement is None:
+            # No upsert syntax on this database; skip the rows that already exist instead
+            existing = set(session.exec(
+                select(UserGroupRole.user_id, UserGroupRole.group_id, UserGroupRole.role)
+                .where(tuple_(UserGroupRole.user_id, UserGroupRole.group_id, UserGroupRole.role).in_(chunk))
+            ).all())
+            chunk = [row for row in chunk if row not in existing]
+            if not chunk:
+                continue
+        result = session.exec(
+            (statement if statement is not None else insert(UserGroupRole)).values([
+                {"user_id": user_id, "group_id": group_id, "role": role} for user_id, group_id, role in chunk
+            ])
+        )
+        inserted += result.rowcount
+    if inserted:
+        bump_acl_versions(session, affected_user_ids(rows))
+    session.commit()
+    return inserted
+
+
+def delete_group_roles(session: Session, rows: List[RoleRow]) -> int:
+    """
+    Delete the given role rows with set-based deletes. Returns how many existed and were removed.
+    """
+    removed = 0
+    for chunk in _chunks(rows):
+        result = session.exec(
+            delete(UserGroupRole).where(
+                tuple_(UserGroupRole.user_id, UserGroupRole.group_id, UserGroupRole.role).in_(chunk)
+            )
+        )
+        removed += result.rowcount
+    if removed:
+        bump_acl_versions(session, affected_user_ids(rows))
+    session.commit()
+    return removed
+
+
+def affected_user_ids(rows: List[RoleRow]) -> Set[int]:
+    return {user_id for user_id, _, _ in rows}
+
+
+def bump_acl_versions(session: Session, user_ids: Iterable[int]):
+    """
+    Mark the realm roles of these users as changed. Runs in the caller's transaction, so the new
+    version is committed together with the role change.
+    """
+    for chunk in _chunks(sorted(set(user_ids))):
+        session.exec(update(User).where(User.id.in_(chunk)).values(acl_version=User.acl_version + 1))
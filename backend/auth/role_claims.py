@@ -0,0 +1,89 @@
+import base64
+from typing import Dict, List
+
+from models import GroupRole
+
+RealmRoles = Dict[str, List[str]]
+
+# Compact realm roles claim, replacing the `realm_roles` JSON object in access tokens.
+#
+# Version 1 is "1." followed by the unpadded base64url encoding of one varint per group, in
+# ascending group id order. Each varint holds (group id - previous group id) << 3 | role mask,
+# the previous id starting at 0. A group with nearby ids and any set of roles takes one byte
+# instead of ~25 bytes of JSON. flow/role_claims.py decodes the same format.
+ROLE_CLAIM = "rr"
+ROLE_CLAIM_VERSION = "1"
+ROLE_BITS = {GroupRole.USER.value: 1, GroupRole.REVIEWER.value: 2, GroupRole.ADMIN.value: 4}
+ROLE_MASK_BITS = 3
+# Role names for every mask value, in ROLE_BITS order
+ROLE_NAMES_BY_MASK = [
+    tuple(role for role, bit in ROLE_BITS.items() if mask & bit) for mask in range(1 << ROLE_MASK_BITS)
+]
+
+
+def encode_realm_roles(realm_roles: RealmRoles) -> str:
+    """
+    Pack group id -> role names into the compact claim.
+
+    Raises:
+        ValueError: If a group id is not a non-negative integer or a role is unknown.
+    """
+    data = bytearray()
+    previous_id = 0
+    for group_id in sorted(int(group_id) for group_id in realm_roles):
+        if group_id < 0:
+            raise ValueError(f"Invalid group id {group_id}")
+        mask = 0
+        for role in realm_roles[str(group_id)]:
+            bit = ROLE_BITS.get(role.lower())
+            if bit is None:
+                raise ValueError(f"Unknown role {role}")
+            mask |= bit
+        if not mask:
+            # No roles means no access to the group, so it is left out
+            continue
+        value = (group_id - previous_id) << ROLE_MASK_BITS | mask
+        while value >= 0x80:
+            data.append(value & 0x7F | 0x80)
+            value >>= 7
+        data.append(value)
+        previous_id = group_id
+    return f"{ROLE_CLAIM_VERSION}.{base64.urlsafe_b64encode(bytes(data)).rstrip(b'=').decode()}"
+
+
+def decode_realm_roles(claim: str) -> RealmRoles:
+    """
+    Unpack the compact claim into group id (as a string) -> role names.
+
+    Raises:
+        ValueError: If the claim is malformed or of an unknown version.
+    """
+    version, _, encoded = claim.partition(".")
+    if version != ROLE_CLAIM_VERSION:
+        raise ValueError(f"Unsupported role claim version {version}")
+    data = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+    realm_roles = {}
+    group_id = value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        mask = value & ((1 << ROLE_MASK_BITS) - 1)
+        if not mask:
+            raise ValueError("Group without roles in role claim")
+        group_id += value >> ROLE_MASK_BITS
+        realm_roles[str(group_id)] = list(ROLE_NAMES_BY_MASK[mask])
+        value = shift = 0
+    if shift:
+        raise ValueError("Truncated role claim")
+    return realm_roles
+
+
+def realm_roles_from_claims(payload: dict) -> RealmRoles:
+    """
+    Realm roles of a decoded token, from the compact claim or the legacy `realm_roles` object.
+    """
+    if ROLE_CLAIM in payload:
+        return decode_realm_roles(payload[ROLE_CLAIM])
+    return payload.get("realm_roles", {})
@@ -0,0 +1,111 @@
+import base64
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+from jose.exceptions import JWTError
+
+JWT_ALGORITHM = "RS256"
+# PEM file with the RSA private key that signs new tokens (the compose files mount it as the
+# jwt_private_key secret)
+JWT_PRIVATE_KEY_FILE = os.getenv("JWT_PRIVATE_KEY_FILE")
+# Without a key file, startup fails unless this is true (tests, benchmarks): an ephemeral key is
+# generated instead, which changes on every restart or reload and so invalidates every token issued
+JWT_ALLOW_EPHEMERAL_KEY = os.getenv("JWT_ALLOW_EPHEMERAL_KEY", "false").lower() == "true"
+# Comma-separated PEM files (public or private) of retired keys that are still published in the
+# JWKS during a rotation, so tokens they signed stay valid until they expire
+JWT_PUBLISHED_KEY_FILES = [path for path in os.getenv("JWT_PUBLISHED_KEY_FILES", "").split(",") if path.strip()]
+# How long clients may cache /.well-known/jwks.json
+JWKS_MAX_AGE = int(os.getenv("JWKS_MAX_AGE", "300"))
+
+
+def _b64url_uint(value: int) -> str:
+    data = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _public_jwk(public_key: rsa.RSAPublicKey) -> dict:
+    numbers = public_key.public_numbers()
+    jwk = {"e": _b64url_uint(numbers.e), "kty": "RSA", "n": _b64url_uint(numbers.n)}
+    # RFC 7638 thumbprint as key id, so the same key always gets the same kid
+    thumbprint = hashlib.sha256(json.dumps(jwk, separators=(",", ":"), sort_keys=True).encode()).digest()
+    kid = base64.urlsafe_b64encode(thumbprint).rstrip(b"=").decode()
+    return {**jwk, "kid": kid, "alg": JWT_ALGORITHM, "use": "sig"}
+
+
+def _load_public_key(pem: bytes) -> rsa.RSAPublicKey:
+    if b"PRIVATE KEY" in pem:
+        return serialization.load_pem_private_key(pem, password=None).public_key()
+    return serialization.load_pem_public_key(pem)
+
+
+class SigningKeys:
+    """
+    The private key that signs access tokens plus every public key published in the JWKS.
+    """
+
+    def __init__(self, private_key: rsa.RSAPrivateKey, retired_public_keys: Optional[List[rsa.RSAPublicKey]] = None):
+        self.private_pem = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ).decode()
+        self.public_key = private_key.public_key()
+        active = _public_jwk(self.public_key)
+        self.kid = active["kid"]
+        self.jwks_keys: List[dict] = [active]
+        for public_key in retired_public_keys or []:
+            jwk = _public_jwk(public_key)
+            if jwk["kid"] != self.kid:
+                self.jwks_keys.append(jwk)
+        self._verification_keys: Dict[str, dict] = {jwk["kid"]: jwk for jwk in self.jwks_keys}
+
+    @classmethod
+    def from_env(cls) -> "SigningKeys":
+        """
+        Raises:
+            RuntimeError: If JWT_PRIVATE_KEY_FILE is not set and ephemeral keys are not allowed.
+        """
+        if JWT_PRIVATE_KEY_FILE:
+            with open(JWT_PRIVATE_KEY_FILE, "rb") as f:
+                private_key = serialization.load_pem_private_key(f.read(), password=None)
+        elif JWT_ALLOW_EPHEMERAL_KEY:
+            print(
+                "WARNING: JWT_PRIVATE_KEY_FILE is not set, signing tokens with an ephemeral key. "
+                "Every restart or reload invalidates all issued tokens."
+            )
+            private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        else:
+            raise RuntimeError(
+                "JWT_PRIVATE_KEY_FILE is not set. Point it at an RSA private key in PEM format, "
+                "or set JWT_ALLOW_EPHEMERAL_KEY=true to sign with a throwaway key."
+            )
+        retired = []
+        for path in JWT_PUBLISHED_KEY_FILES:
+            with open(path.strip(), "rb") as f:
+                retired.append(_load_public_key(f.read()))
+        return cls(private_key, retired)
+
+    def sign(self, claims: dict) -> str:
+        return jwt.encode(claims, self.private_pem, algorithm=JWT_ALGORITHM, headers={"kid": self.kid})
+
+    def verify(self, token: str) -> dict:
+        """
+        Decode a token signed by any published key.
+
+        Raises:
+            JWTError: If the key id is unknown or the signature or claims are invalid
+                (ExpiredSignatureError for expired tokens).
+        """
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = self._verification_keys.get(kid)
+        if key is None:
+            raise JWTError(f"Unknown signing key {kid}")
+        return jwt.decode(token, key, algorithms=[JWT_ALGORITHM])
+
+    def jwks(self) -> dict:
+        return {"keys": self.jwks_keys}
@@ -5,9 +5,13 @@ from dotenv import load_dotenv
 from sqlmodel import Session, create_engine, select, SQLModel
 from jose import jwt
 from datetime import datetime, timezone, timedelta
+from urllib.parse import parse_qs, urlsplit
 
-from main import app, get_session, create_user, hash_password
+# Tokens are signed with a throwaway key
+os.environ.setdefault("JWT_ALLOW_EPHEMERAL_KEY", "true")
+from main import app, get_session, create_user, hash_password, acl_cache, directory_cache, login_admission
 from models import User, UserCreate, Group, GroupCreate, UserGroupRole, GlobalRole, GroupRole
+from role_claims import decode_realm_roles, encode_realm_roles
 
 # --- Test Database Setup ---
 TEST_DATABASE_URL = "sqlite:///./test_auth_microservice.db"
@@ -29,6 +33,10 @@ def client_fixture(session: Session):
     with TestClient(app) as client:
         yield client
     app.dependency_overrides.clear()
+    # Each test starts from an empty database, so cached realm roles must not carry over
+    acl_cache.clear()
+    directory_cache.clear()
+    login_admission.clear()
 
 # --- Constants ---
 TEST_ADMIN_USERNAME = "admin"
@@ -351,4 +359,556 @@ def test_get_current_user_invalid_token(client: TestClient):
     """Test the /me endpoint with an invalid JWT."""
     response = client.get("/me", params={"token": "invalid_token"})
     assert response.status_code == 500
-    assert "Unexpected error during token processing" in response.json()["detail"]
\ No newline at end of file
+    assert "Unexpected error during token processing" in response.json()["detail"]
+
+def test_login_does_not_block_event_loop(session: Session):
+    """Test that concurrent password logins leave the event loop free to serve other requests."""
+    import asyncio
+    import time
+    import httpx
+    import main
+
+    session.add(User(username=TEST_USER_USERNAME, password=hash_password("testpassword"), global_role=GlobalRole.USER))
+    session.commit()
+    token = main.signing_keys.sign({"uid": 1, "username": TEST_USER_USERNAME, "global_role": "user"})
+
+    def override_get_session():
+        yield session
+    app.dependency_overrides[get_session] = override_get_session
+
+    async def timed(coro):
+        await coro
+        return time.perf_counter()
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            logins = [
+                client.post("/login", data={"username": TEST_USER_USERNAME, "password": "testpassword"})
+                for _ in range(8)
+            ]
+            login_tasks = [asyncio.ensure_future(timed(login)) for login in logins]
+            await asyncio.sleep(0)
+            me_response = await client.get("/me", params={"token": token})
+            me_done = time.perf_counter()
+            login_done = await asyncio.gather(*login_tasks)
+            return me_response, me_done, login_done
+
+    try:
+        me_response, me_done, login_done = asyncio.run(run())
+    finally:
+        app.dependency_overrides.clear()
+    assert me_response.status_code == 200
+    assert me_done < max(login_done)
+
+def test_password_hasher_rejects_when_saturated():
+    """Test that the hashing pool sheds load once its workers and queue are full."""
+    import asyncio
+    from hashing import PasswordHasher, HashingOverloaded
+
+    hasher = PasswordHasher(max_workers=1, max_queue=0)
+
+    async def run():
+        first = asyncio.ensure_future(hasher.hash("password"))
+        await asyncio.sleep(0)
+        with pytest.raises(HashingOverloaded):
+            await hasher.hash("password")
+        return await first
+
+    try:
+        hashed = asyncio.run(run())
+    finally:
+        hasher.shutdown()
+    assert hashed.startswith("$2")
+    metrics = hasher.metrics()
+    assert metrics["auth_password_hash_rejected_total"] == 1
+    assert metrics["auth_password_hash_completed_total"] == 1
+
+def test_login_returns_503_when_hashing_overloaded(client: TestClient, session: Session, monkeypatch):
+    """Test that an overloaded hashing pool surfaces as 503 with Retry-After."""
+    import main
+    from hashing import HashingOverloaded
+
+    async def overloaded(*args):
+        raise HashingOverloaded()
+    session.add(User(username=TEST_USER_USERNAME, password=hash_password("testpassword"), global_role=GlobalRole.USER))
+    session.commit()
+    monkeypatch.setattr(main.password_hasher, "verify", overloaded)
+
+    response = client.post("/login", data={"username": TEST_USER_USERNAME, "password": "testpassword"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+def test_metrics(client: TestClient):
+    """Test that /metrics exposes the password hashing pool metrics."""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "auth_password_hash_workers " in response.text
+    assert "auth_password_hash_queue_depth " in response.text
+
+def test_database_requests_do_not_serialize(session: Session):
+    """Test that concurrent requests overlap their database round-trips instead of queuing on the event loop."""
+    import asyncio
+    import time
+    import httpx
+    from sqlalchemy import event
+
+    user = User(username=TEST_USER_USERNAME, password=None, global_role=GlobalRole.USER)
+    session.add(user)
+    session.commit()
+    session.refresh(user)
+
+    query_delay = 0.1
+    requests = 20
+
+    def slow_query(*args):
+        time.sleep(query_delay)
+
+    def override_get_session():
+        with Session(test_engine) as request_session:
+            yield request_session
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(
+                client.get(f"/admin/users/{user.id}/username") for _ in range(requests)
+            ))
+
+    app.dependency_overrides[get_session] = override_get_session
+    event.listen(test_engine, "before_cursor_execute", slow_query)
+    try:
+        start = time.perf_counter()
+        responses = asyncio.run(run())
+        elapsed = time.perf_counter() - start
+    finally:
+        event.remove(test_engine, "before_cursor_execute", slow_query)
+        app.dependency_overrides.clear()
+    assert all(response.status_code == 200 for response in responses)
+    assert all(response.json() == {"username": TEST_USER_USERNAME} for response in responses)
+    # Serialized requests would take requests * query_delay = 2s
+    assert elapsed < requests * query_delay / 2
+
+def test_login_realm_roles_cached_and_invalidated(client: TestClient, session: Session, monkeypatch):
+    """Test that repeat logins reuse cached realm roles and role changes invalidate them."""
+    import main
+
+    user = User(username=TEST_USER_USERNAME, password=hash_password("testpassword"), global_role=GlobalRole.USER)
+    group = Group(group_name=TEST_GROUP_NAME)
+    session.add(user)
+    session.add(group)
+    session.commit()
+    session.refresh(group)
+
+    def login():
+        response = client.post("/login", data={"username": TEST_USER_USERNAME, "password": "testpassword"})
+        assert response.status_code == 200
+        return main.signing_keys.verify(response.json()["access_token"])
+
+    first = login()
+    misses = acl_cache.misses
+    second = login()
+    assert acl_cache.misses == misses
+    assert decode_realm_roles(first["rr"]) == decode_realm_roles(second["rr"]) == {}
+    assert first["acl_version"] == second["acl_version"]
+    version = client.get(f"/admin/users/{user.id}/acl-version").json()["acl_version"]
+    assert version == first["acl_version"]
+
+    response = client.post("/admin/groups/assign-roles", json={
+        "username": TEST_USER_USERNAME, "group_name": TEST_GROUP_NAME, "roles": ["user", "reviewer"]
+    })
+    assert response.status_code == 201
+    third = login()
+    assert {group_id: sorted(roles) for group_id, roles in decode_realm_roles(third["rr"]).items()} == {str(group.id): ["reviewer", "user"]}
+    assert third["acl_version"] != first["acl_version"]
+    assert client.get(f"/admin/users/{user.id}/acl-version").json()["acl_version"] == third["acl_version"]
+
+    # The version lives in the database: a cold cache (restart, another worker) agrees on it,
+    # and assigning roles the user already has does not change it
+    acl_cache.clear()
+    assert login()["acl_version"] == third["acl_version"]
+    response = client.post("/admin/groups/assign-roles", json={
+        "username": TEST_USER_USERNAME, "group_name": TEST_GROUP_NAME, "roles": ["user"]
+    })
+    assert response.status_code == 201
+    assert login()["acl_version"] == third["acl_version"]
+    assert client.get("/admin/users/999999/acl-version").status_code == 404
+
+    response = client.delete(f"/admin/groups/delete/{TEST_GROUP_NAME}")
+    assert response.status_code == 200
+    assert decode_realm_roles(login()["rr"]) == {}
+
+def test_lookup_usernames_and_group_names(client: TestClient, session: Session):
+    """Test batch id -> name lookups, their caching and invalidation."""
+    users = [User(username=f"user{i}", global_role=GlobalRole.USER) for i in range(3)]
+    group = Group(group_name=TEST_GROUP_NAME)
+    session.add_all([*users, group])
+    session.commit()
+    ids = ",".join(str(user.id) for user in users)
+
+    response = client.get("/admin/users/lookup", params={"ids": f"{ids},9999"})
+    assert response.status_code == 200
+    assert response.json() == {str(user.id): user.username for user in users}
+    assert "max-age=" in response.headers["Cache-Control"]
+
+    hits = directory_cache.hits
+    response = client.get("/admin/users/lookup", params={"ids": ids})
+    assert response.status_code == 200
+    assert directory_cache.hits == hits + 3
+
+    response = client.get("/admin/groups/lookup", params={"ids": str(group.id)})
+    assert response.json() == {str(group.id): TEST_GROUP_NAME}
+    group_id = group.id
+    client.delete(f"/admin/groups/delete/{TEST_GROUP_NAME}")
+    response = client.get("/admin/groups/lookup", params={"ids": str(group_id)})
+    assert response.json() == {}
+
+    response = client.get("/admin/users/lookup", params={"ids": "1,abc"})
+    assert response.status_code == 400
+
+def test_refresh_token_rotation_and_reuse(client: TestClient, session: Session, monkeypatch):
+    """Test that refresh tokens rotate, carry fresh roles, and that reuse revokes the family."""
+    import main
+    from models import RefreshToken
+
+    user = User(username=TEST_USER_USERNAME, password=hash_password("testpassword"), global_role=GlobalRole.USER)
+    session.add(user)
+    session.add(Group(group_name=TEST_GROUP_NAME))
+    session.commit()
+
+    response = client.post("/login", data={"username": TEST_USER_USERNAME, "password": "testpassword"})
+    assert response.status_code == 200
+    first_refresh = response.json()["refresh_token"]
+    stored = session.exec(select(RefreshToken)).one()
+    assert stored.token_hash != first_refresh
+
+    client.post("/admin/groups/assign-roles", json={
+        "username": TEST_USER_USERNAME, "group_name": TEST_GROUP_NAME, "roles": ["reviewer"]
+    })
+    response = client.post("/token/refresh", json={"refresh_token": first_refresh})
+    assert response.status_code == 200
+    data = response.json()
+    payload = main.signing_keys.verify(data["access_token"])
+    assert "reviewer" in sum(decode_realm_roles(payload["rr"]).values(), [])
+    second_refresh = data["refresh_token"]
+    assert second_refresh != first_refresh
+
+    # Reusing the rotated-out token revokes its successor too
+    response = client.post("/token/refresh", json={"refresh_token": first_refresh})
+    assert response.status_code == 401
+    response = client.post("/token/refresh", json={"refresh_token": second_refresh})
+    assert response.status_code == 401
+
+def test_refresh_token_revoke_and_password_change(client: TestClient, session: Session, monkeypatch):
+    """Test that logout and password changes revoke refresh tokens."""
+    import main
+
+    session.add(User(username=TEST_USER_USERNAME, password=hash_password("testpassword"), global_role=GlobalRole.USER))
+    session.commit()
+
+    def login():
+        return client.post("/login", data={"username": TEST_USER_USERNAME, "password": "testpassword"}).json()["refresh_token"]
+
+    refresh_token = login()
+    assert client.post("/token/revoke", json={"refresh_token": refresh_token}).status_code == 200
+    assert client.post("/token/refresh", json={"refresh_token": refresh_token}).status_code == 401
+
+    refresh_token = login()
+    client.post("/admin/password", json={"username": TEST_USER_USERNAME, "new_password": "testpassword"})
+    assert client.post("/token/refresh", json={"refresh_token": refresh_token}).status_code == 401
+    assert client.post("/token/refresh", json={"refresh_token": "unknown"}).status_code == 401
+
+def test_admin_listings_keyset_pagination_and_ndjson(client: TestClient, session: Session):
+    """Test keyset pages and NDJSON streaming of the admin listings."""
+    import json
+
+    users = [User(username=f"user{i}", global_role=GlobalRole.USER) for i in range(5)]
+    groups = [Group(group_name=f"group{i}") for i in range(2)]
+    session.add_all([*users, *groups])
+    session.commit()
+    for user in users:
+        for group in groups:
+            session.add(UserGroupRole(user_id=user.id, group_id=group.id, role=GroupRole.USER))
+            session.add(UserGroupRole(user_id=user.id, group_id=group.id, role=GroupRole.REVIEWER))
+    session.commit()
+
+    for path, expected in (("/admin/users/", 5), ("/admin/groups/all/", 2), ("/admin/user-group-roles/", 20)):
+        seen = []
+        params = {"limit": 3}
+        while True:
+            response = client.get(path, params=params)
+            assert response.status_code == 200
+            seen.extend(response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+            params = {"limit": 3, "after": cursor}
+        assert len(seen) == expected
+        assert len({json.dumps(row, sort_keys=True) for row in seen}) == expected
+
+        streamed = client.get(path)
+        assert streamed.json() == seen
+        ndjson = client.get(path, params={"format": "ndjson"})
+        assert ndjson.headers["content-type"].startswith("application/x-ndjson")
+        assert [json.loads(line) for line in ndjson.text.splitlines()] == seen
+
+    response = client.get("/admin/users/", params={"format": "ndjson", "after": str(users[2].id)})
+    assert [json.loads(line)["username"] for line in response.text.splitlines()] == ["user3", "user4"]
+    assert client.get("/admin/user-group-roles/", params={"after": "bad"}).status_code == 400
+
+def test_bulk_user_import_csv_and_ndjson(client: TestClient, session: Session):
+    """Test bulk user creation from CSV and NDJSON with per-row results."""
+    session.add(Group(group_name="default"))
+    session.add(User(username="existing", global_role=GlobalRole.USER))
+    session.commit()
+
+    csv_body = (
+        "username,password,global_role\n"
+        "alice,alicepassword,user\n"
+        "bob,,admin\n"
+        "existing,pw,user\n"
+        "alice,again,user\n"
+        "carol,pw,superuser\n"
+    )
+    response = client.post("/admin/users/bulk", content=csv_body, headers={"Content-Type": "text/csv"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["created"] == 2 and data["skipped"] == 3
+    assert [r["status"] for r in data["results"]] == ["created", "created", "exists", "duplicate", "invalid"]
+
+    from main import verify_password
+    alice = session.exec(select(User).where(User.username == "alice")).one()
+    bob = session.exec(select(User).where(User.username == "bob")).one()
+    assert verify_password("alicepassword", alice.password)
+    assert bob.password is None and bob.global_role == GlobalRole.ADMIN
+    memberships = session.exec(select(UserGroupRole).where(UserGroupRole.user_id.in_([alice.id, bob.id]))).all()
+    assert len(memberships) == 2
+
+    ndjson_body = '{"username": "dave"}\n{"username": "erin", "global_role": "user"}\n'
+    response = client.post("/admin/users/bulk", content=ndjson_body, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.json()["created"] == 2
+
+    response = client.post("/admin/users/bulk", content="{}", headers={"Content-Type": "application/json"})
+    assert response.status_code == 400
+
+def test_bulk_assign_and_remove_group_roles(client: TestClient, session: Session):
+    """Test idempotent bulk role assignment and set-based bulk removal."""
+    users = [User(username=f"user{i}", global_role=GlobalRole.USER) for i in range(3)]
+    groups = [Group(group_name=f"group{i}") for i in range(2)]
+    session.add_all([*users, *groups])
+    session.commit()
+
+    assignments = [
+        {"username": user.username, "group_name": group.group_name, "roles": ["user", "reviewer"]}
+        for user in users for group in groups
+    ]
+    response = client.post("/admin/groups/assign-roles:bulk", json={"assignments": assignments})
+    assert response.status_code == 200
+    assert response.json() == {"requested": 12, "assigned": 12, "already_present": 0}
+
+    # Repeating the request, or a single assignment of an existing role, is not an error
+    response = client.post("/admin/groups/assign-roles:bulk", json={"assignments": assignments})
+    assert response.json() == {"requested": 12, "assigned": 0, "already_present": 12}
+    response = client.post("/admin/groups/assign-roles", json=assignments[0])
+    assert response.status_code == 201
+
+    removals = [{"username": "user0", "group_name": "group0", "roles": ["reviewer", "admin"]}]
+    response = client.request("DELETE", "/admin/groups/remove-roles:bulk", json={"assignments": removals})
+    assert response.json() == {"requested": 2, "removed": 1, "already_absent": 1}
+    remaining = session.exec(select(UserGroupRole).where(UserGroupRole.user_id == users[0].id)).all()
+    assert sorted((row.group_id, row.role.value) for row in remaining) == [
+        (groups[0].id, "user"), (groups[1].id, "reviewer"), (groups[1].id, "user")
+    ]
+
+    response = client.post("/admin/groups/assign-roles:bulk", json={"assignments": [
+        {"username": "nobody", "group_name": "group0", "roles": ["user"]},
+        {"username": "user0", "group_name": "nogroup", "roles": ["user"]},
+    ]})
+    assert response.status_code == 404
+    assert "nobody" in response.json()["detail"] and "nogroup" in response.json()["detail"]
+
+def test_jwks_publishes_signing_and_retired_keys(client: TestClient, session: Session):
+    """Test that issued tokens verify against the JWKS, including a retired key during rotation."""
+    import main
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from jose.exceptions import JWTError
+    from signing import SigningKeys
+
+    session.add(User(username=TEST_USER_USERNAME, password=hash_password("testpassword"), global_role=GlobalRole.USER))
+    session.commit()
+    access_token = client.post("/login", data={"username": TEST_USER_USERNAME, "password": "testpassword"}).json()["access_token"]
+
+    response = client.get("/.well-known/jwks.json")
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"].startswith("public, max-age=")
+    keys = {key["kid"]: key for key in response.json()["keys"]}
+    kid = jwt.get_unverified_header(access_token)["kid"]
+    payload = jwt.decode(access_token, keys[kid], algorithms=["RS256"])
+    assert payload["username"] == TEST_USER_USERNAME
+    assert all("d" not in key for key in keys.values())
+
+    # After a rotation the old key still verifies the tokens it signed
+    old_keys = SigningKeys(rsa.generate_private_key(public_exponent=65537, key_size=2048))
+    old_token = old_keys.sign({"uid": 1, "username": TEST_USER_USERNAME, "global_role": "user"})
+    rotated = SigningKeys(rsa.generate_private_key(public_exponent=65537, key_size=2048), [old_keys.public_key])
+    assert rotated.kid != old_keys.kid
+    assert [key["kid"] for key in rotated.jwks()["keys"]] == [rotated.kid, old_keys.kid]
+    assert rotated.verify(old_token)["uid"] == 1
+    with pytest.raises(JWTError):
+        main.signing_keys.verify(old_token)
+
+def test_role_claim_round_trip():
+    """Test that the compact role claim round-trips and stays small for users in many groups."""
+    import json
+
+    realm_roles = {str(group_id): ["user", "reviewer"] for group_id in range(1, 301)}
+    realm_roles["100000"] = ["admin"]
+    realm_roles["7"] = ["admin", "user", "reviewer"]
+    claim = encode_realm_roles(realm_roles)
+    assert claim.startswith("1.")
+    assert decode_realm_roles(claim) == {
+        group_id: sorted(roles, key=["user", "reviewer", "admin"].index) for group_id, roles in realm_roles.items()
+    }
+    assert len(claim) * 10 < len(json.dumps(realm_roles))
+    assert decode_realm_roles(encode_realm_roles({})) == {}
+    assert decode_realm_roles(encode_realm_roles({"3": []})) == {}
+
+    for invalid in ("2.AA", "1.gA", "1.AA"):
+        with pytest.raises(ValueError):
+            decode_realm_roles(invalid)
+    with pytest.raises(ValueError):
+        encode_realm_roles({"1": ["owner"]})
+
+class FakeOpenIDProvider:
+    """Local stand-in for Google's token and certificate endpoints, served through httpx.MockTransport."""
+
+    def __init__(self, client_id: str, issuer: str = "https://accounts.google.com"):
+        self.client_id = client_id
+        self.issuer = issuer
+        self.calls = []
+        self.rotate_key()
+
+    def rotate_key(self):
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from cryptography.x509.oid import NameOID
+
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.kid = f"key-{len(self.calls)}-{id(self.private_key)}"
+        subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "fake-openid")])
+        now = datetime.now(timezone.utc)
+        certificate = (
+            x509.CertificateBuilder().subject_name(subject).issuer_name(subject)
+            .public_key(self.private_key.public_key()).serial_number(x509.random_serial_number())
+            .not_valid_before(now - timedelta(days=1)).not_valid_after(now + timedelta(days=1))
+            .sign(self.private_key, hashes.SHA256())
+        )
+        self.certs = {self.kid: certificate.public_bytes(serialization.Encoding.PEM).decode()}
+
+    def handler(self, request):
+        import httpx
+        from urllib.parse import parse_qs
+
+        self.calls.append(request.url.path)
+        if request.url.path == "/certs":
+            return httpx.Response(200, json=self.certs, headers={"Cache-Control": "public, max-age=3600"})
+        name = parse_qs(request.content.decode())["code"][0]
+        now = int(datetime.now(timezone.utc).timestamp())
+        id_token = jwt.encode({
+            "iss": self.issuer, "aud": self.client_id, "sub": f"google-{name}", "email": f"{name}@example.com",
+            "name": name, "iat": now, "exp": now + 3600,
+        }, self.private_key, algorithm="RS256", headers={"kid": self.kid})
+        return httpx.Response(200, json={"access_token": "unused", "id_token": id_token})
+
+def test_google_login_caches_certificates(client: TestClient, session: Session, monkeypatch):
+    """Test that SSO logins verify ID tokens against cached provider certificates."""
+    import httpx
+    import main
+    from oauth import GoogleOAuth
+
+    provider = FakeOpenIDProvider(client_id="test-client")
+    oauth = GoogleOAuth(
+        client_id="test-client", client_secret="secret", redirect_uri="http://testserver/callback",
+        token_url="https://provider.test/token", certs_url="https://provider.test/certs",
+        issuers=["https://accounts.google.com"], transport=httpx.MockTransport(provider.handler),
+    )
+    monkeypatch.setattr(main, "google_oauth", oauth)
+    monkeypatch.setattr(main, "FRONTEND_URL", "http://frontend.test")
+    monkeypatch.setattr(main, "FRONTEND_REDIRECT_PATH", "/login")
+
+    def sso_login(name):
+        return client.get("/oauth/google/callback", params={"code": name}, follow_redirects=False)
+
+    for name in ("alice", "bob", "alice"):
+        response = sso_login(name)
+        assert response.status_code == 307
+        # Tokens are handed over in the fragment, never in the query string servers log
+        location = urlsplit(response.headers["location"])
+        assert location.query == ""
+        tokens = parse_qs(location.fragment)
+        assert client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"][0]}).status_code == 200
+    # Certificates are fetched once; every later login makes only the code exchange
+    assert provider.calls == ["/token", "/certs", "/token", "/token"]
+    assert session.exec(select(User).where(User.username == "bob")).first() is not None
+
+    # A rotated provider key is picked up with a single refetch
+    provider.rotate_key()
+    provider.calls.clear()
+    assert sso_login("carol").status_code == 307
+    assert provider.calls == ["/token", "/certs"]
+
+    # Tokens for another client or issuer are rejected
+    provider.client_id = "other-client"
+    assert sso_login("mallory").status_code == 401
+    provider.client_id, provider.issuer = "test-client", "https://evil.test"
+    assert sso_login("mallory").status_code == 401
+
+def test_login_admission_control(client: TestClient, session: Session, monkeypatch):
+    """Test that password logins are shed with 429 per username, per IP and by the CPU budget."""
+    import main
+    from admission import LoginAdmission, KeyedBuckets, TrustedProxies
+
+    session.add(User(username=TEST_USER_USERNAME, password=hash_password("testpassword"), global_role=GlobalRole.USER))
+    session.commit()
+    admission = LoginAdmission(main.password_hasher)
+    admission.usernames = KeyedBuckets(2, 1, 100)
+    admission.ips = KeyedBuckets(4, 1, 100)
+    monkeypatch.setattr(main, "login_admission", admission)
+    # The test client connects as "testclient", standing in for the reverse proxy
+    monkeypatch.setattr(main, "trusted_proxies", TrustedProxies(["testclient"]))
+
+    def login(username, ip="10.0.0.1", password="wrong"):
+        return client.post("/login", data={"username": username, "password": password}, headers={"X-Real-IP": ip})
+
+    assert [login(TEST_USER_USERNAME).status_code for _ in range(2)] == [401, 401]
+    response = login(TEST_USER_USERNAME)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    # Other usernames are still served until the client's IP bucket runs out
+    assert [login(f"unknown{i}").status_code for i in range(3)] == [401, 401, 429]
+    assert login("unknown9", ip="10.0.0.2").status_code == 401
+
+    # Clients that are not a trusted proxy cannot pick their own IP bucket
+    monkeypatch.setattr(main, "trusted_proxies", TrustedProxies([]))
+    assert [login(f"unknown{i}", ip=f"10.0.1.{i}").status_code for i in range(10, 15)] == [401] * 4 + [429]
+    assert TrustedProxies(["10.1.0.0/16"]).is_trusted("10.1.2.3")
+    assert not TrustedProxies(["10.1.0.0/16"]).is_trusted("10.2.0.1")
+    assert TrustedProxies(["localhost"]).is_trusted("127.0.0.1")
+
+    # The CPU budget only admits as many verifications as the hashing workers can sustain
+    admission = LoginAdmission(main.password_hasher, cpu_share=0.001, cpu_burst_seconds=1)
+    monkeypatch.setattr(main, "login_admission", admission)
+    assert login(TEST_USER_USERNAME, password="testpassword").status_code == 200
+    # Unknown users cost no bcrypt work, so they are not charged to the budget
+    assert login("unknown").status_code == 401
+    response = login(TEST_USER_USERNAME, password="testpassword")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 60
+
+    metrics = client.get("/metrics").text
+    assert 'auth_login_rejected_total{reason="cpu"} 1' in metrics
+    assert "auth_login_hash_admitted_total 1" in metrics
+    assert "auth_password_hash_cost_seconds" in metrics
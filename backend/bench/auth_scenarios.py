@@ -0,0 +1,129 @@
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from common import BENCH_PASSWORD
+from scenario import Scenario
+
+SAMPLE_SIZE = 1_000
+# Full-table listings are measured with a handful of requests only
+HEAVY_LISTING_REQUESTS = 5
+
+
+def build_context(engine, rng: random.Random) -> dict:
+    """Samples existing users and groups to spread requests over the dataset."""
+    from models import User, Group
+
+    with Session(engine) as session:
+        max_user_id = session.exec(select(func.max(User.id))).one() or 0
+        user_ids = [rng.randint(1, max_user_id) for _ in range(SAMPLE_SIZE)] if max_user_id else []
+        users = session.exec(
+            select(User.id, User.username).where(User.id.in_(user_ids), User.password.is_not(None))
+        ).all()
+        groups = session.exec(select(Group.id, Group.group_name).limit(SAMPLE_SIZE)).all()
+    # Only synthetic users share the benchmark password
+    users = [tuple(row) for row in users if row[1].startswith("user")]
+    if not users:
+        raise SystemExit("The auth database has no synthetic users, run datagen.py auth first")
+    return {"users": users, "groups": [tuple(row) for row in groups], "rng": rng}
+
+
+def build_scenarios(ctx: dict) -> List[Scenario]:
+    from main import signing_keys
+    from role_claims import ROLE_CLAIM, encode_realm_roles
+
+    rng: random.Random = ctx["rng"]
+    users = ctx["users"]
+    groups = ctx["groups"]
+
+    def make_token(user_id: int, username: str) -> str:
+        expiration = datetime.now(timezone.utc) + timedelta(hours=1)
+        realm_roles = {str(group_id): ["user"] for group_id, _ in rng.sample(groups, min(3, len(groups)))}
+        return signing_keys.sign({
+            "uid": user_id,
+            ROLE_CLAIM: encode_realm_roles(realm_roles),
+            "username": username,
+            "global_role": "user",
+            "exp": int(expiration.timestamp()),
+        })
+
+    tokens = [make_token(user_id, username) for user_id, username in users[:100]]
+
+    def unique_name(prefix: str) -> str:
+        return f"{prefix}-{uuid.uuid4().hex[:12]}"
+
+    def create_group(client, _):
+        group_name = unique_name("bench-group")
+        client.post("/admin/groups/", json={"group_name": group_name})
+        return group_name
+
+    def create_group_with_role(client, _):
+        group_name = create_group(client, _)
+        username = rng.choice(users)[1]
+        client.post("/admin/groups/assign-roles", json={"username": username, "group_name": group_name, "roles": ["user"]})
+        return username, group_name
+
+    def login(client, _):
+        username = rng.choice(users)[1]
+        return client.post("/login", data={"username": username, "password": BENCH_PASSWORD})
+
+    def obtain_refresh_token(client, _):
+        return login(client, _).json()["refresh_token"]
+
+    def assign_roles(client, group_name):
+        username = rng.choice(users)[1]
+        return client.post("/admin/groups/assign-roles", json={"username": username, "group_name": group_name, "roles": ["user", "reviewer"]})
+
+    def remove_roles(client, state):
+        username, group_name = state
+        return client.request("DELETE", "/admin/groups/remove-roles", json={"username": username, "group_name": group_name, "roles": ["user"]})
+
+    return [
+        Scenario("POST /login", login),
+        Scenario(
+            "POST /token/refresh",
+            lambda client, refresh_token: client.post("/token/refresh", json={"refresh_token": refresh_token}),
+            prepare=obtain_refresh_token,
+        ),
+        Scenario(
+            "POST /admin/users/",
+            lambda client, username: client.post("/admin/users/", json={"username": username, "password": BENCH_PASSWORD}),
+            prepare=lambda client, i: unique_name("bench-user"),
+        ),
+        Scenario(
+            "GET /admin/users/{user_id}/username",
+            lambda client, _: client.get(f"/admin/users/{rng.choice(users)[0]}/username"),
+        ),
+        Scenario(
+            "POST /admin/groups/",
+            lambda client, group_name: client.post("/admin/groups/", json={"group_name": group_name}),
+            prepare=lambda client, i: unique_name("bench-group"),
+        ),
+        Scenario(
+            "DELETE /admin/groups/delete/{group_name}",
+            lambda client, group_name: client.delete(f"/admin/groups/delete/{group_name}"),
+            prepare=create_group,
+        ),
+        Scenario("POST /admin/groups/assign-roles", assign_roles, prepare=create_group),
+        Scenario("DELETE /admin/groups/remove-roles", remove_roles, prepare=create_group_with_role),
+        Scenario(
+            "POST /admin/password",
+            lambda client, _: client.post("/admin/password", json={"username": rng.choice(users)[1], "new_password": BENCH_PASSWORD}),
+        ),
+        Scenario(
+            "GET /admin/groups/names",
+            lambda client, _: client.get("/admin/groups/names", headers={"Authorization": f"Bearer {rng.choice(tokens)}"}),
+        ),
+        Scenario(
+            "GET /admin/groups/{group_id}/reviewers",
+            lambda client, _: client.get(f"/admin/groups/{rng.choice(groups)[0]}/reviewers"),
+        ),
+        Scenario("GET /me", lambda client, _: client.get("/me", params={"token": rng.choice(tokens)})),
+        Scenario("GET /admin/users/", lambda client, _: client.get("/admin/users/"), max_requests=HEAVY_LISTING_REQUESTS),
+        Scenario("GET /admin/groups/all/", lambda client, _: client.get("/admin/groups/all/"), max_requests=HEAVY_LISTING_REQUESTS),
+        Scenario("GET /admin/user-group-roles/", lambda client, _: client.get("/admin/user-group-roles/"), max_requests=HEAVY_LISTING_REQUESTS),
+    ]
@@ -0,0 +1,59 @@
+import os
+import statistics
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SERVICES = {
+    "flow": BACKEND_DIR / "flow",
+    "auth": BACKEND_DIR / "auth",
+}
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+
+# Every synthetic auth user shares this password so logins can be benchmarked
+BENCH_PASSWORD = "benchpass"
+# The benchmark measures the login endpoint itself, so its admission limits are lifted
+AUTH_BENCH_ENV = {
+    "LOGIN_USERNAME_BURST": "1000000",
+    "LOGIN_IP_BURST": "1000000",
+    "LOGIN_CPU_SHARE": "1000",
+    "JWT_ALLOW_EPHEMERAL_KEY": "true",
+}
+
+
+def load_service(service: str, database_url: str):
+    """
+    Makes the modules of one service importable and points it at the given database.
+
+    Both services use flat module names (models, main), so a process only ever loads one of them.
+    """
+    os.environ["DATABASE_URL"] = database_url
+    if service == "auth":
+        for name, value in AUTH_BENCH_ENV.items():
+            os.environ.setdefault(name, value)
+    sys.path.insert(0, str(SERVICES[service]))
+
+
+def dialect_name(database_url: str) -> str:
+    return database_url.split(":", 1)[0].split("+", 1)[0]
+
+
+def summarize_latencies(latencies: List[float], wall_seconds: float, errors: int) -> Dict[str, float]:
+    """
+    Latency percentiles in milliseconds and throughput in requests per second.
+    """
+    if len(latencies) > 1:
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    else:
+        percentiles = latencies * 99
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "p50_ms": round(percentiles[49], 3),
+        "p95_ms": round(percentiles[94], 3),
+        "p99_ms": round(percentiles[98], 3),
+        "max_ms": round(max(latencies), 3),
+        "throughput_rps": round(len(latencies) / wall_seconds, 2) if wall_seconds else 0.0,
+    }
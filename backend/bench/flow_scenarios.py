@@ -0,0 +1,197 @@
+import base64
+import hashlib
+import json
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from scenario import Scenario
+
+# Documents written by the benchmark belong to a user outside the generated id range
+BENCH_USER_ID = 10_000_000
+SAMPLE_SIZE = 1_000
+
+
+_signing_key = None
+
+
+def bench_signing_key() -> Tuple[object, str]:
+    """
+    The key benchmark tokens are signed with, and its key id.
+
+    In-process runs generate a key and publish it in flow's JWKS cache, standing in for the auth
+    service. For --base-url runs set JWT_PRIVATE_KEY_FILE to the auth service's signing key, so the
+    deployment verifies the tokens against the keys auth publishes.
+    """
+    global _signing_key
+    if _signing_key is None:
+        key_file = os.getenv("JWT_PRIVATE_KEY_FILE")
+        if key_file:
+            with open(key_file, "rb") as f:
+                private_key = serialization.load_pem_private_key(f.read(), password=None)
+        else:
+            private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = json.loads(RSAAlgorithm.to_jwk(private_key.public_key()))
+        # Same RFC 7638 thumbprint key id the auth service publishes
+        members = json.dumps({name: jwk[name] for name in ("e", "kty", "n")}, separators=(",", ":"), sort_keys=True)
+        kid = base64.urlsafe_b64encode(hashlib.sha256(members.encode()).digest()).rstrip(b"=").decode()
+        if not key_file:
+            from main import jwks_cache
+            jwks_cache.set_keys({"keys": [{**jwk, "kid": kid, "alg": "RS256", "use": "sig"}]})
+        _signing_key = (private_key, kid)
+    return _signing_key
+
+
+def make_token(user_id: int, realm_roles: Dict[str, List[str]]) -> str:
+    from role_claims import ROLE_CLAIM, encode_realm_roles
+    private_key, kid = bench_signing_key()
+    expiration = datetime.now(timezone.utc) + timedelta(hours=1)
+    return jwt.encode(
+        {"uid": user_id, ROLE_CLAIM: encode_realm_roles(realm_roles), "exp": int(expiration.timestamp())},
+        private_key,
+        algorithm="RS256",
+        headers={"kid": kid},
+    )
+
+
+def build_context(engine, rng: random.Random) -> dict:
+    """Samples existing documents and notifications to spread requests over the dataset."""
+    from models import Document, Notification
+
+    with Session(engine) as session:
+        max_document_id = session.exec(select(func.max(Document.id))).one() or 0
+        max_notification_id = session.exec(select(func.max(Notification.id))).one() or 0
+        realms = [str(realm_id) for realm_id in session.exec(select(Document.realm_id).distinct()).all()]
+        document_ids = [rng.randint(1, max_document_id) for _ in range(SAMPLE_SIZE)] if max_document_id else []
+        documents = session.exec(
+            select(Document.id, Document.realm_id, Document.creator_id).where(Document.id.in_(document_ids))
+        ).all()
+        notification_ids = [rng.randint(1, max_notification_id) for _ in range(SAMPLE_SIZE)] if max_notification_id else []
+        notifications = session.exec(
+            select(Notification.id, Notification.recipient_id).where(Notification.id.in_(notification_ids))
+        ).all()
+    if not documents:
+        raise SystemExit("The flow database is empty, run datagen.py flow first")
+    return {
+        "realms": realms or ["1"],
+        "documents": [tuple(row) for row in documents],
+        "notifications": [tuple(row) for row in notifications],
+        "rng": rng,
+    }
+
+
+def build_scenarios(ctx: dict) -> List[Scenario]:
+    rng: random.Random = ctx["rng"]
+    realms = ctx["realms"]
+    documents = ctx["documents"]
+    notifications = ctx["notifications"]
+
+    admin_headers = {"Authorization": f"Bearer {make_token(BENCH_USER_ID, {realm: ['admin'] for realm in realms})}"}
+    bench_headers = {"Authorization": f"Bearer {make_token(BENCH_USER_ID, {realm: ['user', 'reviewer'] for realm in realms})}"}
+
+    def member_headers(user_id: int, realm_id) -> dict:
+        return {"Authorization": f"Bearer {make_token(user_id, {str(realm_id): ['user', 'reviewer']})}"}
+
+    def create_document(client, i):
+        response = client.post(f"/documents/{realms[0]}", json={"title": f"Bench {i}", "description": "bench"}, headers=bench_headers)
+        return response.json()["id"]
+
+    def create_pending_document(client, i):
+        document_id = create_document(client, i)
+        client.post(f"/documents/{document_id}/submit-for-review", json={"reviewer_id": BENCH_USER_ID}, headers=bench_headers)
+        return document_id
+
+    def create_archived_document(client, i):
+        document_id = create_document(client, i)
+        client.post(f"/documents/{document_id}/archive", headers=bench_headers)
+        return document_id
+
+    def list_realm(client, _):
+        realm_id = rng.choice(realms)
+        return client.get(f"/documents/{realm_id}", headers=member_headers(rng.randint(1, 10_000), realm_id))
+
+    def list_realm_admin(client, _):
+        return client.get(f"/documents/{rng.choice(realms)}", headers=admin_headers)
+
+    def list_archive(client, _):
+        realm_id = rng.choice(realms)
+        return client.get(f"/documents/{realm_id}/archive", headers=member_headers(rng.randint(1, 10_000), realm_id))
+
+    def document_details(client, _):
+        document_id, realm_id, creator_id = rng.choice(documents)
+        return client.get(f"/documents/{document_id}/details", headers=member_headers(creator_id, realm_id))
+
+    def review_history(client, _):
+        document_id, realm_id, creator_id = rng.choice(documents)
+        return client.get(f"/documents/{document_id}/review-history", headers=member_headers(creator_id, realm_id))
+
+    def review_history_batch(client, _):
+        document_ids = [document[0] for document in rng.sample(documents, min(50, len(documents)))]
+        return client.post("/documents/review-history:batch", json={"document_ids": document_ids}, headers=admin_headers)
+
+    def list_notifications(client, _):
+        if notifications:
+            recipient_id = rng.choice(notifications)[1]
+        else:
+            recipient_id = rng.choice(documents)[2]
+        return client.get("/notifications", headers=member_headers(recipient_id, realms[0]))
+
+    def mark_notification(client, _):
+        notification_id, recipient_id = rng.choice(notifications)
+        return client.patch(f"/notifications/{notification_id}", json={"is_read": True}, headers=member_headers(recipient_id, realms[0]))
+
+    scenarios = [
+        Scenario("GET /documents/{realm_id}", list_realm),
+        Scenario("GET /documents/{realm_id} (admin)", list_realm_admin),
+        Scenario("GET /documents/{realm_id}/archive", list_archive),
+        Scenario("GET /documents/{document_id}/details", document_details),
+        Scenario("GET /documents/{document_id}/review-history", review_history),
+        Scenario("POST /documents/review-history:batch", review_history_batch),
+        Scenario("GET /notifications", list_notifications),
+        Scenario(
+            "POST /documents/{realm_id}",
+            lambda client, i: client.post(f"/documents/{realms[0]}", json={"title": f"Bench {i}", "description": "bench"}, headers=bench_headers),
+            prepare=lambda client, i: i,
+        ),
+        Scenario(
+            "PATCH /documents/{document_id}",
+            lambda client, document_id: client.patch(f"/documents/{document_id}", json={"title": "Bench updated"}, headers=bench_headers),
+            prepare=create_document,
+        ),
+        Scenario(
+            "PUT /documents/{document_id}",
+            lambda client, document_id: client.put(f"/documents/{document_id}", headers=bench_headers),
+            prepare=create_document,
+        ),
+        Scenario(
+            "POST /documents/{document_id}/submit-for-review",
+            lambda client, document_id: client.post(f"/documents/{document_id}/submit-for-review", json={"reviewer_id": BENCH_USER_ID}, headers=bench_headers),
+            prepare=create_document,
+        ),
+        Scenario(
+            "POST /documents/{document_id}/review-action",
+            lambda client, document_id: client.post(f"/documents/{document_id}/review-action", json={"action": "approve"}, headers=bench_headers),
+            prepare=create_pending_document,
+        ),
+        Scenario(
+            "POST /documents/{document_id}/archive",
+            lambda client, document_id: client.post(f"/documents/{document_id}/archive", headers=bench_headers),
+            prepare=create_document,
+        ),
+        Scenario(
+            "POST /documents/{document_id}/unarchive",
+            lambda client, document_id: client.post(f"/documents/{document_id}/unarchive", headers=bench_headers),
+            prepare=create_archived_document,
+        ),
+    ]
+    if notifications:
+        scenarios.append(Scenario("PATCH /notifications/{notification_id}", mark_notification))
+    return scenarios
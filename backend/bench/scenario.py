@@ -0,0 +1,23 @@
+from typing import Any, Callable, Optional
+
+
+class Scenario:
+    """
+    One benchmarked endpoint.
+
+    `prepare(client, i)` runs untimed before the measurement and returns the state that the timed
+    `request(client, state)` call consumes, e.g. a freshly created document for a write endpoint.
+    Heavy scenarios (full-table listings) are capped at `max_requests` iterations.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        request: Callable[[Any, Any], Any],
+        prepare: Optional[Callable[[Any, int], Any]] = None,
+        max_requests: Optional[int] = None,
+    ):
+        self.name = name
+        self.request = request
+        self.prepare = prepare
+        self.max_requests = max_requests
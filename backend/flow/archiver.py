@@ -0,0 +1,73 @@
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import update
+from sqlmodel import Session
+
+from models import Document, DocumentStatus
+
+# --- Archival Policy ---
+# Published documents that have not been updated for ARCHIVE_AFTER_DAYS days are archived, which
+# takes them out of the default listings (and out of their partial indexes). 0 disables the policy.
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "0"))
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+
+
+def archive_stale_documents(session: Session, older_than: timedelta, now: Optional[datetime] = None) -> int:
+    """
+    Archives every published document whose last update is older than `older_than`.
+
+    Args:
+        session: The database session.
+        older_than: How long a published document may stay untouched before it is archived.
+        now: (Optional) Reference time, defaults to the current UTC time.
+
+    Returns:
+        The number of archived documents.
+    """
+    cutoff = (now or datetime.now(timezone.utc)) - older_than
+    # A single set-based UPDATE, served by the (status, updated_at) index
+    result = session.exec(
+        update(Document)
+        .where(Document.status == DocumentStatus.PUBLISHED, Document.updated_at < cutoff)
+        .values(status=DocumentStatus.ARCHIVED)
+    )
+    session.commit()
+    return result.rowcount
+
+
+class DocumentArchiver:
+    """
+    Background thread applying the archival policy every `interval` seconds.
+    """
+
+    def __init__(self, engine, archive_after: timedelta, interval: float):
+        self.engine = engine
+        self.archive_after = archive_after
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="document-archiver", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join(timeout=self.interval)
+
+    def run_once(self) -> int:
+        with Session(self.engine) as session:
+            return archive_stale_documents(session, self.archive_after)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                archived = self.run_once()
+                if archived:
+                    print(f"Archived {archived} documents untouched for {self.archive_after.days} days")
+            except Exception as e:
+                # Keep the archiver alive across transient database errors
+                print(f"Error archiving documents: {e}")
+            self._stop_event.wait(self.interval)
@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import httpx
+from jwt import PyJWK, PyJWKSet, PyJWTError
+
+# --- Token Verification Keys ---
+# Access tokens are signed by the auth service and verified here against the public keys it
+# publishes. The key set is kept in memory and refreshed in the background, so verifying a request
+# never waits on the auth service.
+AUTH_JWKS_URL = os.getenv("AUTH_JWKS_URL", "http://auth:8000/.well-known/jwks.json")
+JWKS_REFRESH_SECONDS = int(os.getenv("JWKS_REFRESH_SECONDS", "300"))
+# A token with an unknown key id (the auth service rotated its key) triggers an early refresh,
+# at most once per this many seconds so forged key ids cannot flood the auth service
+JWKS_MIN_REFRESH_SECONDS = int(os.getenv("JWKS_MIN_REFRESH_SECONDS", "30"))
+JWKS_FETCH_TIMEOUT_SECONDS = 5.0
+
+
+class UnknownSigningKey(PyJWTError):
+    """Raised when a token names a key id that is not in the key set."""
+
+
+class JWKSCache:
+    """
+    In-memory copy of the auth service's JSON Web Key Set, indexed by key id.
+    """
+
+    def __init__(self, url: str, refresh_interval: float, min_refresh_interval: float):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self._keys: Dict[str, PyJWK] = {}
+        self._fetch_lock = threading.Lock()
+        self._last_fetch: Optional[float] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def set_keys(self, jwks: dict):
+        """
+        Replace the key set with the keys of a JWKS document. Keys without a key id are ignored.
+        """
+        key_set = PyJWKSet.from_dict(jwks)
+        # Swapped in as a whole, so readers never see a half-updated key set
+        self._keys = {key.key_id: key for key in key_set.keys if key.key_id}
+
+    def refresh(self) -> bool:
+        """
+        Fetch the key set from the auth service. On failure the current keys stay in use.
+
+        Returns:
+            Whether the key set was updated.
+        """
+        with self._fetch_lock:
+            self._last_fetch = time.monotonic()
+            try:
+                response = httpx.get(self.url, timeout=JWKS_FETCH_TIMEOUT_SECONDS)
+                response.raise_for_status()
+                self.set_keys(response.json())
+                return True
+            except Exception as e:
+                print(f"Error refreshing JWKS from {self.url}: {e}")
+                return False
+
+    def get_key(self, kid: Optional[str]) -> PyJWK:
+        """
+        Returns the verification key for a key id, refreshing the key set once if it is unknown.
+
+        Raises:
+            UnknownSigningKey: If the key id is not published by the auth service.
+        """
+        key = self._keys.get(kid)
+        if key is None and kid and self._may_refresh():
+            with self._fetch_lock:
+                # Another request may have refreshed while this one waited for the lock
+                key = self._keys.get(kid)
+            if key is None and self._may_refresh():
+                self.refresh()
+                key = self._keys.get(kid)
+        if key is None:
+            raise UnknownSigningKey(f"Unknown signing key {kid}")
+        return key
+
+    def _may_refresh(self) -> bool:
+        return self._last_fetch is None or time.monotonic() - self._last_fetch >= self.min_refresh_interval
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="jwks-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=JWKS_FETCH_TIMEOUT_SECONDS)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.refresh()
+            self._stop_event.wait(self.refresh_interval)
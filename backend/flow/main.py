@@ -1,14 +1,15 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Query
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Header, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials # Import for JWT handling
 from sqlmodel import Session, SQLModel, create_engine, select
+from sqlalchemy import inspect, text
 from typing import Dict, List, Optional
-from sqlalchemy import or_ # Needed for combining multiple OR conditions in WHERE clauses
 from datetime import datetime,timezone
 # Import all necessary models from your models.py file
 from models import (
     Document,
     DocumentCreate,
     DocumentRead,
+    DocumentDetailRead,
     UserRoles,
     DocumentStatus,
     DocumentUpdate, # Assuming you have a DocumentUpdate model for PATCH requests
@@ -21,28 +22,22 @@ from models import (
     NotificationType,
     Notification,
     NotificationMarkReadRequest,
-    DocumentWrite
+    DocumentWrite,
+    MultipartUploadSession,
+    ReviewHistoryBatchRequest,
+    DocumentReviewHistory
 )
-from minio import get_upload_s3_url, get_read_s3_url
-import jwt # pip install python-jose[cryptography] or pyjwt
+from minio import get_upload_s3_url, get_read_s3_url, get_s3_file_etag, read_s3_file, published_sha256, read_published_file, initiate_multipart_upload, publish_s3_file, MULTIPART_THRESHOLD_BYTES
+from rendering import RenderCache, render_cache_key, render_markdown, RENDER_CACHE_BYTES, RENDER_CACHE_DIR
+from visibility import build_visible_documents_query, build_archived_documents_query
+from archiver import DocumentArchiver, ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL_SECONDS
+from datetime import timedelta
+import httpx
+import jwt
 from jwt import PyJWTError
+from jwks import JWKSCache, AUTH_JWKS_URL, JWKS_REFRESH_SECONDS, JWKS_MIN_REFRESH_SECONDS
+import hashlib
 import os
-# --- Configuration (IMPORTANT: Replace with environment variables in production) ---
-# This is a dummy secret key for DEMONSTRATION.
-# In production, this would be a real secret from your auth microservice,
-# or better yet, a public key/certificate for JWT signature verification.
-SECRET_KEY = os.getenv("SECRET_KEY", "your-very-secret-jwt-signing-key")  # SHOULD BE FROM ENV VAR
-ALGORITHM = os.getenv("ALGORITHM", "HS256")  # Or RS256, ES256 if using asymmetric keys
-
-import jwt # pip install python-jose[cryptography] or pyjwt
-from jwt import PyJWTError
-import os
-# --- Configuration (IMPORTANT: Replace with environment variables in production) ---
-# This is a dummy secret key for DEMONSTRATION.
-# In production, this would be a real secret from your auth microservice,
-# or better yet, a public key/certificate for JWT signature verification.
-SECRET_KEY = os.getenv("SECRET_KEY", "your-very-secret-jwt-signing-key")  # SHOULD BE FROM ENV VAR
-ALGORITHM = os.getenv("ALGORITHM", "HS256")  # Or RS256, ES256 if using asymmetric keys
 
 # --- Database Setup ---
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./database.db")
@@ -50,11 +45,22 @@ engine = create_engine(DATABASE_URL, echo=True)
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    # create_all does not alter tables that already exist; add the columns added since
+    document_columns = {column["name"] for column in inspect(engine).get_columns(Document.__tablename__)}
+    if "published_url" not in document_columns:
+        with engine.begin() as connection:
+            connection.execute(text(f'ALTER TABLE "{Document.__tablename__}" ADD COLUMN published_url VARCHAR'))
 
 def get_session():
     with Session(engine) as session:
         yield session
 
+# Public keys of the auth service, refreshed in the background while the app runs
+jwks_cache = JWKSCache(AUTH_JWKS_URL, JWKS_REFRESH_SECONDS, JWKS_MIN_REFRESH_SECONDS)
+
+# Rendered documents by the hash of their content, shared by all requests
+render_cache = RenderCache(RENDER_CACHE_BYTES, RENDER_CACHE_DIR)
+
 # --- JWT Security Scheme ---
 # This tells FastAPI to expect an "Authorization: Bearer <token>" header
 oauth2_scheme = HTTPBearer()
@@ -65,7 +71,7 @@ def get_current_user_context(
 ) -> UserRoles:
     """
     Extracts user_id and UserRoles from the JWT token.
-    Validates the token (conceptually, in this example).
+    Verifies the token's signature against the auth service's JWKS, without calling the auth service.
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -73,28 +79,16 @@ def get_current_user_context(
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        # --- CRITICAL SECURITY NOTE ---
-        # In a real microservices setup, you would typically use an asymmetric algorithm (e.g., RS256)
-        # and verify the token's signature using the PUBLIC KEY of the authentication microservice.
-        # DO NOT use verify_signature=False in production. This is for demonstration ONLY.
-
-        payload = jwt.decode(token.credentials, SECRET_KEY, algorithms=[ALGORITHM], options={"verify_signature": False})
-        # For production:
-        # payload = jwt.decode(token.credentials, PUBLIC_KEY_FROM_AUTH_SERVICE, algorithms=[ALGORITHM], audience="your-api-audience")
+        # Verify the signature against the auth service's published key named by the token's kid.
+        # Only that key's algorithm is accepted, so a token cannot pick a weaker one (or "none").
+        signing_key = jwks_cache.get_key(jwt.get_unverified_header(token.credentials).get("kid"))
+        payload = jwt.decode(token.credentials, signing_key.key, algorithms=[signing_key.algorithm_name])
 
         user_id: int = payload.get("uid") # 'sub' is standard for subject (user ID)
         if user_id is None:
             raise credentials_exception
 
-        # Assume roles are passed as a 'realm_roles' claim in the JWT
-        realm_roles_data: Dict[str, List[str]] = payload.get("realm_roles", {})
-        if not isinstance(realm_roles_data, dict):
-             # Handle cases where roles might be malformed
-            print(f"Warning: realm_roles claim is not a dictionary: {realm_roles_data}")
-            realm_roles_data = {} # Default to empty roles if malformed
-
-
-        user_roles = UserRoles(user_id=user_id, realm_roles=realm_roles_data)
+        user_roles = UserRoles.from_claims(user_id, payload)
         return user_roles
 
     except PyJWTError:
@@ -149,13 +143,114 @@ def create_notification(
     session.refresh(new_notification)
 
     return new_notification
+
+def can_view_review_history(document: Document, user_context: UserRoles) -> bool:
+    """
+    Returns True if the user may view the review history of the given document.
+    Any user with a role in the document's realm, or the document's creator, can view it.
+    """
+    realm_id = str(document.realm_id)
+    is_admin_in_realm = user_context.has_role_in_realm(realm_id, "admin")
+    is_user_in_realm = user_context.has_role_in_realm(realm_id, "user")
+    is_reviewer_in_realm = user_context.has_role_in_realm(realm_id, "reviewer")
+    is_creator = (user_context.user_id == document.creator_id)
+    return is_admin_in_realm or is_user_in_realm or is_reviewer_in_realm or is_creator
+
+def publish_document(db_document: Document):
+    """
+    Publishes a document's content in minio-api and stores its immutable URL on the document,
+    so reading a published document never calls minio-api.
+
+    Raises:
+        HTTPException: 502 if minio-api fails to publish it.
+    """
+    try:
+        db_document.published_url = publish_s3_file(db_document.id, "main.md")
+    except httpx.HTTPError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Could not publish document content: {e}"
+        )
+
 # Initialize the FastAPI app
 app = FastAPI()
 
+# Background archiver, only running when an archival policy is configured
+archiver: Optional[DocumentArchiver] = None
+
 # Event handler to create tables on startup
 @app.on_event("startup")
 def on_startup():
+    global archiver
     create_db_and_tables()
+    jwks_cache.start()
+    if ARCHIVE_AFTER_DAYS > 0:
+        archiver = DocumentArchiver(engine, timedelta(days=ARCHIVE_AFTER_DAYS), ARCHIVE_INTERVAL_SECONDS)
+        archiver.start()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    jwks_cache.stop()
+    if archiver:
+        archiver.stop()
+
+# --- Batched Review History Endpoint ---
+# Registered before POST /documents/{realm_id} so "review-history:batch" is not captured as a realm_id.
+@app.post("/documents/review-history:batch", response_model=List[DocumentReviewHistory])
+def get_document_review_history_batch(
+    batch_request: ReviewHistoryBatchRequest, # Request body with the document IDs
+    session: Session = Depends(get_session), # Database session dependency
+    user_context: UserRoles = Depends(get_current_user_context) # Authenticated user context dependency
+):
+    """
+    Retrieves the review history for several documents in one request.
+
+    - **batch_request**: Contains up to `REVIEW_HISTORY_BATCH_LIMIT` `document_ids`.
+    - **Authorization**: Same rules as the single-document review history, applied to every document.
+      The whole request fails if any document is missing or not visible to the user.
+    - **Returns**: One entry per requested document (in request order), each with its records ordered by review time.
+    """
+    # Deduplicate while keeping the caller's order
+    document_ids = list(dict.fromkeys(batch_request.document_ids))
+
+    # 1. Fetch all requested documents in a single query for authorization
+    documents = session.exec(select(Document).where(Document.id.in_(document_ids))).all()
+    documents_by_id = {document.id: document for document in documents}
+
+    # 2. Handle Documents Not Found
+    missing_ids = [document_id for document_id in document_ids if document_id not in documents_by_id]
+    if missing_ids:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Documents with IDs {missing_ids} not found."
+        )
+
+    # 3. Authorization Check
+    unauthorized_ids = [
+        document_id for document_id in document_ids
+        if not can_view_review_history(documents_by_id[document_id], user_context)
+    ]
+    if unauthorized_ids:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"User not authorized to view review history for documents with IDs {unauthorized_ids}."
+        )
+
+    # 4. Query Review Records for every document at once
+    review_history_query = (
+        select(ReviewRecord)
+        .where(ReviewRecord.document_id.in_(document_ids))
+        .order_by(ReviewRecord.document_id, ReviewRecord.reviewed_at)
+    )
+    records_by_document: Dict[int, List[ReviewRecord]] = {document_id: [] for document_id in document_ids}
+    for review_record in session.exec(review_history_query).all():
+        records_by_document[review_record.document_id].append(review_record)
+
+    # 5. Return the records grouped by document
+    return [
+        DocumentReviewHistory(document_id=document_id, review_records=records)
+        for document_id, records in records_by_document.items()
+    ]
 
 # --- Create Document Endpoint (same as before, now using JWT context) ---
 @app.post("/documents/{realm_id}", response_model=DocumentRead, status_code=status.HTTP_201_CREATED)
@@ -208,69 +303,57 @@ def get_documents_in_realm(
     - **status_filter**: Optional filter for document status (e.g., 'published', 'draft').
     - **creator_id_filter**: Optional filter for documents created by a specific user.
     - **limit, offset**: For pagination.
+    - Archived documents are never listed here; use `GET /documents/{realm_id}/archive`.
     - **Authorization**: Access is based on user's roles and document status:
         - `admin` in realm: Sees all documents.
         - `user` in realm: Sees own documents and published documents.
         - `reviewer` in realm: Sees documents assigned for review and published documents.
         - Other authenticated users or no specific role in realm: Only sees published documents.
     """
-    query = select(Document).where(Document.realm_id == int(realm_id))
-
-    # Determine user's roles in the specific realm
-    is_admin = user_context.has_role_in_realm(realm_id, "admin")
-    is_user = user_context.has_role_in_realm(realm_id, "user")
-    is_reviewer = user_context.has_role_in_realm(realm_id, "reviewer")
-
-    # Build authorization conditions
-    auth_conditions = []
-
-    if is_admin:
-        # Admins can see everything in the realm, no further auth conditions needed
-        pass
-    else:
-        # Non-admins always see published documents
-        auth_conditions.append(Document.status == DocumentStatus.PUBLISHED)
-
-        if is_user:
-            # Users can see their own documents
-            auth_conditions.append(Document.creator_id == user_context.user_id)
-
-        if is_reviewer:
-            # Reviewers can see documents assigned to them for review
-            auth_conditions.append(Document.current_reviewer_id == user_context.user_id)
-
-        # If no specific role in the realm (and not admin), they only see published (already added)
-        # If user has no specific role and there are no published documents, the list will be empty.
-        # No need to raise 403 here unless absolutely no documents are visible.
-
-    # Apply authorization conditions if not admin
-    if auth_conditions and not is_admin:
-        query = query.where(or_(*auth_conditions))
-    elif not auth_conditions and not is_admin:
-        # This case implies no specific role and no condition to see published documents (unlikely with above logic)
-        # Or if the realm_id is not in the user's roles at all and they are not an admin.
-        # If no authorization condition is met, and not an admin, then nothing should be returned.
-        # We can add a fail-safe here, though the `or_` with `Document.status == DocumentStatus.PUBLISHED` handles most.
-        pass # The query will just return published documents if that's the only condition
-
-    # Apply optional query filters
-    if status_filter:
-        query = query.where(Document.status == status_filter)
-    if creator_id_filter:
-        query = query.where(Document.creator_id == creator_id_filter)
-
-    # Apply pagination
-    query = query.offset(offset).limit(limit)
+    # Each visibility rule is compiled into its own index-friendly branch (see visibility.py)
+    query = build_visible_documents_query(
+        realm_id=int(realm_id),
+        user_context=user_context,
+        status_filter=status_filter,
+        creator_id_filter=creator_id_filter,
+        limit=limit,
+        offset=offset,
+    )
 
     documents = session.exec(query).all()
 
     return documents
 
+@app.get("/documents/{realm_id}/archive", response_model=List[DocumentRead])
+def get_archived_documents_in_realm(
+    realm_id: str,
+    session: Session = Depends(get_session),
+    user_context: UserRoles = Depends(get_current_user_context),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of documents to return"),
+    offset: int = Query(0, ge=0, description="Number of documents to skip")
+):
+    """
+    Retrieves the archived documents in a specific realm that the current user has visibility to.
+
+    - **realm_id**: The ID of the realm.
+    - **limit, offset**: For pagination.
+    - **Authorization**:
+        - `admin` in realm: Sees all archived documents.
+        - Everyone else: Sees archived documents that had been published, and their own archived documents.
+    """
+    query = build_archived_documents_query(
+        realm_id=int(realm_id),
+        user_context=user_context,
+        limit=limit,
+        offset=offset,
+    )
+    return session.exec(query).all()
+
 
 # Assuming 'app' is your FastAPI application instance
 # Assuming 'get_session' and 'get_current_user_context' dependencies are defined as before
 
-@app.get("/documents/{document_id}/details", response_model=DocumentRead)
+@app.get("/documents/{document_id}/details", response_model=DocumentDetailRead)
 def get_document_detail(
     document_id: int, # The ID of the document to retrieve
     session: Session = Depends(get_session), # Database session dependency
@@ -285,6 +368,7 @@ def get_document_detail(
         - `user` in document's realm: Sees the document if they are the creator, or if it's published.
         - `reviewer` in document's realm: Sees the document if they are the current reviewer, or if it's published.
         - Other authenticated users or no specific role in realm: Only sees the document if it's published.
+    - **source_url**: `main.md` as stored, for editing; `url` is the published copy once published.
     """
     # 1. Fetch the document from the database
     document = session.get(Document, document_id)
@@ -310,6 +394,8 @@ def get_document_detail(
         authorized = True # Admins can see any document in their realm
     elif document.status == DocumentStatus.PUBLISHED:
         authorized = True # Anyone can see published documents
+    elif document.status == DocumentStatus.ARCHIVED and document.published_at is not None:
+        authorized = True # Archiving a published document does not break existing links to it
     elif is_user_in_realm and document.creator_id == user_context.user_id:
         authorized = True # Users can see their own documents (even if not published)
     elif is_reviewer_in_realm and document.current_reviewer_id == user_context.user_id:
@@ -325,15 +411,77 @@ def get_document_detail(
     return document
 
 
+@app.get("/documents/{document_id}/rendered", response_class=Response)
+def get_rendered_document(
+    document_id: int, # The ID of the document to render
+    if_none_match: Optional[str] = Header(None), # ETag of a rendering the client already has
+    session: Session = Depends(get_session), # Database session dependency
+    user_context: UserRoles = Depends(get_current_user_context) # Authenticated user context dependency
+):
+    """
+    Returns a document's markdown rendered to sanitized HTML.
+
+    - **document_id**: The ID of the document to render.
+    - **Authorization**: Same as for the document's details.
+    - **Content**: The published rendition for published (and archived) documents, `main.md` as
+      stored otherwise.
+    - **Caching**: Renderings are cached by the hash of the markdown, so a document is fetched and
+      rendered once per content. The response's `ETag` names that content; a request whose
+      `If-None-Match` matches it gets `304 Not Modified`.
+    """
+    document = get_document_detail(document_id, session, user_context)
+
+    try:
+        # Published documents render their published rendition, which links images by their
+        # immutable asset URLs; drafts render the markdown as stored
+        sha256 = None
+        if document.published_url and document.status in (DocumentStatus.PUBLISHED, DocumentStatus.ARCHIVED):
+            sha256 = published_sha256(document.published_url)
+        # The content's ETag names it without a download; published content is named by its hash
+        content_key = sha256 if sha256 is not None else get_s3_file_etag(document.id, "main.md")
+        key = render_cache_key(content_key) if content_key else None
+        html = render_cache.get(key) if key else None
+        if html is None:
+            if sha256 is not None:
+                source = read_published_file(sha256)
+            else:
+                # Keyed on the content read, which may have changed since its ETag was asked for
+                source, etag = read_s3_file(document.id, "main.md")
+                key = render_cache_key(etag or hashlib.sha256(source).hexdigest())
+                html = render_cache.get(key)
+            if html is None:
+                html = render_markdown(source)
+                render_cache.put(key, html)
+    except httpx.HTTPError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Could not read document content: {e}"
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+
+    # Revalidated on every view, since the document may change or stop being visible
+    headers = {"ETag": f'"{key}"', "Cache-Control": "private, no-cache"}
+    if if_none_match is not None and headers["ETag"] in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=html, media_type="text/html; charset=utf-8", headers=headers)
+
 
 @app.put("/documents/{document_id}", response_model=DocumentWrite)
 def upload_document(
     document_id: int, # The ID of the document to update
+    size: Optional[int] = Query(None, ge=1, description="Size in bytes of the content to upload"),
     session: Session = Depends(get_session), # Database session dependency
     user_context: UserRoles = Depends(get_current_user_context) # Authenticated user context dependency
 ):
     """
     Upload specific fields of an existing document.
+
+    - **size**: Size of the content to upload. From `MULTIPART_THRESHOLD_BYTES` on, the response
+      describes a multipart upload session in `multipart` instead of a single PUT `url`.
     """
     # 1. Fetch the document from the database
     db_document = session.get(Document, document_id)
@@ -362,14 +510,27 @@ def upload_document(
         )
 
     # 4. Apply Updates based on Authorization
-    
+    # New content of a published document is read through presigned URLs until it is published again
+    db_document.published_url = None
+
     # 5. Save Changes to Database
     session.add(db_document)
     session.commit()
     session.refresh(db_document) # Refresh to get updated_at and any other auto-generated fields
     
-    # 6. Return the updated document
-    return db_document
+    # 6. Return the updated document with where to upload its content
+    document = DocumentWrite.model_validate(db_document)
+    if size is not None and size >= MULTIPART_THRESHOLD_BYTES:
+        try:
+            upload = initiate_multipart_upload(document_id, "main.md", size, "text/markdown")
+        except httpx.HTTPError as e:
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=f"Could not start multipart upload: {e}"
+            )
+        if upload is not None:
+            document.multipart = MultipartUploadSession(**upload)
+    return document
 
 
 @app.patch("/documents/{document_id}", response_model=DocumentRead)
@@ -430,6 +591,8 @@ def update_document(
                     status_code=status.HTTP_403_FORBIDDEN,
                     detail=f"Document with ID {document_id} cannot be updated unless it is in DRAFT or PUBLISHED status by its creator."
                 )
+        if key == "status" and value == DocumentStatus.PUBLISHED and db_document.status != DocumentStatus.PUBLISHED:
+            publish_document(db_document)
         # Apply the update
         setattr(db_document, key, value)
 
@@ -585,6 +748,10 @@ def perform_review_action(
             detail="Invalid review action."
         )
 
+    # Published before anything is recorded, so a failure leaves the document under review
+    if new_document_status == DocumentStatus.PUBLISHED:
+        publish_document(db_document)
+
     # 5. Create Review Record
     review_record = ReviewRecord(
         document_id=document_id,
@@ -628,6 +795,126 @@ def perform_review_action(
     )
 
 
+# --- Archival Endpoints ---
+@app.post("/documents/{document_id}/archive", response_model=DocumentRead)
+def archive_document(
+    document_id: int, # The ID of the document to archive
+    session: Session = Depends(get_session), # Database session dependency
+    user_context: UserRoles = Depends(get_current_user_context) # Authenticated user context dependency
+):
+    """
+    Archives a document, removing it from the default realm listings.
+
+    - **document_id**: The ID of the document to archive.
+    - **Authorization**:
+        - User must be the `creator` of the document OR have `admin` role in the document's realm.
+        - Document must not be in `PENDING_REVIEW` or already `ARCHIVED`.
+    """
+    # 1. Fetch the document from the database
+    db_document = session.get(Document, document_id)
+
+    # 2. Handle Document Not Found
+    if not db_document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Document with ID {document_id} not found."
+        )
+
+    # 3. Authorization Check
+    realm_id = str(db_document.realm_id)
+    is_admin_in_realm = user_context.has_role_in_realm(realm_id, "admin")
+    is_creator = (user_context.user_id == db_document.creator_id)
+
+    if not (is_creator or is_admin_in_realm):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"User not authorized to archive document with ID {document_id}."
+        )
+
+    # A document under review has to be reviewed (or reassigned) first
+    if db_document.status in (DocumentStatus.PENDING_REVIEW, DocumentStatus.ARCHIVED):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Document with ID {document_id} is in {db_document.status.value.upper()} status and cannot be archived."
+        )
+
+    # 4. Update Document Status
+    db_document.status = DocumentStatus.ARCHIVED
+
+    # 5. Save Changes to Database
+    session.add(db_document)
+    session.commit()
+    session.refresh(db_document)
+
+    if not is_creator:
+        create_notification(
+            session=session,
+            recipient_id=db_document.creator_id,
+            sender_id=user_context.user_id,
+            document_id=document_id,
+            type=NotificationType.DOCUMENT_STATE_CHANGE,
+            message=f"Your document '{db_document.title}' has been archived in realm '{realm_id}'.",
+            realm_id=realm_id
+        )
+
+    # 6. Return the updated document
+    return db_document
+
+@app.post("/documents/{document_id}/unarchive", response_model=DocumentRead)
+def unarchive_document(
+    document_id: int, # The ID of the document to restore
+    session: Session = Depends(get_session), # Database session dependency
+    user_context: UserRoles = Depends(get_current_user_context) # Authenticated user context dependency
+):
+    """
+    Restores an archived document. Documents that had been published return to `PUBLISHED`,
+    all others return to `DRAFT`.
+
+    - **document_id**: The ID of the document to restore.
+    - **Authorization**:
+        - User must be the `creator` of the document OR have `admin` role in the document's realm.
+        - Document must currently be in `ARCHIVED` status.
+    """
+    # 1. Fetch the document from the database
+    db_document = session.get(Document, document_id)
+
+    # 2. Handle Document Not Found
+    if not db_document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Document with ID {document_id} not found."
+        )
+
+    # 3. Authorization Check
+    realm_id = str(db_document.realm_id)
+    is_admin_in_realm = user_context.has_role_in_realm(realm_id, "admin")
+    is_creator = (user_context.user_id == db_document.creator_id)
+
+    if not (is_creator or is_admin_in_realm):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"User not authorized to unarchive document with ID {document_id}."
+        )
+
+    if db_document.status != DocumentStatus.ARCHIVED:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Document with ID {document_id} is not in ARCHIVED status."
+        )
+
+    # 4. Update Document Status
+    db_document.status = DocumentStatus.PUBLISHED if db_document.published_at else DocumentStatus.DRAFT
+    if db_document.status == DocumentStatus.PUBLISHED and not db_document.published_url:
+        publish_document(db_document)
+
+    # 5. Save Changes to Database
+    session.add(db_document)
+    session.commit()
+    session.refresh(db_document)
+
+    # 6. Return the updated document
+    return db_document
+
 # --- GET Review History Endpoint ---
 @app.get("/documents/{document_id}/review-history", response_model=List[ReviewRecordRead])
 def get_document_review_history(
@@ -652,14 +939,8 @@ def get_document_review_history(
         )
 
     # 3. Authorization Check
-    realm_id = str(db_document.realm_id)
-    is_admin_in_realm = user_context.has_role_in_realm(realm_id, "admin")
-    is_user_in_realm = user_context.has_role_in_realm(realm_id, "user")
-    is_reviewer_in_realm = user_context.has_role_in_realm(realm_id, "reviewer")
-    is_creator = (user_context.user_id == db_document.creator_id)
-
     # Any user with a role in the realm or the creator can view history
-    if not (is_admin_in_realm or is_user_in_realm or is_reviewer_in_realm or is_creator):
+    if not can_view_review_history(db_document, user_context):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail=f"User not authorized to view review history for document with ID {document_id}."
@@ -6,12 +6,18 @@ def get_s3_url_from_id(document_id: int,filename: str) -> str:
     # This is a dummy URL for demonstration purposes
     return f"https://your-s3-bucket.amazonaws.com/documents/{document_id}/{filename}"
 
+import re
+from urllib.parse import urlsplit
+
 import httpx
 from pydantic import BaseModel
+from typing import Optional, Tuple
 import os
 # Assuming your FastAPI app is running locally on port 8000
 # MINIO_BASE_URL = os.getenv("MINIO_BASE_URL", "http://minio-api:8000")
 MINIO_BASE_URL = os.getenv("MINIO_BASE_URL", "")
+# Uploads of at least this many bytes get a multipart session instead of a single PUT URL
+MULTIPART_THRESHOLD_BYTES = int(os.getenv("MULTIPART_THRESHOLD_BYTES", str(16 * 1024 * 1024)))
 class UploadUrlRequest(BaseModel):
     filename: str
 
@@ -29,7 +35,7 @@ def get_upload_s3_url(uid: int, filename: str) -> str:
         httpx.HTTPStatusError: If the API call returns a non-2xx status code.
     """
     if len(MINIO_BASE_URL) == 0:
-        return get_s3_url_from_id(uid,file_path)
+        return get_s3_url_from_id(uid,filename)
     url = f"{MINIO_BASE_URL}/generate-upload-url/{uid}"
     payload = UploadUrlRequest(filename=filename)
     with httpx.Client() as client:
@@ -62,3 +68,126 @@ def get_read_s3_url(uid: int, file_path: str) -> str:
         # response.raise_for_status()  # Raise an exception for bad status codes
         resp = response.json()
         return resp.get("url", "")  # Return the URL from the response, defaulting to empty string if not found
+
+def publish_s3_file(uid: int, file_path: str) -> Optional[str]:
+    """
+    Calls the POST /publications/{uid}/{file_path} API to publish a file of a document that is
+    being published, and get its immutable, content-hashed URL that browsers and the proxy
+    cache for good.
+
+    Args:
+        uid: The user ID.
+        file_path: The full path of the file in S3.
+
+    Returns:
+        The published read URL, or None if there is no such file or it is not stored by hash
+        (it is then read through presigned URLs as before).
+    Raises:
+        httpx.HTTPStatusError: If the API call returns a non-2xx status code other than 404.
+    """
+    if len(MINIO_BASE_URL) == 0:
+        return None
+    url = f"{MINIO_BASE_URL}/publications/{uid}/{file_path}"
+    with httpx.Client() as client:
+        response = client.post(url)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        resp = response.json()
+    return resp.get("url") if resp.get("sha256") else None
+
+def get_s3_file_etag(uid: int, file_path: str) -> Optional[str]:
+    """
+    Calls HEAD /content/{uid}/{file_path} to get the ETag naming a file's current content
+    without downloading it. Read URLs point at the browser-facing endpoint, so flow reads
+    files through minio-api on the internal network instead.
+
+    Args:
+        uid: The user ID.
+        file_path: The full path of the file in S3.
+
+    Returns:
+        The content's SHA-256, or MinIO's ETag for files not stored by hash, if there is one.
+    Raises:
+        httpx.HTTPError: If the request fails or returns a non-2xx status code.
+    """
+    url = f"{MINIO_BASE_URL}/content/{uid}/{file_path}"
+    with httpx.Client() as client:
+        response = client.head(url)
+        response.raise_for_status()
+        etag = response.headers.get("ETag")
+    return etag.strip('"') if etag else None
+
+def read_s3_file(uid: int, file_path: str) -> Tuple[bytes, Optional[str]]:
+    """
+    Calls GET /content/{uid}/{file_path} to download a file's current content.
+
+    Args:
+        uid: The user ID.
+        file_path: The full path of the file in S3.
+
+    Returns:
+        The file's content and the ETag naming it, if there is one.
+    Raises:
+        httpx.HTTPError: If the download fails or returns a non-2xx status code.
+    """
+    url = f"{MINIO_BASE_URL}/content/{uid}/{file_path}"
+    with httpx.Client() as client:
+        response = client.get(url)
+        response.raise_for_status()
+        etag = response.headers.get("ETag")
+    return response.content, etag.strip('"') if etag else None
+
+def published_sha256(published_url: str) -> Optional[str]:
+    """
+    The SHA-256 of published content, from its asset URL (`.../assets/{sha256}`).
+
+    Returns:
+        The hash, or None if the URL is not an asset URL.
+    """
+    sha256 = urlsplit(published_url).path.rstrip("/").rsplit("/", 1)[-1]
+    return sha256 if re.fullmatch(r"[0-9a-f]{64}", sha256) else None
+
+def read_published_file(sha256: str) -> bytes:
+    """
+    Calls GET /assets/{sha256} to download published content, such as the rendition of a
+    published document's markdown.
+
+    Args:
+        sha256: The SHA-256 of the published content.
+
+    Returns:
+        The published content.
+    Raises:
+        httpx.HTTPError: If the download fails or returns a non-2xx status code.
+    """
+    url = f"{MINIO_BASE_URL}/assets/{sha256}"
+    with httpx.Client() as client:
+        response = client.get(url)
+        response.raise_for_status()
+    return response.content
+
+def initiate_multipart_upload(uid: int, filename: str, size: int, content_type: str) -> Optional[dict]:
+    """
+    Calls the /multipart-uploads/{uid}/{filename} API to start a multipart upload.
+
+    Args:
+        uid: The user ID.
+        filename: The name of the file to upload.
+        size: The size of the whole file in bytes.
+        content_type: The content type the assembled file is stored with.
+
+    Returns:
+        The upload session: upload_id, part_size, part_count, presigned URLs for the first parts
+        and the minio-api path of the session. None when no minio-api is configured.
+    Raises:
+        httpx.HTTPStatusError: If the API call returns a non-2xx status code.
+    """
+    if len(MINIO_BASE_URL) == 0:
+        return None
+    url = f"{MINIO_BASE_URL}/multipart-uploads/{uid}/{filename}"
+    with httpx.Client() as client:
+        response = client.post(url, json={"size": size, "content_type": content_type})
+        response.raise_for_status()
+        upload = response.json()
+    return {**upload, "path": f"/multipart-uploads/{uid}/{filename}/{upload['upload_id']}"}
@@ -1,12 +1,15 @@
 from typing import Dict, List, Optional
 from datetime import datetime, timezone
 from enum import Enum
+from functools import cached_property
 from sqlmodel import Field, SQLModel
+from sqlalchemy import Index, text
 from pydantic import BaseModel, Field as PydanticField, computed_field # Use alias for Pydantic's Field to avoid conflict with SQLModel's Field
 import asyncio
 
 # Placeholder for external S3 URL generation
 from minio import get_read_s3_url,get_upload_s3_url, get_s3_url_from_id
+from role_claims import ROLE_CLAIM, decode_realm_roles
 # def get_s3_url_from_id(document_id: int) -> str:
 #     """
 #     Placeholder for a function that generates a document URL (e.g., S3 pre-signed URL).
@@ -46,6 +49,23 @@ class DocumentBase(SQLModel):
     published_at: Optional[datetime] = None
 
 class Document(DocumentBase, table=True):
+    # Composite indexes backing the branches of the listing planner in visibility.py.
+    # Archived documents are left out of the listing indexes and get their own partial index,
+    # so the hot (non-archived) set stays small no matter how much is archived.
+    __table_args__ = (
+        Index("ix_document_realm_id_id", "realm_id", "id",
+              postgresql_where=text("status <> 'ARCHIVED'"), sqlite_where=text("status <> 'ARCHIVED'")),
+        Index("ix_document_realm_status_id", "realm_id", "status", "id"),
+        Index("ix_document_realm_creator_id", "realm_id", "creator_id", "id",
+              postgresql_where=text("status <> 'ARCHIVED'"), sqlite_where=text("status <> 'ARCHIVED'")),
+        Index("ix_document_realm_reviewer_id", "realm_id", "current_reviewer_id", "id",
+              postgresql_where=text("status <> 'ARCHIVED'"), sqlite_where=text("status <> 'ARCHIVED'")),
+        Index("ix_document_realm_archived_id", "realm_id", "id",
+              postgresql_where=text("status = 'ARCHIVED'"), sqlite_where=text("status = 'ARCHIVED'")),
+        # Used by the background archiver to find stale published documents
+        Index("ix_document_status_updated_at", "status", "updated_at"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), nullable=False)
     updated_at: datetime = Field(
@@ -53,6 +73,8 @@ class Document(DocumentBase, table=True):
         sa_column_kwargs={"onupdate": lambda: datetime.now(timezone.utc)},
         nullable=False
     )
+    # Immutable URL of main.md from minio-api, set when the document is published
+    published_url: Optional[str] = None
 
 class DocumentCreate(SQLModel):
     title: str = PydanticField(min_length=1)
@@ -70,23 +92,63 @@ class DocumentRead(DocumentBase):
     id: int
     created_at: datetime
     updated_at: datetime
+    published_url: Optional[str] = PydanticField(default=None, exclude=True)
 
     @computed_field
-    @property
+    @cached_property
     def url(self) -> str:
         if self.id is None:
             return "" # Or raise an error if id is expected to always be present
+        # Published content gets the immutable, cacheable URL stored when it was published,
+        # without a call to minio-api; drafts keep presigned ones
+        if self.is_published_version:
+            return self.published_url
         return get_read_s3_url(self.id,'main.md')
+
+    @property
+    def is_published_version(self) -> bool:
+        # Whether `url` is the published copy of main.md rather than main.md as stored
+        return bool(self.published_url) and self.status in (DocumentStatus.PUBLISHED, DocumentStatus.ARCHIVED)
+
+class DocumentDetailRead(DocumentRead):
+    @computed_field
+    @property
+    def source_url(self) -> str:
+        """
+        main.md as stored, for editors: the published copy `url` points to has its image links
+        replaced by asset URLs, and saving it back would lose them.
+        """
+        if self.id is None:
+            return ""
+        return get_read_s3_url(self.id,'main.md') if self.is_published_version else self.url
     
+class MultipartPartUrl(BaseModel):
+    part_number: int
+    url: str
+
+class MultipartUploadSession(BaseModel):
+    """
+    A multipart upload started in minio-api. Parts are PUT to their URLs, in parallel if wanted;
+    under the minio-api `path`, POST `part-urls` presigns more parts, GET `parts` lists the parts
+    received so far (to resume), POST `complete` assembles the file and DELETE aborts.
+    """
+    upload_id: str
+    part_size: int
+    part_count: int
+    parts: List[MultipartPartUrl]
+    path: str
+
 class DocumentWrite(DocumentBase):
     id: int
     created_at: datetime
     updated_at: datetime
+    # Set instead of `url` when the upload is large enough to go in parts
+    multipart: Optional[MultipartUploadSession] = None
 
     @computed_field
     @property
     def url(self) -> str:
-        if self.id is None:
+        if self.id is None or self.multipart is not None:
             return "" # Or raise an error if id is expected to always be present
         return get_upload_s3_url(self.id,'main.md')
 
@@ -111,6 +173,16 @@ class ReviewActionResult(BaseModel):
     review_record: ReviewRecordRead
     updated_document: DocumentRead
 
+# Upper bound on how many documents a single batched review-history request may cover
+REVIEW_HISTORY_BATCH_LIMIT = 100
+
+class ReviewHistoryBatchRequest(BaseModel):
+    document_ids: List[int] = PydanticField(min_length=1, max_length=REVIEW_HISTORY_BATCH_LIMIT)
+
+class DocumentReviewHistory(BaseModel):
+    document_id: int
+    review_records: List[ReviewRecordRead]
+
 class ReviewRequest(SQLModel):
     # This model is for submitting a document for review, potentially assigning a reviewer.
     reviewer_id: int # The ID of the user to whom the document is being assigned for review.
@@ -151,6 +223,27 @@ class NotificationMarkReadRequest(BaseModel):
 class UserRoles(BaseModel):
     user_id: int
     realm_roles: Dict[str, List[str]] = PydanticField(default_factory=dict)
+    # Version stamp of realm_roles at issuance; compare with auth's /admin/users/{id}/acl-version
+    acl_version: Optional[int] = None
+
+    @classmethod
+    def from_claims(cls, user_id: int, payload: dict) -> "UserRoles":
+        """
+        Builds the user context from verified token claims.
+
+        - Realm roles come from the compact `rr` claim (see role_claims.py), or from the
+          `realm_roles` object of tokens issued before it.
+        - Raises ValueError for a malformed `rr` claim.
+        """
+        if ROLE_CLAIM in payload:
+            realm_roles = decode_realm_roles(payload[ROLE_CLAIM])
+        else:
+            realm_roles = payload.get("realm_roles", {})
+            if not isinstance(realm_roles, dict):
+                # Handle cases where roles might be malformed
+                print(f"Warning: realm_roles claim is not a dictionary: {realm_roles}")
+                realm_roles = {}
+        return cls(user_id=user_id, realm_roles=realm_roles, acl_version=payload.get("acl_version"))
 
     @property
     def is_global_admin(self) -> bool:
@@ -0,0 +1,171 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import nh3
+from markdown_it import MarkdownIt
+
+# --- Server-side Rendering ---
+# Documents are rendered to sanitized HTML here instead of in every viewer's browser. Rendered
+# HTML is cached under the hash of the markdown it was rendered from, so a document is rendered
+# once per content however often it is viewed, and a changed document is never served stale.
+# Bytes of rendered HTML kept in memory, least recently used dropped first
+RENDER_CACHE_BYTES = int(os.getenv("RENDER_CACHE_BYTES", str(64 * 1024 * 1024)))
+# Directory of a second cache tier that survives restarts and is shared by workers; empty disables it
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", "")
+# Bytes the disk tier may hold before its least recently used files are deleted
+RENDER_CACHE_DISK_BYTES = int(os.getenv("RENDER_CACHE_DISK_BYTES", str(1024 * 1024 * 1024)))
+# Markdown larger than this is not rendered
+RENDER_MAX_SOURCE_BYTES = int(os.getenv("RENDER_MAX_SOURCE_BYTES", str(16 * 1024 * 1024)))
+# Part of every cache key; bump when rendering changes so cached HTML is rendered again
+RENDERER_VERSION = "1"
+
+# Same options as the viewer's markdown-it: raw HTML is allowed in the markdown and removed by
+# the sanitizer unless it is on the allowlist
+_markdown = MarkdownIt("default", {"html": True})
+# ammonia's defaults plus the classes code blocks carry for highlighting and table alignment
+_ALLOWED_ATTRIBUTES = {
+    **nh3.ALLOWED_ATTRIBUTES,
+    "code": {"class"},
+    "th": {*nh3.ALLOWED_ATTRIBUTES.get("th", ()), "style"},
+    "td": {*nh3.ALLOWED_ATTRIBUTES.get("td", ()), "style"},
+}
+
+
+def render_markdown(source: bytes) -> bytes:
+    """
+    Render markdown to sanitized HTML.
+
+    Raises:
+        ValueError: If `source` is larger than RENDER_MAX_SOURCE_BYTES.
+    """
+    if len(source) > RENDER_MAX_SOURCE_BYTES:
+        raise ValueError(f"Document is larger than {RENDER_MAX_SOURCE_BYTES} bytes")
+    html = _markdown.render(source.decode("utf-8", errors="replace"))
+    return nh3.clean(html, attributes=_ALLOWED_ATTRIBUTES, filter_style_properties={"text-align"}).encode()
+
+
+def render_cache_key(content_key: str) -> str:
+    """
+    Cache key of the HTML rendered from the markdown identified by `content_key` (its SHA-256,
+    or its ETag for files not stored by hash).
+    """
+    return hashlib.sha256(f"{RENDERER_VERSION}:{content_key}".encode()).hexdigest()
+
+
+class RenderCache:
+    """
+    Rendered HTML by cache key: a size-bounded LRU in memory, backed by an optional directory.
+    Entries never change for a key, so both tiers only need evicting, never invalidating.
+    """
+
+    def __init__(self, max_bytes: int, directory: str = "", max_disk_bytes: int = RENDER_CACHE_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._disk_bytes: Optional[int] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return html
+        html = self._read_disk(key)
+        with self._lock:
+            if html is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._remember(key, html)
+        return html
+
+    def put(self, key: str, html: bytes):
+        self._remember(key, html)
+        self._write_disk(key, html)
+
+    def _remember(self, key: str, html: bytes):
+        if len(html) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = html
+            self._bytes += len(html)
+            while self._bytes > self.max_bytes:
+                _, dropped = self._entries.popitem(last=False)
+                self._bytes -= len(dropped)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.html")
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                html = file.read()
+            # Eviction goes by modification time, so a read counts as a use
+            os.utime(path)
+            return html
+        except OSError:
+            return None
+
+    def _write_disk(self, key: str, html: bytes):
+        if not self.directory or len(html) > self.max_disk_bytes:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written under a temporary name and renamed, so readers never see a partial file
+            fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as file:
+                file.write(html)
+            os.replace(temporary, path)
+        except OSError as e:
+            print(f"Writing rendered document {key} to {self.directory} failed: {e!r}")
+            return
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(html)
+                if self._disk_bytes <= self.max_disk_bytes:
+                    return
+        self._prune_disk()
+
+    def _prune_disk(self):
+        """
+        Delete the least recently used files until the disk tier is within 90% of its budget.
+        """
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        if total > self.max_disk_bytes:
+            for _, size, path in sorted(files):
+                if total <= self.max_disk_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    continue
+        with self._lock:
+            self._disk_bytes = total
@@ -1,6 +1,9 @@
+import re
+
+import httpx
 import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import SQLModel, Session, create_engine
+from sqlmodel import SQLModel, Session, create_engine, select
 from main import app, get_session
 from models import DocumentStatus, UserRoles, DocumentCreate
 # import minio
@@ -115,7 +118,46 @@ def test_update_document(client, session, mock_user_context):
     assert data["title"] == "Updated Test Doc"
     assert data["description"] == "Updated pytest doc"
     assert data["creator_id"] == 1
-    assert data["realm_id"] == 1    
+    assert data["realm_id"] == 1
+
+def test_upload_document_multipart(client, session, mock_user_context, httpx_mock, monkeypatch):
+    """Test that large uploads get a multipart session instead of a single upload URL."""
+    import json
+    import minio
+    set_user_context(mock_user_context, user_id=1, realm_roles={"1": ["user"]})
+    response = client.post("/documents/1", json={"title": "Big Doc", "description": "pytest doc"})
+    document_id = response.json()["id"]
+
+    # Small uploads keep the single PUT URL
+    response = client.put(f"/documents/{document_id}", params={"size": 1024})
+    assert response.status_code == 200
+    assert response.json()["url"].endswith(f"/{document_id}/main.md")
+    assert response.json()["multipart"] is None
+
+    monkeypatch.setattr(minio, "MINIO_BASE_URL", "http://minio-api.test")
+    size = minio.MULTIPART_THRESHOLD_BYTES + 1
+    httpx_mock.add_response(
+        method="POST",
+        url=f"http://minio-api.test/multipart-uploads/{document_id}/main.md",
+        json={
+            "upload_id": "upload-1",
+            "part_size": 8 * 1024 * 1024,
+            "part_count": 3,
+            "parts": [{"part_number": n, "url": f"http://s3.test/part{n}"} for n in (1, 2, 3)],
+        },
+    )
+    response = client.put(f"/documents/{document_id}", params={"size": size})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["url"] == ""
+    assert data["multipart"]["upload_id"] == "upload-1"
+    assert data["multipart"]["part_count"] == 3
+    assert data["multipart"]["path"] == f"/multipart-uploads/{document_id}/main.md/upload-1"
+    assert json.loads(httpx_mock.get_requests()[0].content) == {"size": size, "content_type": "text/markdown"}
+
+    httpx_mock.add_response(method="POST", status_code=500)
+    response = client.put(f"/documents/{document_id}", params={"size": size})
+    assert response.status_code == 502
 
 def test_submit_document_for_review(client, session, mock_user_context):
     # Set user as 'user' in realm '1'
@@ -164,6 +206,143 @@ def test_perform_review_action(client, session, mock_user_context):
     assert data["review_record"]["action"] == "approve"
     assert data["updated_document"]["status"] == "published"
 
+def test_published_document_url(client, session, mock_user_context, httpx_mock, monkeypatch):
+    """Test that publishing stores the published URL, which reads then return without calling minio-api."""
+    import minio
+    set_user_context(mock_user_context, user_id=2, realm_roles={"1": ["user", "reviewer"]})
+    monkeypatch.setattr(minio, "MINIO_BASE_URL", "http://minio-api.test")
+    httpx_mock.add_response(
+        method="GET",
+        url=re.compile(r"http://minio-api\.test/generate-read-url/\d+/main\.md"),
+        json={"url": "http://s3.test/presigned"},
+        is_reusable=True,
+    )
+    document_id = client.post("/documents/1", json={"title": "Doc", "description": "pytest doc"}).json()["id"]
+    read_url_calls = len(httpx_mock.get_requests())
+    details = client.get(f"/documents/{document_id}/details").json()
+    assert details["url"] == details["source_url"] == "http://s3.test/presigned"
+    assert len(httpx_mock.get_requests()) == read_url_calls + 1
+
+    asset_url = "http://minio-api.test/assets/" + "ab" * 32
+    httpx_mock.add_response(
+        method="POST",
+        url=f"http://minio-api.test/publications/{document_id}/main.md",
+        json={"url": asset_url, "sha256": "ab" * 32},
+    )
+    client.post(f"/documents/{document_id}/submit-for-review", json={"reviewer_id": 2})
+    response = client.post(f"/documents/{document_id}/review-action", json={"action": "approve", "rejection_reason": None})
+    assert response.json()["updated_document"]["url"] == asset_url
+    assert "published_url" not in response.json()["updated_document"]
+
+    # Published exactly once; reads and listings use the stored URL, editors the stored source
+    details = client.get(f"/documents/{document_id}/details").json()
+    assert details["url"] == asset_url
+    assert details["source_url"] == "http://s3.test/presigned"
+    assert [doc["url"] for doc in client.get("/documents/1").json()] == [asset_url]
+    assert len(httpx_mock.get_requests(method="POST")) == 1
+
+    # A failed publish leaves the document under review
+    other_id = client.post("/documents/1", json={"title": "Other", "description": "pytest doc"}).json()["id"]
+    client.post(f"/documents/{other_id}/submit-for-review", json={"reviewer_id": 2})
+    httpx_mock.add_response(method="POST", url=f"http://minio-api.test/publications/{other_id}/main.md", status_code=500)
+    response = client.post(f"/documents/{other_id}/review-action", json={"action": "approve", "rejection_reason": None})
+    assert response.status_code == 502
+    assert client.get(f"/documents/{other_id}/details").json()["status"] == "pending_review"
+
+def test_rendered_document(client, session, mock_user_context, httpx_mock, monkeypatch):
+    """Test that documents are rendered to sanitized HTML once per content."""
+    import minio
+    set_user_context(mock_user_context, user_id=2, realm_roles={"1": ["user"]})
+    document_id = client.post("/documents/1", json={"title": "Doc", "description": "pytest doc"}).json()["id"]
+
+    monkeypatch.setattr(minio, "MINIO_BASE_URL", "http://minio-api.test")
+    content_url = f"http://minio-api.test/content/{document_id}/main.md"
+    etag = '"' + "cd" * 32 + '"'
+    httpx_mock.add_response(method="HEAD", url=content_url, headers={"ETag": etag}, is_reusable=True)
+    httpx_mock.add_response(
+        method="GET",
+        url=content_url,
+        headers={"ETag": etag},
+        content=b"# Title\n\n<script>alert(1)</script>\n\n| a |\n|--:|\n| b |\n",
+    )
+    response = client.get(f"/documents/{document_id}/rendered")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/html")
+    assert "<h1>Title</h1>" in response.text
+    assert "<script>" not in response.text
+    assert 'style="text-align:right"' in response.text
+
+    # Served from the cache: the file is not downloaded again
+    etag = response.headers["etag"]
+    again = client.get(f"/documents/{document_id}/rendered")
+    assert again.text == response.text
+    assert len(httpx_mock.get_requests(method="GET", url=content_url)) == 1
+    assert client.get(f"/documents/{document_id}/rendered", headers={"If-None-Match": etag}).status_code == 304
+
+    # Other users may not read a draft
+    set_user_context(mock_user_context, user_id=3, realm_roles={"1": ["user"]})
+    assert client.get(f"/documents/{document_id}/rendered").status_code == 403
+
+def test_rendered_document_changed(client, session, mock_user_context, httpx_mock, monkeypatch):
+    """Test that a file is downloaded and rendered again once its ETag changes, and only then."""
+    import minio
+    set_user_context(mock_user_context, user_id=2, realm_roles={"1": ["user"]})
+    document_id = client.post("/documents/1", json={"title": "Doc", "description": "pytest doc"}).json()["id"]
+
+    monkeypatch.setattr(minio, "MINIO_BASE_URL", "http://minio-api.test")
+    content_url = f"http://minio-api.test/content/{document_id}/main.md"
+    versions = [('"legacy-v1"', b"# First\n")]
+    def content(request: httpx.Request) -> httpx.Response:
+        etag, data = versions[-1]
+        return httpx.Response(200, headers={"ETag": etag}, content=b"" if request.method == "HEAD" else data)
+
+    httpx_mock.add_callback(content, url=content_url, is_reusable=True)
+    assert "<h1>First</h1>" in client.get(f"/documents/{document_id}/rendered").text
+    assert "<h1>First</h1>" in client.get(f"/documents/{document_id}/rendered").text
+    versions.append(('"legacy-v2"', b"# Second\n"))
+    assert "<h1>Second</h1>" in client.get(f"/documents/{document_id}/rendered").text
+    assert len(httpx_mock.get_requests(method="GET", url=content_url)) == 2
+
+def test_rendered_published_document(client, session, mock_user_context, httpx_mock, monkeypatch):
+    """Test that published documents render their published rendition, cached by its hash."""
+    import minio
+    from main import render_cache
+    from rendering import render_cache_key
+    set_user_context(mock_user_context, user_id=2, realm_roles={"1": ["user", "reviewer"]})
+    monkeypatch.setattr(minio, "MINIO_BASE_URL", "http://minio-api.test")
+    httpx_mock.add_response(
+        method="GET",
+        url=re.compile(r"http://minio-api\.test/generate-read-url/\d+/main\.md"),
+        json={"url": "http://s3.test/presigned"},
+        is_reusable=True,
+    )
+    document_id = client.post("/documents/1", json={"title": "Doc", "description": "pytest doc"}).json()["id"]
+
+    sha256 = "ef" * 32
+    httpx_mock.add_response(
+        method="POST",
+        url=f"http://minio-api.test/publications/{document_id}/main.md",
+        json={"url": f"http://localhost:8080/minio-api/assets/{sha256}", "sha256": sha256},
+    )
+    client.post(f"/documents/{document_id}/submit-for-review", json={"reviewer_id": 2})
+    client.post(f"/documents/{document_id}/review-action", json={"action": "approve", "rejection_reason": None})
+    httpx_mock.add_response(
+        method="GET",
+        url=f"http://minio-api.test/assets/{sha256}",
+        content=b"# Published\n\n![a](/minio-api/assets/" + b"12" * 32 + b")\n",
+    )
+    response = client.get(f"/documents/{document_id}/rendered")
+    assert "<h1>Published</h1>" in response.text
+    assert "/minio-api/assets/" + "12" * 32 in response.text
+    assert response.headers["etag"] == f'"{render_cache_key(sha256)}"'
+    assert render_cache.get(render_cache_key(sha256)) == response.content
+
+    # Named by its hash: viewing it again neither probes nor downloads anything
+    requests = len(httpx_mock.get_requests())
+    assert client.get(f"/documents/{document_id}/rendered").text == response.text
+    assert len(httpx_mock.get_requests()) == requests
+    assert not httpx_mock.get_requests(url=re.compile(r".*/content/.*"))
+
 def test_get_document_review_history(client, session, mock_user_context):
     # Set user as 'reviewer' in realm '1'
     set_user_context(mock_user_context, user_id=2, realm_roles={"1": ["user", "reviewer"]})
@@ -247,4 +426,175 @@ def test_get_user_notifications_notify_rejected(client, session, mock_user_conte
     data = response.json()
     print(data)
     assert len(data) > 0
-    assert data[-1]["message"] == "Your document 'Test Doc' has been rejected in realm '1'. Reason: Not up to standards"
\ No newline at end of file
+    assert data[-1]["message"] == "Your document 'Test Doc' has been rejected in realm '1'. Reason: Not up to standards"
+
+def test_get_document_review_history_batch(client, session, mock_user_context):
+    # Set user as 'reviewer' in realm '1'
+    set_user_context(mock_user_context, user_id=2, realm_roles={"1": ["user", "reviewer"]})
+
+    # Create two documents, review the first one twice and leave the second unreviewed
+    for title in ["Doc A", "Doc B"]:
+        response = client.post("/documents/1", json={"title": title, "description": "pytest doc"})
+        assert response.status_code == 201
+
+    client.post("/documents/1/submit-for-review", json={"reviewer_id": 2})
+    client.post("/documents/1/review-action", json={"action": "reject", "rejection_reason": "Needs work"})
+    client.post("/documents/1/submit-for-review", json={"reviewer_id": 2})
+    client.post("/documents/1/review-action", json={"action": "approve", "rejection_reason": None})
+
+    response = client.post("/documents/review-history:batch", json={"document_ids": [2, 1, 2]})
+    assert response.status_code == 200
+    data = response.json()
+    assert [entry["document_id"] for entry in data] == [2, 1]
+    assert data[0]["review_records"] == []
+    assert [record["action"] for record in data[1]["review_records"]] == ["reject", "approve"]
+
+def test_get_document_review_history_batch_missing_and_unauthorized(client, session, mock_user_context):
+    set_user_context(mock_user_context, user_id=1, realm_roles={"1": ["user"]})
+    response = client.post("/documents/1", json={"title": "Test Doc", "description": "pytest doc"})
+    assert response.status_code == 201
+
+    response = client.post("/documents/review-history:batch", json={"document_ids": [1, 99]})
+    assert response.status_code == 404
+
+    # A user outside realm '1' who did not create the document cannot see its history
+    set_user_context(mock_user_context, user_id=3, realm_roles={"2": ["user"]})
+    response = client.post("/documents/review-history:batch", json={"document_ids": [1]})
+    assert response.status_code == 403
+
+def test_get_documents_visibility_branches(client, session, mock_user_context):
+    from models import Document
+    # Documents in realm '1': published by 3, draft by 1, pending review for 1 (by 3), draft by 3
+    session.add(Document(title="Published", creator_id=3, realm_id=1, status=DocumentStatus.PUBLISHED))
+    session.add(Document(title="Own Draft", creator_id=1, realm_id=1))
+    session.add(Document(title="Assigned", creator_id=3, realm_id=1, status=DocumentStatus.PENDING_REVIEW, current_reviewer_id=1))
+    session.add(Document(title="Other Draft", creator_id=3, realm_id=1))
+    # A document the user created and reviews must only be listed once
+    session.add(Document(title="Own Assigned", creator_id=1, realm_id=1, status=DocumentStatus.PENDING_REVIEW, current_reviewer_id=1))
+    session.commit()
+
+    set_user_context(mock_user_context, user_id=1, realm_roles={"1": ["user", "reviewer"]})
+    response = client.get("/documents/1")
+    assert response.status_code == 200
+    assert [doc["title"] for doc in response.json()] == ["Published", "Own Draft", "Assigned", "Own Assigned"]
+
+    # Pagination is applied to the merged, id-ordered result
+    response = client.get("/documents/1", params={"limit": 2, "offset": 1})
+    assert [doc["title"] for doc in response.json()] == ["Own Draft", "Assigned"]
+
+    response = client.get("/documents/1", params={"status_filter": "published"})
+    assert [doc["title"] for doc in response.json()] == ["Published"]
+
+    # Without a role in the realm only published documents are visible
+    set_user_context(mock_user_context, user_id=1, realm_roles={"2": ["user"]})
+    response = client.get("/documents/1")
+    assert [doc["title"] for doc in response.json()] == ["Published"]
+
+    # Admins see the whole realm
+    set_user_context(mock_user_context, user_id=9, realm_roles={"1": ["admin"]})
+    response = client.get("/documents/1")
+    assert len(response.json()) == 5
+
+def test_archive_and_unarchive_document(client, session, mock_user_context):
+    set_user_context(mock_user_context, user_id=1, realm_roles={"1": ["user", "reviewer"]})
+    response = client.post("/documents/1", json={"title": "Test Doc", "description": "pytest doc"})
+    assert response.status_code == 201
+    client.post("/documents/1/submit-for-review", json={"reviewer_id": 1})
+
+    # A document under review cannot be archived
+    response = client.post("/documents/1/archive")
+    assert response.status_code == 409
+
+    client.post("/documents/1/review-action", json={"action": "approve", "rejection_reason": None})
+    response = client.post("/documents/1/archive")
+    assert response.status_code == 200
+    assert response.json()["status"] == "archived"
+
+    # Archived documents leave the default listing and show up in the archive listing
+    assert client.get("/documents/1").json() == []
+    archived = client.get("/documents/1/archive").json()
+    assert [doc["id"] for doc in archived] == [1]
+
+    # Other users keep access to the formerly published document
+    set_user_context(mock_user_context, user_id=5, realm_roles={"1": ["user"]})
+    assert client.get("/documents/1/details").status_code == 200
+    assert [doc["id"] for doc in client.get("/documents/1/archive").json()] == [1]
+    assert client.post("/documents/1/unarchive").status_code == 403
+
+    # Unarchiving a formerly published document publishes it again
+    set_user_context(mock_user_context, user_id=1, realm_roles={"1": ["user"]})
+    response = client.post("/documents/1/unarchive")
+    assert response.status_code == 200
+    assert response.json()["status"] == "published"
+    assert client.post("/documents/1/unarchive").status_code == 409
+
+def test_archive_stale_documents(session):
+    from datetime import datetime, timedelta, timezone
+    from models import Document
+    from archiver import archive_stale_documents
+
+    now = datetime.now(timezone.utc)
+    session.add(Document(title="Old", creator_id=1, realm_id=1, status=DocumentStatus.PUBLISHED, updated_at=now - timedelta(days=100)))
+    session.add(Document(title="Fresh", creator_id=1, realm_id=1, status=DocumentStatus.PUBLISHED, updated_at=now))
+    session.add(Document(title="Old Draft", creator_id=1, realm_id=1, updated_at=now - timedelta(days=100)))
+    session.commit()
+
+    assert archive_stale_documents(session, timedelta(days=30), now=now) == 1
+    statuses = {doc.title: doc.status for doc in session.exec(select(Document)).all()}
+    assert statuses == {
+        "Old": DocumentStatus.ARCHIVED,
+        "Fresh": DocumentStatus.PUBLISHED,
+        "Old Draft": DocumentStatus.DRAFT,
+    }
+
+def test_tokens_verified_against_cached_jwks(client, session, httpx_mock, monkeypatch):
+    """Test signature verification against the JWKS, with one refetch when auth rotates its key."""
+    import json
+    import jwt
+    import main
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from jwt.algorithms import RSAAlgorithm
+    from jwks import JWKSCache
+    from role_claims import encode_realm_roles
+
+    def new_key(kid):
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = json.loads(RSAAlgorithm.to_jwk(private_key.public_key()))
+        return private_key, {**jwk, "kid": kid, "alg": "RS256", "use": "sig"}
+
+    def sign(private_key, kid, **claims):
+        claims = {"uid": 1, "rr": encode_realm_roles({"1": ["user"]}), **claims}
+        return jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": kid})
+
+    def get_documents(token):
+        return client.get("/documents/1", headers={"Authorization": f"Bearer {token}"})
+
+    old_key, old_jwk = new_key("old")
+    new_private_key, new_jwk = new_key("new")
+    cache = JWKSCache("http://auth.test/.well-known/jwks.json", refresh_interval=300, min_refresh_interval=30)
+    monkeypatch.setattr(main, "jwks_cache", cache)
+    cache.set_keys({"keys": [old_jwk]})
+
+    # Verified from memory, no call to the auth service
+    assert get_documents(sign(old_key, "old")).status_code == 200
+    # Roles come from the compact claim
+    document = {"title": "Doc", "description": "pytest"}
+    for realm_roles, expected in (({"1": ["user"]}, 201), ({"2": ["user"]}, 403)):
+        token = sign(old_key, "old", rr=encode_realm_roles(realm_roles))
+        response = client.post("/documents/1", json=document, headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == expected
+    assert get_documents(sign(old_key, "old", rr="1.AA")).status_code == 401
+    # Tokens issued before the compact role claim still work
+    legacy_claims = {"realm_roles": {"1": ["user"]}}
+    assert get_documents(jwt.encode({"uid": 1, **legacy_claims}, old_key, algorithm="RS256", headers={"kid": "old"})).status_code == 200
+    assert get_documents(sign(new_private_key, "old")).status_code == 401
+    assert get_documents(jwt.encode({"uid": 1}, "a-shared-secret-that-is-long-enough-for-hs256", algorithm="HS256", headers={"kid": "old"})).status_code == 401
+    assert not httpx_mock.get_requests()
+
+    # A token signed with a rotated-in key refreshes the key set once
+    httpx_mock.add_response(url=cache.url, json={"keys": [new_jwk, old_jwk]})
+    assert get_documents(sign(new_private_key, "new")).status_code == 200
+    assert get_documents(sign(new_private_key, "new")).status_code == 200
+    # Unknown key ids do not refetch again within the minimum refresh interval
+    assert get_documents(sign(new_private_key, "forged")).status_code == 401
+    assert len(httpx_mock.get_requests()) == 1
@@ -0,0 +1,154 @@
+from typing import List, Optional
+from sqlalchemy import false, or_, union_all
+from sqlmodel import select
+from sqlmodel.sql.expression import SelectOfScalar
+
+from models import Document, DocumentStatus, UserRoles
+
+# --- Visibility Query Planner ---
+# A non-admin sees published documents, their own documents (role 'user') and documents assigned
+# to them for review (role 'reviewer'). Written as a single `status = ... OR creator_id = ... OR
+# current_reviewer_id = ...` filter, Postgres can rarely use an index on large realms and falls back
+# to scanning the whole realm. Instead every visibility rule becomes its own branch that matches one
+# composite index on Document (see Document.__table_args__). Branches are made disjoint so they can
+# be combined with UNION ALL (no de-duplication pass), each branch is cut at `offset + limit` rows in
+# id order, and the merged ids are ordered and paginated before the page of documents is loaded.
+
+
+def build_visible_documents_query(
+    realm_id: int,
+    user_context: UserRoles,
+    status_filter: Optional[DocumentStatus] = None,
+    creator_id_filter: Optional[int] = None,
+    limit: int = 100,
+    offset: int = 0,
+) -> SelectOfScalar[Document]:
+    """
+    Builds the query listing the non-archived documents of a realm that the user may see, ordered by id.
+
+    Args:
+        realm_id: The realm whose documents are listed.
+        user_context: Roles of the authenticated user.
+        status_filter: Optional document status filter.
+        creator_id_filter: Optional creator filter.
+        limit: Maximum number of documents to return.
+        offset: Number of documents to skip.
+
+    Returns:
+        A select statement yielding Document rows.
+    """
+    realm_key = str(realm_id)
+    # Archived documents only show up in the archive listing (build_archived_documents_query).
+    # The predicate is spelled exactly like the partial indexes' WHERE clause so they can be used.
+    filters = [Document.realm_id == realm_id, Document.status != DocumentStatus.ARCHIVED]
+    if status_filter:
+        filters.append(Document.status == status_filter)
+    if creator_id_filter:
+        filters.append(Document.creator_id == creator_id_filter)
+
+    # Admins see the whole realm, which the (realm_id, id) index already serves
+    if user_context.has_role_in_realm(realm_key, "admin"):
+        return select(Document).where(*filters).order_by(Document.id).offset(offset).limit(limit)
+
+    branches = []
+    # 1. Published documents are visible to everyone
+    if status_filter in (None, DocumentStatus.PUBLISHED):
+        branches.append([Document.status == DocumentStatus.PUBLISHED])
+
+    # The remaining branches only cover unpublished documents, so they never overlap branch 1
+    if status_filter != DocumentStatus.PUBLISHED:
+        is_user = user_context.has_role_in_realm(realm_key, "user")
+        is_reviewer = user_context.has_role_in_realm(realm_key, "reviewer")
+        # 2. Users see their own documents
+        if is_user:
+            branches.append([
+                Document.creator_id == user_context.user_id,
+                Document.status != DocumentStatus.PUBLISHED,
+            ])
+        # 3. Reviewers see documents assigned to them, minus the ones branch 2 already returns
+        if is_reviewer:
+            conditions = [
+                Document.current_reviewer_id == user_context.user_id,
+                Document.status != DocumentStatus.PUBLISHED,
+            ]
+            if is_user:
+                conditions.append(Document.creator_id != user_context.user_id)
+            branches.append(conditions)
+
+    if not branches:
+        # e.g. a status filter that no visibility rule can satisfy
+        return select(Document).where(false())
+
+    # Every branch only needs to supply enough ids to fill the requested page
+    branch_limit = offset + limit
+    branch_selects = []
+    for conditions in branches:
+        branch = (
+            select(Document.id)
+            .where(*filters, *conditions)
+            .order_by(Document.id)
+            .limit(branch_limit)
+            .subquery()
+        )
+        branch_selects.append(select(branch.c.id))
+
+    if len(branch_selects) == 1:
+        merged_ids = branch_selects[0].subquery()
+    else:
+        merged_ids = union_all(*branch_selects).subquery()
+
+    # Paginate on the ids alone so only the final page of documents is loaded
+    page_ids = (
+        select(merged_ids.c.id)
+        .order_by(merged_ids.c.id)
+        .offset(offset)
+        .limit(limit)
+        .subquery()
+    )
+    return (
+        select(Document)
+        .join(page_ids, Document.id == page_ids.c.id)
+        .order_by(Document.id)
+    )
+
+
+def build_archived_documents_query(
+    realm_id: int,
+    user_context: UserRoles,
+    limit: int = 100,
+    offset: int = 0,
+) -> SelectOfScalar[Document]:
+    """
+    Builds the query listing the archived documents of a realm that the user may see, ordered by id.
+
+    Admins see every archived document; everyone else sees archived documents that had been
+    published, plus their own. The OR here only filters rows of the small archived partial index.
+    """
+    query = select(Document).where(Document.realm_id == realm_id, Document.status == DocumentStatus.ARCHIVED)
+    if not user_context.has_role_in_realm(str(realm_id), "admin"):
+        query = query.where(or_(
+            Document.published_at.is_not(None),
+            Document.creator_id == user_context.user_id,
+        ))
+    return query.order_by(Document.id).offset(offset).limit(limit)
+
+
+def build_legacy_visible_documents_query(
+    realm_id: int,
+    user_context: UserRoles,
+    limit: int = 100,
+    offset: int = 0,
+) -> SelectOfScalar[Document]:
+    """
+    The original single-OR visibility filter, kept for benchmarking against the planner above.
+    """
+    realm_key = str(realm_id)
+    query = select(Document).where(Document.realm_id == realm_id)
+    if not user_context.has_role_in_realm(realm_key, "admin"):
+        auth_conditions: List = [Document.status == DocumentStatus.PUBLISHED]
+        if user_context.has_role_in_realm(realm_key, "user"):
+            auth_conditions.append(Document.creator_id == user_context.user_id)
+        if user_context.has_role_in_realm(realm_key, "reviewer"):
+            auth_conditions.append(Document.current_reviewer_id == user_context.user_id)
+        query = query.where(or_(*auth_conditions))
+    return query.order_by(Document.id).offset(offset).limit(limit)
@@ -1,7 +1,55 @@
 import axios from "axios";
+import { authStore } from "../store/auth";
 
 const apiBase = import.meta.env.VITE_API_BASE_URL;
 
+// Role bits of the compact "rr" claim, in the order auth assigns them (auth/role_claims.py)
+const ROLE_BITS = [
+  ["user", 1],
+  ["reviewer", 2],
+  ["admin", 4],
+];
+
+// Unpacks the "rr" claim: "1." + base64url varints of (group id delta << 3 | role mask)
+const decodeRealmRoles = (claim) => {
+  const [version, encoded] = claim.split(".");
+  if (version !== "1") {
+    throw new Error(`Unsupported role claim version ${version}`);
+  }
+  const binary = atob(encoded.replace(/-/g, "+").replace(/_/g, "/"));
+  const realmRoles = {};
+  let groupId = 0;
+  let value = 0;
+  let multiplier = 1;
+  for (let i = 0; i < binary.length; i++) {
+    const byte = binary.charCodeAt(i);
+    value += (byte & 0x7f) * multiplier;
+    if (byte & 0x80) {
+      multiplier *= 128;
+      continue;
+    }
+    const mask = value % 8;
+    groupId += Math.floor(value / 8);
+    realmRoles[String(groupId)] = ROLE_BITS.filter(([, bit]) => mask & bit).map(
+      ([role]) => role
+    );
+    value = 0;
+    multiplier = 1;
+  }
+  return realmRoles;
+};
+
+// Decodes the JWT payload, with realm_roles unpacked from the compact role claim
+export const decodeToken = (token) => {
+  const payload = JSON.parse(
+    atob(token.split(".")[1].replace(/-/g, "+").replace(/_/g, "/"))
+  );
+  if (payload.rr) {
+    payload.realm_roles = decodeRealmRoles(payload.rr);
+  }
+  return payload;
+};
+
 const api = axios.create({
   baseURL: apiBase,
   headers: {
@@ -17,7 +65,7 @@ api.interceptors.request.use((config) => {
     config.headers.Authorization = `Bearer ${token}`;
 
     try {
-      const payload = JSON.parse(atob(token.split(".")[1]));
+      const payload = decodeToken(token);
     } catch (error) {
       console.error("Error parsing JWT:", error);
     }
@@ -25,9 +73,50 @@ api.interceptors.request.use((config) => {
   return config;
 });
 
+// Exchanges the refresh token for a new access token; concurrent 401s share one refresh
+let refreshing = null;
+const refreshAccessToken = () => {
+  if (!refreshing) {
+    refreshing = axios
+      .post(`${apiBase}/auth/token/refresh`, {
+        refresh_token: authStore.refreshToken,
+      })
+      .then((response) => {
+        authStore.setToken(response.data.access_token);
+        authStore.setRefreshToken(response.data.refresh_token);
+        return response.data.access_token;
+      })
+      .catch((error) => {
+        authStore.setRefreshToken(null);
+        throw error;
+      })
+      .finally(() => {
+        refreshing = null;
+      });
+  }
+  return refreshing;
+};
+
 api.interceptors.response.use(
   (response) => response,
-  (error) => {
+  async (error) => {
+    const config = error.config;
+    if (
+      error.response?.status === 401 &&
+      authStore.refreshToken &&
+      config &&
+      !config._retried
+    ) {
+      config._retried = true;
+      try {
+        const accessToken = await refreshAccessToken();
+        config.headers.Authorization = `Bearer ${accessToken}`;
+        return api(config);
+      } catch (refreshError) {
+        console.error("Token refresh failed:", refreshError);
+      }
+    }
+
     console.error("API Error:", {
       status: error.response?.status,
       url: error.config?.url,
@@ -54,7 +143,7 @@ export const documentService = {
         throw new Error("No authentication token");
       }
 
-      const payload = JSON.parse(atob(token.split(".")[1]));
+      const payload = decodeToken(token);
       const realmIds = Object.keys(payload.realm_roles || {});
       if (realmIds.length === 0) {
         console.warn("No realm IDs found in token");
@@ -121,8 +210,11 @@ export const documentService = {
     }
   },
 
-  updateDocument(id, data) {
-    return api.put(`/flow/documents/${id}`, data);
+  // `size` of the content to upload; large content gets a multipart session
+  updateDocument(id, data, size) {
+    return api.put(`/flow/documents/${id}`, data, {
+      params: size === undefined ? {} : { size },
+    });
   },
 
   updateDocumentFields(id, updateData) {
@@ -181,6 +273,13 @@ export const documentService = {
     return response.text();
   },
 
+  async getRenderedDocument(id) {
+    const response = await api.get(`/flow/documents/${id}/rendered`, {
+      responseType: "text",
+    });
+    return response.data;
+  },
+
   async getDocumentReviewHistory(id) {
     try {
       const response = await api.get(`/flow/documents/${id}/review-history`);
@@ -193,6 +292,15 @@ export const documentService = {
 };
 
 export const authService = {
+  revokeRefreshToken(refreshToken) {
+    if (!refreshToken) {
+      return Promise.resolve();
+    }
+    return api
+      .post("/auth/token/revoke", { refresh_token: refreshToken })
+      .catch((error) => console.error("Error revoking refresh token:", error));
+  },
+
   getGroupNames() {
     return api.get("/auth/admin/groups/names");
   },
@@ -203,6 +311,28 @@ export const authService = {
       .then((response) => response.data.username);
   },
 
+  // Resolves many user ids at once; returns { [id]: username }, omitting unknown ids
+  lookupUsernames(userIds) {
+    const ids = [...new Set(userIds)].sort((a, b) => a - b);
+    if (ids.length === 0) {
+      return Promise.resolve({});
+    }
+    return api
+      .get("/auth/admin/users/lookup", { params: { ids: ids.join(",") } })
+      .then((response) => response.data);
+  },
+
+  // Resolves many group ids at once; returns { [id]: group_name }, omitting unknown ids
+  lookupGroupNames(groupIds) {
+    const ids = [...new Set(groupIds)].sort((a, b) => a - b);
+    if (ids.length === 0) {
+      return Promise.resolve({});
+    }
+    return api
+      .get("/auth/admin/groups/lookup", { params: { ids: ids.join(",") } })
+      .then((response) => response.data);
+  },
+
   getGroupReviewers(groupId) {
     return api
       .get(`/auth/admin/groups/${groupId}/reviewers`)
@@ -291,6 +421,16 @@ export const notificationService = {
   },
 };
 
+// Files from this size on are uploaded in parts, like documents from the flow service's
+// MULTIPART_THRESHOLD_BYTES on
+export const MULTIPART_THRESHOLD = 16 * 1024 * 1024;
+// Parts uploaded at once
+const PART_CONCURRENCY = 4;
+// Attempts per part, each on a freshly presigned URL after the first
+const PART_ATTEMPTS = 3;
+// Part URLs requested at once (minio-api's MULTIPART_PRESIGN_BATCH)
+const PART_URL_BATCH = 100;
+
 export const fileService = {
   async generateUploadUrl(uid, filename) {
     const response = await api.post(`/minio-api/generate-upload-url/${uid}`, {
@@ -298,4 +438,104 @@ export const fileService = {
     });
     return response.data;
   },
+
+  // Stores an uploaded file under the hash of its content; returns the hash. Optional, since
+  // minio-api also finalizes uploads on its own.
+  async finalizeUpload(uid, filename, uploadId) {
+    const response = await api.post(
+      `/minio-api/uploads/${uid}/${filename}/${uploadId}/finalize`
+    );
+    return response.data;
+  },
+
+  // Starts a multipart upload; the session has the same shape as a document's `multipart`
+  async initiateMultipartUpload(uid, filename, size, contentType) {
+    const response = await api.post(
+      `/minio-api/multipart-uploads/${uid}/${filename}`,
+      { size, content_type: contentType }
+    );
+    return {
+      ...response.data,
+      path: `/multipart-uploads/${uid}/${filename}/${response.data.upload_id}`,
+    };
+  },
+
+  async presignParts(session, partNumbers) {
+    const response = await api.post(`/minio-api${session.path}/part-urls`, {
+      part_numbers: partNumbers,
+    });
+    return response.data.parts;
+  },
+
+  async listUploadedParts(session) {
+    const response = await api.get(`/minio-api${session.path}/parts`);
+    return response.data.parts;
+  },
+
+  async completeMultipartUpload(session) {
+    const response = await api.post(`/minio-api${session.path}/complete`, {});
+    return response.data;
+  },
+
+  abortMultipartUpload(session) {
+    return api.delete(`/minio-api${session.path}`);
+  },
+
+  // Uploads `blob` in the session's parts, PART_CONCURRENCY at a time, then completes the
+  // upload. With `resume`, parts MinIO already has from an interrupted attempt are skipped.
+  async uploadMultipart(session, blob, { resume = false } = {}) {
+    const uploaded = new Set();
+    if (resume) {
+      for (const part of await this.listUploadedParts(session)) {
+        uploaded.add(part.part_number);
+      }
+    }
+    const pending = [];
+    for (let partNumber = 1; partNumber <= session.part_count; partNumber++) {
+      if (!uploaded.has(partNumber)) {
+        pending.push(partNumber);
+      }
+    }
+    const urls = new Map(session.parts.map((part) => [part.part_number, part.url]));
+    const presign = async (partNumbers) => {
+      for (const part of await this.presignParts(session, partNumbers)) {
+        urls.set(part.part_number, part.url);
+      }
+    };
+
+    let next = 0;
+    const worker = async () => {
+      while (next < pending.length) {
+        const index = next++;
+        const partNumber = pending[index];
+        if (!urls.has(partNumber)) {
+          await presign(
+            pending
+              .slice(index, index + PART_URL_BATCH)
+              .filter((number) => !urls.has(number))
+          );
+        }
+        const start = (partNumber - 1) * session.part_size;
+        const body = blob.slice(start, start + session.part_size);
+        for (let attempt = 1; ; attempt++) {
+          const response = await fetch(urls.get(partNumber), {
+            method: "PUT",
+            body,
+          }).catch(() => null);
+          if (response && response.ok) {
+            break;
+          }
+          if (attempt >= PART_ATTEMPTS) {
+            throw new Error(`Upload of part ${partNumber} failed`);
+          }
+          // The URL may have expired
+          await presign([partNumber]);
+        }
+      }
+    };
+    await Promise.all(
+      Array.from({ length: Math.min(PART_CONCURRENCY, pending.length) }, worker)
+    );
+    return this.completeMultipartUpload(session);
+  },
 };
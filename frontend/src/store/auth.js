@@ -10,4 +10,13 @@ export const authStore = reactive({
       localStorage.removeItem("jwtToken");
     }
   },
+  refreshToken: localStorage.getItem("refreshToken") || null,
+  setRefreshToken(newToken) {
+    this.refreshToken = newToken;
+    if (newToken) {
+      localStorage.setItem("refreshToken", newToken);
+    } else {
+      localStorage.removeItem("refreshToken");
+    }
+  },
 });
@@ -0,0 +1,158 @@
+"""
+Local fake of Google's OAuth 2.0 / OpenID Connect endpoints.
+
+- GET  /o/oauth2/auth   approves immediately and redirects to redirect_uri with a code
+- POST /token           exchanges a code for an RS256-signed ID token
+- GET  /oauth2/v1/certs serves the signing certificate in Google's {kid: PEM} format
+
+A code of the form "user:<name>" logs in as <name>, so a load test can pick identities without
+going through the authorization redirect.
+"""
+import base64
+import json
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.x509.oid import NameOID
+
+KEY_ID = "fake-oauth-key-1"
+CERTS_MAX_AGE = 3600
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+class FakeOAuthProvider:
+    def __init__(self, issuer: str):
+        self.issuer = issuer
+        self.lock = threading.Lock()
+        self.operations = Counter()
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "fake-oauth")])
+        now = datetime.now(timezone.utc)
+        certificate = (
+            x509.CertificateBuilder()
+            .subject_name(subject)
+            .issuer_name(subject)
+            .public_key(self.private_key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - timedelta(days=1))
+            .not_valid_after(now + timedelta(days=30))
+            .sign(self.private_key, hashes.SHA256())
+        )
+        self.certs = {KEY_ID: certificate.public_bytes(serialization.Encoding.PEM).decode()}
+
+    def count(self, operation: str):
+        with self.lock:
+            self.operations[operation] += 1
+
+    def sign_id_token(self, name: str, audience: str) -> str:
+        now = int(time.time())
+        header = {"alg": "RS256", "kid": KEY_ID, "typ": "JWT"}
+        claims = {
+            "iss": self.issuer,
+            "aud": audience,
+            "sub": f"fake-{name}",
+            "email": f"{name}@example.com",
+            "name": name,
+            "iat": now,
+            "exp": now + 3600,
+        }
+        signing_input = f"{_b64url(json.dumps(header).encode())}.{_b64url(json.dumps(claims).encode())}"
+        signature = self.private_key.sign(signing_input.encode(), padding.PKCS1v15(), hashes.SHA256())
+        return f"{signing_input}.{_b64url(signature)}"
+
+
+class FakeOAuthHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    provider: FakeOAuthProvider = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path == "/oauth2/v1/certs":
+            self.provider.count("certs")
+            return self._send_json(200, self.provider.certs, {"Cache-Control": f"public, max-age={CERTS_MAX_AGE}"})
+        if parts.path == "/o/oauth2/auth":
+            self.provider.count("authorize")
+            query = parse_qs(parts.query)
+            name = query.get("login_hint", ["fake-user"])[0]
+            location = f"{query['redirect_uri'][0]}?{urlencode({'code': f'user:{name}'})}"
+            self.send_response(302)
+            self.send_header("Location", location)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._send_json(404, {"error": "not_found"})
+
+    def do_POST(self):
+        parts = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        form = parse_qs(self.rfile.read(length).decode()) if length else {}
+        if parts.path != "/token":
+            return self._send_json(404, {"error": "not_found"})
+        self.provider.count("token")
+        code = form.get("code", [""])[0]
+        if not code.startswith("user:"):
+            return self._send_json(400, {"error": "invalid_grant"})
+        name = code[len("user:"):]
+        audience = form.get("client_id", [""])[0]
+        self._send_json(200, {
+            "access_token": f"fake-access-{name}",
+            "token_type": "Bearer",
+            "expires_in": 3600,
+            "id_token": self.provider.sign_id_token(name, audience),
+        })
+
+
+class FakeOAuthServer:
+    """Runs the fake provider on a background thread."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.httpd = ThreadingHTTPServer((host, port), FakeOAuthHandler)
+        self.httpd.daemon_threads = True
+        self.provider = FakeOAuthProvider(issuer=self.url)
+        self.httpd.RequestHandlerClass = type("BoundFakeOAuthHandler", (FakeOAuthHandler,), {"provider": self.provider})
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="fake-oauth", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def service_env(self) -> dict:
+        """Environment for the auth service to use this provider instead of Google."""
+        return {
+            "GOOGLE_AUTH_URL": f"{self.url}/o/oauth2/auth",
+            "GOOGLE_TOKEN_URL": f"{self.url}/token",
+            "GOOGLE_CERTS_URL": f"{self.url}/oauth2/v1/certs",
+            "GOOGLE_ISSUERS": self.url,
+        }
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
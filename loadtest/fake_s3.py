@@ -0,0 +1,324 @@
+"""
+In-process S3/MinIO stand-in.
+
+Implements the subset of the S3 REST API that minio-api and the presigned URLs it hands out use:
+bucket location/existence/creation/listing, object PUT/GET/HEAD/DELETE (with ranges, If-Match and
+server-side copies) and multipart uploads (initiate, upload part, list parts, complete, abort).
+Signatures are not checked.
+Every request is counted per operation so a load test can report how much object-store traffic
+each journey caused, and can be delayed to model the round trip to a real object store.
+"""
+import hashlib
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from collections import Counter
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+S3_NS = "http://s3.amazonaws.com/doc/2006-03-01/"
+LOCATION_XML = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<LocationConstraint xmlns="http://s3.amazonaws.com/doc/2006-03-01/"></LocationConstraint>'
+)
+
+
+class FakeS3Store:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+        # upload id -> {"bucket", "key", "content_type", "parts": {part number: (data, etag)}}
+        self.uploads = {}
+        self.operations = Counter()
+
+    def count(self, operation: str):
+        with self.lock:
+            self.operations[operation] += 1
+
+    def put(self, bucket: str, key: str, data: bytes, content_type: str = "application/octet-stream") -> str:
+        etag = hashlib.md5(data).hexdigest()
+        with self.lock:
+            self.buckets.setdefault(bucket, {})[key] = {
+                "data": data,
+                "etag": etag,
+                "modified": time.time(),
+                "content_type": content_type,
+            }
+        return etag
+
+
+class FakeS3Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    store: FakeS3Store = None
+    latency: float = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def parse_request(self):
+        if self.latency:
+            time.sleep(self.latency)
+        return super().parse_request()
+
+    def _split(self):
+        parts = urlsplit(self.path)
+        path = unquote(parts.path).lstrip("/")
+        bucket, _, key = path.partition("/")
+        return bucket, key, parts.query
+
+    def _send(self, status: int, body: bytes = b"", headers: dict = None, include_body: bool = True):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if include_body and body:
+            self.wfile.write(body)
+
+    def _error(self, status: int, code: str, bucket: str, key: str, include_body: bool = True):
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f"<Error><Code>{code}</Code><Message>{code}</Message><Key>{key}</Key>"
+            f"<BucketName>{bucket}</BucketName><Resource>/{bucket}/{key}</Resource>"
+            "<RequestId>fake</RequestId><HostId>fake</HostId></Error>"
+        ).encode()
+        self._send(status, body, {"Content-Type": "application/xml"}, include_body)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _object_headers(self, obj: dict) -> dict:
+        return {
+            "ETag": f'"{obj["etag"]}"',
+            "Last-Modified": formatdate(obj["modified"], usegmt=True),
+            "Content-Type": obj["content_type"],
+        }
+
+    def do_GET(self):
+        bucket, key, query = self._split()
+        store = self.store
+        if not key:
+            store.count("get_bucket_location" if "location" in query else "list_objects")
+            if bucket not in store.buckets:
+                return self._error(404, "NoSuchBucket", bucket, key)
+            if "location" not in query:
+                return self._list_objects(bucket, parse_qs(query).get("prefix", [""])[0])
+            return self._send(200, LOCATION_XML.encode(), {"Content-Type": "application/xml"})
+        upload_id = parse_qs(query).get("uploadId", [None])[0]
+        if upload_id:
+            return self._list_parts(bucket, key, upload_id)
+        store.count("get_object")
+        obj = store.buckets.get(bucket, {}).get(key)
+        if obj is None:
+            return self._error(404, "NoSuchKey", bucket, key)
+        if_match = self.headers.get("If-Match")
+        if if_match and if_match.strip('"') != obj["etag"]:
+            return self._error(412, "PreconditionFailed", bucket, key)
+        byte_range = self.headers.get("Range")
+        if byte_range and byte_range.startswith("bytes="):
+            first, _, last = byte_range[len("bytes="):].partition("-")
+            end = min(int(last) + 1 if last else len(obj["data"]), len(obj["data"]))
+            headers = self._object_headers(obj)
+            headers["Content-Range"] = f"bytes {first}-{end - 1}/{len(obj['data'])}"
+            return self._send(206, obj["data"][int(first):end], headers)
+        self._send(200, obj["data"], self._object_headers(obj))
+
+    def do_HEAD(self):
+        bucket, key, _ = self._split()
+        store = self.store
+        if not key:
+            store.count("head_bucket")
+            return self._send(200 if bucket in store.buckets else 404, include_body=False)
+        store.count("head_object")
+        obj = store.buckets.get(bucket, {}).get(key)
+        if obj is None:
+            return self._send(404, include_body=False)
+        headers = self._object_headers(obj)
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(obj["data"])))
+        self.end_headers()
+
+    def do_PUT(self):
+        bucket, key, query = self._split()
+        store = self.store
+        data = self._read_body()
+        if not key:
+            store.count("make_bucket")
+            with store.lock:
+                store.buckets.setdefault(bucket, {})
+            return self._send(200)
+        params = parse_qs(query)
+        if "uploadId" in params:
+            return self._upload_part(bucket, key, params["uploadId"][0], int(params["partNumber"][0]), data)
+        if "x-amz-copy-source" in self.headers:
+            return self._copy_object(bucket, key)
+        store.count("put_object")
+        if bucket not in store.buckets:
+            return self._error(404, "NoSuchBucket", bucket, key)
+        etag = store.put(bucket, key, data, self.headers.get("Content-Type", "application/octet-stream"))
+        self._send(200, headers={"ETag": f'"{etag}"'})
+
+    def do_DELETE(self):
+        bucket, key, query = self._split()
+        store = self.store
+        upload_id = parse_qs(query).get("uploadId", [None])[0]
+        if upload_id:
+            store.count("abort_multipart_upload")
+            with store.lock:
+                upload = store.uploads.pop(upload_id, None)
+            if upload is None:
+                return self._error(404, "NoSuchUpload", bucket, key)
+            return self._send(204)
+        store.count("delete_object")
+        with store.lock:
+            store.buckets.get(bucket, {}).pop(key, None)
+        self._send(204)
+
+    def do_POST(self):
+        bucket, key, query = self._split()
+        store = self.store
+        data = self._read_body()
+        params = parse_qs(query, keep_blank_values=True)
+        if "uploads" in params:
+            store.count("create_multipart_upload")
+            if bucket not in store.buckets:
+                return self._error(404, "NoSuchBucket", bucket, key)
+            upload_id = uuid.uuid4().hex
+            with store.lock:
+                store.uploads[upload_id] = {
+                    "bucket": bucket,
+                    "key": key,
+                    "content_type": self.headers.get("Content-Type", "application/octet-stream"),
+                    "parts": {},
+                }
+            return self._xml("InitiateMultipartUploadResult", Bucket=bucket, Key=key, UploadId=upload_id)
+        if "uploadId" in params:
+            return self._complete_multipart_upload(bucket, key, params["uploadId"][0], data)
+        self._error(400, "InvalidRequest", bucket, key)
+
+    def _xml(self, root: str, children=(), **fields):
+        element = ET.Element(root, xmlns=S3_NS)
+        for name, value in fields.items():
+            ET.SubElement(element, name).text = str(value)
+        for child in children:
+            element.append(child)
+        body = b'<?xml version="1.0" encoding="UTF-8"?>' + ET.tostring(element)
+        self._send(200, body, {"Content-Type": "application/xml"})
+
+    def _copy_object(self, bucket: str, key: str):
+        self.store.count("copy_object")
+        source_bucket, _, source_key = unquote(self.headers["x-amz-copy-source"]).lstrip("/").partition("/")
+        source = self.store.buckets.get(source_bucket, {}).get(source_key)
+        if source is None:
+            return self._error(404, "NoSuchKey", source_bucket, source_key)
+        if_match = self.headers.get("x-amz-copy-source-if-match")
+        if if_match and if_match.strip('"') != source["etag"]:
+            return self._error(412, "PreconditionFailed", source_bucket, source_key)
+        etag = self.store.put(bucket, key, source["data"], source["content_type"])
+        modified = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+        self._xml("CopyObjectResult", ETag=f'"{etag}"', LastModified=modified)
+
+    def _list_objects(self, bucket: str, prefix: str):
+        # ListObjectsV2 in one page
+        with self.store.lock:
+            objects = sorted(self.store.buckets[bucket].items())
+        contents = []
+        for key, obj in objects:
+            if not key.startswith(prefix):
+                continue
+            content = ET.Element("Contents")
+            ET.SubElement(content, "Key").text = key
+            ET.SubElement(content, "LastModified").text = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(obj["modified"]))
+            ET.SubElement(content, "ETag").text = f'"{obj["etag"]}"'
+            ET.SubElement(content, "Size").text = str(len(obj["data"]))
+            contents.append(content)
+        self._xml("ListBucketResult", contents, Name=bucket, Prefix=prefix, KeyCount=len(contents), IsTruncated="false")
+
+    def _upload(self, bucket: str, key: str, upload_id: str):
+        upload = self.store.uploads.get(upload_id)
+        if upload is None or upload["bucket"] != bucket or upload["key"] != key:
+            self._error(404, "NoSuchUpload", bucket, key)
+            return None
+        return upload
+
+    def _upload_part(self, bucket: str, key: str, upload_id: str, part_number: int, data: bytes):
+        store = self.store
+        store.count("upload_part")
+        upload = self._upload(bucket, key, upload_id)
+        if upload is None:
+            return
+        etag = hashlib.md5(data).hexdigest()
+        with store.lock:
+            upload["parts"][part_number] = (data, etag)
+        self._send(200, headers={"ETag": f'"{etag}"'})
+
+    def _list_parts(self, bucket: str, key: str, upload_id: str):
+        self.store.count("list_parts")
+        upload = self._upload(bucket, key, upload_id)
+        if upload is None:
+            return
+        parts = []
+        for part_number, (data, etag) in sorted(upload["parts"].items()):
+            part = ET.Element("Part")
+            ET.SubElement(part, "PartNumber").text = str(part_number)
+            ET.SubElement(part, "ETag").text = f'"{etag}"'
+            ET.SubElement(part, "Size").text = str(len(data))
+            parts.append(part)
+        self._xml("ListPartsResult", parts, Bucket=bucket, Key=key, UploadId=upload_id, IsTruncated="false")
+
+    def _complete_multipart_upload(self, bucket: str, key: str, upload_id: str, body: bytes):
+        store = self.store
+        store.count("complete_multipart_upload")
+        upload = self._upload(bucket, key, upload_id)
+        if upload is None:
+            return
+        requested = [
+            (int(part.findtext("{*}PartNumber")), part.findtext("{*}ETag").strip('"'))
+            for part in ET.fromstring(body).findall("{*}Part")
+        ]
+        data = []
+        for part_number, etag in requested:
+            stored = upload["parts"].get(part_number)
+            if stored is None or stored[1] != etag:
+                return self._error(400, "InvalidPart", bucket, key)
+            data.append(stored[0])
+        with store.lock:
+            store.uploads.pop(upload_id, None)
+        store.put(bucket, key, b"".join(data), upload["content_type"])
+        self._xml("CompleteMultipartUploadResult", Bucket=bucket, Key=key, ETag=f'"{upload_id}-{len(requested)}"')
+
+
+class FakeS3Server:
+    """
+    Runs the stand-in on a background thread. Use `endpoint` (host:port) as MINIO_ENDPOINT.
+    Every request is answered `latency` seconds late.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.store = FakeS3Store()
+        handler = type("BoundFakeS3Handler", (FakeS3Handler,), {"store": self.store, "latency": latency})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="fake-s3", daemon=True)
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"{host}:{port}"
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.endpoint}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,170 @@
+"""
+Scripted user journeys and the metrics they record.
+
+One journey is what a user does in a session: log in (password or Google OAuth), list the
+documents of every realm, open a document and read it rendered, write a new document
+(markdown plus an image), submit it for review, review it and read their notifications.
+"""
+import random
+import statistics
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+
+PASSWORD = "loadtest-password"
+MARKDOWN = ("# Load test document\n\n" + "Lorem ipsum dolor sit amet. " * 40 + "\n").encode()
+IMAGE = bytes(range(256)) * 64
+
+
+class JourneyError(Exception):
+    pass
+
+
+class Recorder:
+    """Thread-safe collection of (service, step, latency, ok) samples."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.journeys = 0
+        self.failed_journeys = 0
+
+    def record(self, service: str, step: str, latency_ms: float, ok: bool):
+        with self.lock:
+            self.samples[(service, step)].append(latency_ms)
+            if not ok:
+                self.errors[(service, step)] += 1
+
+    def journey_done(self, ok: bool):
+        with self.lock:
+            self.journeys += 1
+            if not ok:
+                self.failed_journeys += 1
+
+    @staticmethod
+    def _stats(latencies: List[float], errors: int, seconds: float) -> dict:
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+        return {
+            "requests": len(latencies),
+            "errors": errors,
+            "error_rate": round(errors / len(latencies), 4),
+            "p50_ms": round(percentiles[49], 2),
+            "p95_ms": round(percentiles[94], 2),
+            "p99_ms": round(percentiles[98], 2),
+            "throughput_rps": round(len(latencies) / seconds, 2),
+        }
+
+    def report(self, seconds: float) -> dict:
+        by_service = defaultdict(list)
+        service_errors = defaultdict(int)
+        steps = {}
+        for (service, step), latencies in sorted(self.samples.items()):
+            by_service[service].extend(latencies)
+            service_errors[service] += self.errors[(service, step)]
+            steps[f"{service} {step}"] = self._stats(latencies, self.errors[(service, step)], seconds)
+        return {
+            "seconds": round(seconds, 2),
+            "journeys": self.journeys,
+            "failed_journeys": self.failed_journeys,
+            "journeys_per_second": round(self.journeys / seconds, 2),
+            "services": {
+                service: self._stats(latencies, service_errors[service], seconds)
+                for service, latencies in by_service.items()
+            },
+            "steps": steps,
+        }
+
+
+class Journey:
+    def __init__(self, client: httpx.Client, urls: Dict[str, str], recorder: Recorder, rng: random.Random):
+        self.client = client
+        self.urls = urls
+        self.recorder = recorder
+        self.rng = rng
+        self.headers: Dict[str, str] = {}
+
+    def call(self, service: str, step: str, method: str, url: str, expected=(200, 201), **kwargs) -> httpx.Response:
+        """Issues one request, timing it under `service`/`step`. `service` may be 's3' for presigned URLs."""
+        if not url.startswith("http"):
+            url = f"{self.urls[service]}{url}"
+        start = time.perf_counter()
+        try:
+            response = self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.recorder.record(service, step, (time.perf_counter() - start) * 1000, False)
+            raise JourneyError(f"{step}: {e}") from e
+        ok = response.status_code in expected
+        self.recorder.record(service, step, (time.perf_counter() - start) * 1000, ok)
+        if not ok:
+            raise JourneyError(f"{step}: HTTP {response.status_code}")
+        return response
+
+    # --- Steps ---
+    def login_password(self, username: str) -> str:
+        response = self.call("auth", "login", "POST", "/login", data={"username": username, "password": PASSWORD})
+        return response.json()["access_token"]
+
+    def login_oauth(self, name: str) -> str:
+        response = self.call("auth", "oauth callback", "GET", "/oauth/google/callback",
+                             expected=(302, 307), params={"code": f"user:{name}"})
+        location = response.headers["location"]
+        return parse_qs(urlsplit(location).fragment)["token"][0]
+
+    def list_realms(self) -> List[dict]:
+        names = self.call("auth", "group names", "GET", "/admin/groups/names", headers=self.headers).json()
+        documents = []
+        for realm_id in names:
+            documents.extend(self.call("flow", "list documents", "GET", f"/documents/{realm_id}", headers=self.headers).json())
+        return documents
+
+    def open_document(self, document: dict):
+        details = self.call("flow", "document details", "GET", f"/documents/{document['id']}/details", headers=self.headers).json()
+        if details.get("url", "").startswith("http"):
+            # As the viewer does: flow fetches and renders the markdown, once per content
+            self.call("flow", "rendered document", "GET", f"/documents/{document['id']}/rendered", headers=self.headers)
+
+    def write_document(self, realm_id: str) -> int:
+        created = self.call("flow", "create document", "POST", f"/documents/{realm_id}",
+                            json={"title": "Load test", "description": "load test document"}, headers=self.headers).json()
+        document_id = created["id"]
+        upload = self.call("flow", "upload url", "PUT", f"/documents/{document_id}", headers=self.headers).json()
+        if upload.get("url", "").startswith("http"):
+            self.call("s3", "upload markdown", "PUT", upload["url"], content=MARKDOWN)
+        image = self.call("minio-api", "image upload url", "POST", f"/generate-upload-url/{document_id}",
+                          json={"filename": "figure.png"}).json()
+        self.call("s3", "upload image", "PUT", image["url"], content=IMAGE)
+        self.call("flow", "edit document", "PATCH", f"/documents/{document_id}",
+                  json={"title": "Load test (edited)"}, headers=self.headers)
+        return document_id
+
+    def submit_and_review(self, document_id: int, user_id: int):
+        self.call("flow", "submit for review", "POST", f"/documents/{document_id}/submit-for-review",
+                  json={"reviewer_id": user_id}, headers=self.headers)
+        self.call("flow", "review", "POST", f"/documents/{document_id}/review-action",
+                  json={"action": "approve"}, headers=self.headers)
+
+    def notifications(self):
+        self.call("flow", "notifications", "GET", "/notifications", headers=self.headers)
+
+    # --- Whole journey ---
+    def run(self, username: str, oauth: bool, writable_realm: Optional[str]):
+        token = self.login_oauth(username) if oauth else self.login_password(username)
+        self.headers = {"Authorization": f"Bearer {token}"}
+        payload = self.call("auth", "me", "GET", "/me", params={"token": token}).json()
+
+        documents = self.list_realms()
+        if documents:
+            self.open_document(self.rng.choice(documents))
+
+        realm_roles = payload.get("realm_roles", {})
+        realm_id = writable_realm if writable_realm in realm_roles else next(
+            (realm for realm, roles in realm_roles.items() if "user" in roles), None)
+        if realm_id is not None:
+            document_id = self.write_document(realm_id)
+            self.submit_and_review(document_id, payload["uid"])
+        self.notifications()
@@ -0,0 +1,226 @@
+"""
+End-to-end load test for the auth, flow and minio-api services.
+
+Starts an in-process S3/MinIO stand-in (fake_s3.py) and a fake Google OpenID provider
+(fake_oauth.py), launches the three services as local uvicorn processes wired to them (SQLite
+databases in a temporary directory), seeds users, then runs concurrent virtual users through the
+scripted journeys in journeys.py. Reports throughput, error rates and latency per service and per
+step, plus the object-store operations the run caused.
+
+To target services that are already running (e.g. the compose stack), pass --auth-url, --flow-url
+and --minio-url; the fakes are still started and their addresses printed so the stack can be
+pointed at them.
+
+Usage:
+    python run.py --users 10 --duration 30
+    python run.py --users 50 --duration 60 --oauth-share 0.3 --output results.json
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+import httpx
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from fake_oauth import FakeOAuthServer
+from fake_s3 import FakeS3Server
+from journeys import PASSWORD, Journey, JourneyError, Recorder
+
+ROOT = Path(__file__).resolve().parent.parent
+SERVICE_DIRS = {
+    "auth": ROOT / "backend" / "auth",
+    "flow": ROOT / "backend" / "flow",
+    "minio-api": ROOT / "minio" / "app",
+}
+GROUP_NAME = "loadtest"
+CLIENT_ID = "loadtest-client"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_service(name: str, port: int, env: dict, log_dir: Path) -> subprocess.Popen:
+    log = open(log_dir / f"{name}.log", "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=SERVICE_DIRS[name],
+        env={**os.environ, **env},
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+
+def wait_ready(url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/openapi.json", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"{url} did not become ready, see the service logs")
+
+
+def write_signing_key(workdir: Path) -> Path:
+    """Writes a throwaway RSA key for auth to sign access tokens with; flow fetches its JWKS."""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    path = workdir / "jwt_private_key.pem"
+    path.write_bytes(private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ))
+    return path
+
+
+def spawn_services(stack: ExitStack, fake_s3: FakeS3Server, fake_oauth: FakeOAuthServer, workdir: Path) -> dict:
+    ports = {name: free_port() for name in SERVICE_DIRS}
+    urls = {name: f"http://127.0.0.1:{port}" for name, port in ports.items()}
+    envs = {
+        "minio-api": {
+            "MINIO_ENDPOINT": fake_s3.endpoint,
+            "EXTERNAL_ENDPOINT": fake_s3.url,
+            "EXTERNAL_API_ENDPOINT": urls["minio-api"],
+            "MINIO_ACCESS_KEY": "loadtest",
+            "MINIO_SECRET_KEY": "loadtest",
+            "DERIVATIVE_WEBHOOK_TOKEN": "loadtest",
+        },
+        "auth": {
+            "DATABASE_URL": f"sqlite:///{workdir / 'auth.db'}",
+            "JWT_PRIVATE_KEY_FILE": str(write_signing_key(workdir)),
+            "GOOGLE_CLIENT_ID": CLIENT_ID,
+            "GOOGLE_CLIENT_SECRET": "loadtest",
+            "GOOGLE_REDIRECT_URI": f"{urls['auth']}/oauth/google/callback",
+            "FRONTEND_URL": "http://frontend.invalid",
+            "FRONTEND_REDIRECT_PATH": "/login",
+            # Every virtual user connects from 127.0.0.1; the per-username and CPU budgets still apply
+            "LOGIN_IP_BURST": "1000000",
+            **fake_oauth.service_env(),
+        },
+        "flow": {
+            "DATABASE_URL": f"sqlite:///{workdir / 'flow.db'}",
+            "AUTH_JWKS_URL": f"{urls['auth']}/.well-known/jwks.json",
+            "MINIO_BASE_URL": urls["minio-api"],
+        },
+    }
+    for name in ("minio-api", "auth", "flow"):
+        process = start_service(name, ports[name], envs[name], workdir)
+        stack.callback(process.wait)
+        stack.callback(process.terminate)
+        wait_ready(urls[name])
+    print(f"Services running, logs in {workdir}")
+    return urls
+
+
+def seed_users(auth_url: str, users: int) -> str:
+    """Creates the load-test group and its users (idempotent). Returns the group id as realm id."""
+    with httpx.Client(base_url=auth_url, timeout=60) as client:
+        client.post("/admin/groups/", json={"group_name": GROUP_NAME})
+        for i in range(users):
+            username = f"lt-user-{i}"
+            client.post("/admin/users/", json={"username": username, "password": PASSWORD})
+            client.post("/admin/groups/assign-roles", json={
+                "username": username, "group_name": GROUP_NAME, "roles": ["user", "reviewer"]
+            })
+        groups = client.get("/admin/groups/all/").json()
+    return next(str(group["id"]) for group in groups if group["group_name"] == GROUP_NAME)
+
+
+def virtual_user(index: int, args, urls: dict, realm_id: str, recorder: Recorder, deadline: float):
+    rng = random.Random(args.seed + index)
+    with httpx.Client(timeout=60) as client:
+        iteration = 0
+        while time.monotonic() < deadline and (not args.iterations or iteration < args.iterations):
+            oauth = rng.random() < args.oauth_share
+            username = f"lt-oauth-{index}" if oauth else f"lt-user-{index % args.users}"
+            journey = Journey(client, urls, recorder, rng)
+            try:
+                journey.run(username, oauth, realm_id)
+                recorder.journey_done(True)
+            except JourneyError as e:
+                recorder.journey_done(False)
+                if args.verbose:
+                    print(f"VU {index}: {e}")
+            iteration += 1
+            if args.think_time:
+                time.sleep(rng.uniform(0, 2 * args.think_time))
+
+
+def print_report(report: dict, s3_operations, oauth_operations):
+    print(f"\n{report['journeys']} journeys in {report['seconds']}s "
+          f"({report['journeys_per_second']}/s), {report['failed_journeys']} failed")
+    header = f"{'':<32} {'requests':>8} {'err%':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'rps':>8}"
+    for title, rows in (("Per service", report["services"]), ("Per step", report["steps"])):
+        print(f"\n{title}\n{header}")
+        for name, stats in rows.items():
+            print(f"{name:<32} {stats['requests']:>8} {stats['error_rate'] * 100:>5.1f}% "
+                  f"{stats['p50_ms']:>7.1f}ms {stats['p95_ms']:>7.1f}ms {stats['p99_ms']:>7.1f}ms {stats['throughput_rps']:>8.1f}")
+    print(f"\nObject store operations: {dict(s3_operations)}")
+    print(f"OAuth provider operations: {dict(oauth_operations)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run")
+    parser.add_argument("--iterations", type=int, default=0, help="Stop each virtual user after this many journeys (0: no limit)")
+    parser.add_argument("--oauth-share", type=float, default=0.2, help="Share of journeys logging in through the fake Google provider")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between journeys in seconds")
+    parser.add_argument("--auth-url")
+    parser.add_argument("--flow-url")
+    parser.add_argument("--minio-url")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the report as JSON")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    with ExitStack() as stack:
+        fake_s3 = FakeS3Server().start()
+        stack.callback(fake_s3.stop)
+        fake_oauth = FakeOAuthServer().start()
+        stack.callback(fake_oauth.stop)
+        print(f"Fake S3 at {fake_s3.url}, fake OAuth provider at {fake_oauth.url}")
+
+        if args.auth_url and args.flow_url and args.minio_url:
+            urls = {"auth": args.auth_url, "flow": args.flow_url, "minio-api": args.minio_url}
+        else:
+            workdir = Path(stack.enter_context(tempfile.TemporaryDirectory(prefix="loadtest-")))
+            urls = spawn_services(stack, fake_s3, fake_oauth, workdir)
+
+        realm_id = seed_users(urls["auth"], args.users)
+        s3_before = fake_s3.store.operations.copy()
+        recorder = Recorder()
+        start = time.monotonic()
+        deadline = start + args.duration
+        threads = [
+            threading.Thread(target=virtual_user, args=(i, args, urls, realm_id, recorder, deadline))
+            for i in range(args.users)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        report = recorder.report(time.monotonic() - start)
+        report["object_store_operations"] = dict(fake_s3.store.operations - s3_before)
+        report["oauth_operations"] = dict(fake_oauth.provider.operations)
+
+        print_report(report, report["object_store_operations"], report["oauth_operations"])
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark for concurrent read URL requests against minio-api.
+
+Runs the app in-process against the load test's S3 stand-in (loadtest/fake_s3.py), which answers
+every request --s3-latency-ms late to model the round trip to MinIO, and fires bursts of
+GET /generate-read-url requests at increasing numbers of requests in flight. Each request stats
+the object (EXISTENCE_CHECK=always) before presigning. The app's handler, which runs the SDK on
+the MinIO call pool, is compared with the previous variant that calls the SDK on the event loop.
+
+Usage:
+    python bench_concurrency.py --s3-latency-ms 20 --concurrency 1,4,16,64
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+OBJECTS = 256
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,4,16,64", help="Comma-separated requests in flight per burst")
+    parser.add_argument("--rounds", type=int, default=5, help="Bursts per variant and concurrency")
+    parser.add_argument("--s3-latency-ms", type=float, default=20.0, help="Delay added to every S3 request")
+    return parser.parse_args()
+
+
+def summarize(latencies, wall_seconds):
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(percentiles[49], 2),
+        "p95_ms": round(percentiles[94], 2),
+        "throughput_rps": round(len(latencies) / wall_seconds, 1),
+    }
+
+
+async def run_variant(app, path: str, filenames, concurrency: int, rounds: int):
+    import httpx
+
+    async def timed(client, filename, start=None):
+        # Measured from the start of the burst, since a blocked event loop delays sending too
+        start = start or time.perf_counter()
+        response = await client.get(path.format(filename=filename))
+        response.raise_for_status()
+        return (time.perf_counter() - start) * 1000
+
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        await timed(client, filenames[0])
+        start = time.perf_counter()
+        for round_index in range(rounds):
+            batch = [filenames[(round_index * concurrency + i) % len(filenames)] for i in range(concurrency)]
+            burst_start = time.perf_counter()
+            latencies.extend(await asyncio.gather(*(timed(client, filename, burst_start) for filename in batch)))
+        wall_seconds = time.perf_counter() - start
+    return summarize(latencies, wall_seconds)
+
+
+def main():
+    args = parse_args()
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "loadtest"))
+    from fake_s3 import FakeS3Server
+
+    fake_s3 = FakeS3Server(latency=args.s3_latency_ms / 1000).start()
+    os.environ.update({
+        "MINIO_ENDPOINT": fake_s3.endpoint,
+        "EXTERNAL_ENDPOINT": fake_s3.url,
+        "MINIO_ACCESS_KEY": "bench",
+        "MINIO_SECRET_KEY": "bench",
+        "EXISTENCE_CHECK": "always",
+        # The bench objects are stored as is, not content-addressed
+        "CONTENT_ADDRESSED_STORAGE": "false",
+        "DERIVATIVE_TRIGGER": "off",
+    })
+
+    from datetime import timedelta
+    from fastapi import HTTPException
+    from minio.error import S3Error
+
+    from main import BUCKET_NAME, app, minio_client, s3_calls
+
+    filenames = [f"bench-{i}.md" for i in range(OBJECTS)]
+    for filename in filenames:
+        fake_s3.store.put(BUCKET_NAME, f"bench/markdown/{filename}", b"# bench\n", "text/markdown")
+
+    @app.get("/bench/legacy/generate-read-url/{uid}/{filename}")
+    async def legacy_generate_read_url(uid: str, filename: str):
+        object_name = f"{uid}/markdown/{filename}"
+        try:
+            minio_client.stat_object(BUCKET_NAME, object_name)
+        except S3Error:
+            raise HTTPException(status_code=404, detail="File not found")
+        url = minio_client.presigned_get_object(BUCKET_NAME, object_name, expires=timedelta(seconds=3600))
+        return {"message": "Read URL generated successfully", "url": url}
+
+    variants = {
+        "async def, SDK on event loop": "/bench/legacy/generate-read-url/bench/{filename}",
+        "SDK on MinIO call pool": "/generate-read-url/bench/{filename}",
+    }
+    levels = [int(level) for level in args.concurrency.split(",")]
+    print(f"{args.rounds} bursts per level, {args.s3_latency_ms}ms added per S3 request, "
+          f"{s3_calls.max_workers} MinIO call workers")
+    for name, path in variants.items():
+        for concurrency in levels:
+            stats = asyncio.run(run_variant(app, path, filenames, concurrency, args.rounds))
+            print(f"{name:<30} in_flight={concurrency:<4} " + "  ".join(f"{key}={value}" for key, value in stats.items()))
+    print("".join(f"  {name} {value}\n" for name, value in s3_calls.metrics().items() if "stat_object" in name), end="")
+    s3_calls.shutdown()
+    fake_s3.stop()
+
+
+if __name__ == "__main__":
+    main()
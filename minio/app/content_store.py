@@ -0,0 +1,333 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from minio import Minio
+from minio.commonconfig import CopySource
+from minio.error import S3Error
+
+from existence import TTLCache, EXISTENCE_MISSING_TTL
+from s3_calls import S3CallExecutor
+
+# --- Content-Addressed Storage ---
+# Files are stored once per distinct content instead of once per key ({uid}/{folder}/{filename}):
+# - clients upload to a staging key, staging/{key}/{upload_id}, unique to each upload URL
+# - finalizing an upload hashes it, copies it to blobs/{sha256[:2]}/{sha256} unless that blob
+#   already exists, points the index entry index/{key} at the hash and deletes the staging object
+# - reads of a key follow its index entry to the blob; keys without one are read as they are, so
+#   files stored before this layout keep working
+# Uploads are finalized when the client asks, on bucket notifications or polls (DERIVATIVE_TRIGGER)
+# and at the latest when the key is next read: uploads this process handed out URLs for right
+# away, and on every index cache miss any upload found under staging/{key}/, so uploads through
+# another process, or from before a restart, are not hidden behind the previous content.
+# Blobs are never deleted, so a blob no longer referenced by any index entry stays in the bucket.
+CONTENT_ADDRESSED_STORAGE = os.getenv("CONTENT_ADDRESSED_STORAGE", "true").lower() == "true"
+# How long an index entry is remembered. Re-uploading a file changes it, so keep this short.
+CONTENT_INDEX_CACHE_TTL = float(os.getenv("CONTENT_INDEX_CACHE_TTL", "60"))
+CONTENT_INDEX_CACHE_SIZE = int(os.getenv("CONTENT_INDEX_CACHE_SIZE", "100000"))
+# Uploads are hashed in ranges of this size, one MinIO call each
+CONTENT_HASH_CHUNK_BYTES = int(os.getenv("CONTENT_HASH_CHUNK_BYTES", str(8 * 1024 * 1024)))
+# How long an upload found not uploaded yet is not looked for again by reads of its key, so upload
+# URLs that are never used do not cost a MinIO call on every read until they expire
+CONTENT_STAGED_RECHECK_SECONDS = float(os.getenv("CONTENT_STAGED_RECHECK_SECONDS", "2"))
+# Uploads finalized at once in the background
+CONTENT_FINALIZE_CONCURRENCY = int(os.getenv("CONTENT_FINALIZE_CONCURRENCY", "4"))
+
+BLOB_PREFIX = "blobs/"
+INDEX_PREFIX = "index/"
+STAGING_PREFIX = "staging/"
+
+
+@dataclass(frozen=True)
+class ContentRef:
+    """An index entry: the content a key points to."""
+
+    sha256: str
+    size: int
+    content_type: str
+    # Upload that wrote the entry; a finalized upload never replaces the entry of a later one
+    upload_id: str = ""
+
+
+def blob_object_name(sha256: str) -> str:
+    return f"{BLOB_PREFIX}{sha256[:2]}/{sha256}"
+
+
+def is_blob_object(object_name: str) -> bool:
+    return object_name.startswith(BLOB_PREFIX)
+
+
+def index_object_name(object_name: str) -> str:
+    return f"{INDEX_PREFIX}{object_name}"
+
+
+def new_upload_id() -> str:
+    # Ordered by the time the upload URL was issued
+    return f"{time.time_ns():020d}-{uuid.uuid4().hex[:12]}"
+
+
+def staging_object_name(object_name: str, upload_id: str) -> str:
+    return f"{STAGING_PREFIX}{object_name}/{upload_id}"
+
+
+def parse_staging_object_name(staging_name: str) -> Optional[Tuple[str, str]]:
+    """
+    Returns (key, upload id) of a staging key, or None if `staging_name` is not one.
+    """
+    if not staging_name.startswith(STAGING_PREFIX):
+        return None
+    object_name, _, upload_id = staging_name[len(STAGING_PREFIX):].rpartition("/")
+    return (object_name, upload_id) if object_name and upload_id else None
+
+
+class ContentStore:
+    """
+    Content-addressed layout of the bucket (see above). Remembers index entries, and the staging
+    keys this process handed out upload URLs for so reads of a key can finalize them first.
+    Finalizing an upload that is already being finalized waits for that instead.
+
+    on_finalized(object_name, ref, deduplicated) is called for every finalized upload that became
+    the key's content, e.g. to queue image variants of new content. Copies and the reads of an
+    upload's content go through `transfer_client` (by default `client`) with the transfer timeout.
+    """
+
+    def __init__(
+        self,
+        client: Minio,
+        bucket: str,
+        calls: S3CallExecutor,
+        on_finalized: Callable[[str, ContentRef, bool], None] = lambda object_name, ref, deduplicated: None,
+        transfer_client: Optional[Minio] = None,
+    ):
+        self.client = client
+        self.transfer_client = transfer_client or client
+        self.bucket = bucket
+        self.calls = calls
+        self.on_finalized = on_finalized
+        self.index_cache = TTLCache(CONTENT_INDEX_CACHE_SIZE)
+        # key -> {staging key: when its URL expires} of uploads not known to be finalized
+        self._staged = TTLCache(CONTENT_INDEX_CACHE_SIZE)
+        # Staging keys recently found not uploaded yet
+        self._not_uploaded = TTLCache(CONTENT_INDEX_CACHE_SIZE)
+        self._finalizing: Dict[str, asyncio.Future] = {}
+        self._background: Set[asyncio.Task] = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.finalized = 0
+        self.failed = 0
+        self.deduplicated = 0
+        self.bytes_deduplicated = 0
+
+    def new_upload(self, object_name: str, expires: int) -> str:
+        """
+        Start an upload of `object_name`: returns the upload id, whose staging key the client
+        uploads to within `expires` seconds.
+        """
+        upload_id = new_upload_id()
+        found, staged = self._staged.lookup(object_name)
+        staged = dict(staged) if found else {}
+        staged[staging_object_name(object_name, upload_id)] = time.monotonic() + expires
+        self._staged.store(object_name, staged, expires)
+        return upload_id
+
+    async def lookup(self, object_name: str) -> Optional[ContentRef]:
+        """
+        The content `object_name` points to, or None for a key without an index entry.
+        Uploads of the key this process handed out URLs for are finalized first, so a read
+        right after a write sees the new content, and on a cache miss so are any other uploads
+        of the key waiting in staging.
+        """
+        await self._finalize_staged(object_name)
+        found, ref = self.index_cache.lookup(object_name)
+        if found:
+            return ref
+        await self._finalize_listed(object_name)
+        ref = await self._read_index(object_name)
+        self.index_cache.store(object_name, ref, CONTENT_INDEX_CACHE_TTL if ref else EXISTENCE_MISSING_TTL)
+        return ref
+
+    async def finalize(self, staging_name: str) -> Optional[ContentRef]:
+        """
+        Finalize an upload: store its content under its SHA-256 unless stored already, point the
+        key at it and delete the staging object. Returns the content stored, or None if there is
+        no such upload (not uploaded yet, or finalized already).
+
+        Raises:
+            ValueError: If `staging_name` is not a staging key.
+        """
+        if parse_staging_object_name(staging_name) is None:
+            raise ValueError(f"Not a staging key: {staging_name}")
+        future = self._finalizing.get(staging_name)
+        if future is None:
+            future = asyncio.ensure_future(self._finalize(staging_name))
+            self._finalizing[staging_name] = future
+            future.add_done_callback(lambda _: self._finalizing.pop(staging_name, None))
+        # A caller that goes away does not abandon the upload half finalized
+        return await asyncio.shield(future)
+
+    def finalize_later(self, staging_name: str):
+        """
+        Finalize an upload in the background, CONTENT_FINALIZE_CONCURRENCY at a time.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(CONTENT_FINALIZE_CONCURRENCY)
+        task = asyncio.get_running_loop().create_task(self._finalize_in_background(staging_name))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def stop(self):
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        self._slots = None
+
+    async def _finalize_in_background(self, staging_name: str):
+        async with self._slots:
+            try:
+                await self.finalize(staging_name)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                print(f"Finalizing upload {staging_name} failed: {e!r}")
+
+    async def _finalize_staged(self, object_name: str):
+        found, staged = self._staged.lookup(object_name)
+        for staging_name in list(staged) if found else []:
+            if self._not_uploaded.lookup(staging_name)[0]:
+                continue
+            try:
+                if await self.finalize(staging_name) is None:
+                    self._not_uploaded.store(staging_name, True, CONTENT_STAGED_RECHECK_SECONDS)
+            except S3Error as e:
+                # The read is served from the previous content; the upload is finalized later
+                self.failed += 1
+                print(f"Finalizing upload {staging_name} failed: {e!r}")
+
+    def _list_staged_blocking(self, object_name: str) -> List[str]:
+        prefix = staging_object_name(object_name, "")
+        return [item.object_name for item in self.client.list_objects(self.bucket, prefix=prefix)]
+
+    async def _finalize_listed(self, object_name: str):
+        try:
+            staged = await self.calls.run("list_objects", self._list_staged_blocking, object_name)
+        except S3Error as e:
+            self.failed += 1
+            print(f"Listing uploads of {object_name} failed: {e!r}")
+            return
+        # Upload ids sort by issue time, so the latest upload is finalized last
+        for staging_name in sorted(staged):
+            try:
+                await self.finalize(staging_name)
+            except S3Error as e:
+                self.failed += 1
+                print(f"Finalizing upload {staging_name} failed: {e!r}")
+
+    async def _finalize(self, staging_name: str) -> Optional[ContentRef]:
+        object_name, upload_id = parse_staging_object_name(staging_name)
+        try:
+            stat = await self.calls.run("stat_object", self.client.stat_object, self.bucket, staging_name)
+        except S3Error as e:
+            if e.code != "NoSuchKey":
+                raise
+            return None
+        sha256 = await self._hash(staging_name, stat.size, stat.etag)
+        blob_name = blob_object_name(sha256)
+        deduplicated = await self._exists(blob_name)
+        if deduplicated:
+            self.deduplicated += 1
+            self.bytes_deduplicated += stat.size
+        else:
+            # Server-side copy; fails if the staging object was overwritten since it was hashed
+            source = CopySource(self.bucket, staging_name, match_etag=stat.etag)
+            await self.calls.transfer("copy_object", self.transfer_client.copy_object, self.bucket, blob_name, source)
+        ref = ContentRef(sha256, stat.size, stat.content_type or "application/octet-stream", upload_id)
+
+        current = await self._read_index(object_name)
+        latest = current is None or current.upload_id <= upload_id
+        if latest:
+            entry = json.dumps(asdict(ref)).encode()
+            await self.calls.run(
+                "put_object",
+                self.client.put_object,
+                self.bucket,
+                index_object_name(object_name),
+                io.BytesIO(entry),
+                len(entry),
+                content_type="application/json",
+            )
+            self.index_cache.store(object_name, ref, CONTENT_INDEX_CACHE_TTL)
+        await self.calls.run("remove_object", self.client.remove_object, self.bucket, staging_name)
+        self._forget_staged(object_name, staging_name)
+        self.finalized += 1
+        if latest:
+            self.on_finalized(object_name, ref, deduplicated)
+        return ref
+
+    def _forget_staged(self, object_name: str, staging_name: str):
+        found, staged = self._staged.lookup(object_name)
+        if found and staging_name in staged:
+            remaining = {name: expires_at for name, expires_at in staged.items() if name != staging_name}
+            if remaining:
+                self._staged.store(object_name, remaining, max(remaining.values()) - time.monotonic())
+            else:
+                self._staged.invalidate(object_name)
+
+    async def _hash(self, object_name: str, size: int, etag: str) -> str:
+        digest = hashlib.sha256()
+        for offset in range(0, size, CONTENT_HASH_CHUNK_BYTES):
+            length = min(CONTENT_HASH_CHUNK_BYTES, size - offset)
+            await self.calls.transfer("get_object", self._hash_range, digest, object_name, offset, length, etag)
+        return digest.hexdigest()
+
+    def _hash_range(self, digest, object_name: str, offset: int, length: int, etag: str):
+        response = self.transfer_client.get_object(
+            self.bucket, object_name, offset=offset, length=length, request_headers={"If-Match": f'"{etag}"'}
+        )
+        try:
+            for chunk in response.stream(256 * 1024):
+                digest.update(chunk)
+        finally:
+            response.close()
+            response.release_conn()
+
+    async def _exists(self, object_name: str) -> bool:
+        try:
+            await self.calls.run("stat_object", self.client.stat_object, self.bucket, object_name)
+            return True
+        except S3Error as e:
+            if e.code != "NoSuchKey":
+                raise
+            return False
+
+    def _read_index_blocking(self, object_name: str) -> bytes:
+        response = self.client.get_object(self.bucket, index_object_name(object_name))
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
+    async def _read_index(self, object_name: str) -> Optional[ContentRef]:
+        try:
+            entry = await self.calls.run("get_object", self._read_index_blocking, object_name)
+        except S3Error as e:
+            if e.code != "NoSuchKey":
+                raise
+            return None
+        return ContentRef(**json.loads(entry))
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            "minio_api_content_finalized_total": self.finalized,
+            "minio_api_content_finalize_failed_total": self.failed,
+            "minio_api_content_deduplicated_total": self.deduplicated,
+            "minio_api_content_deduplicated_bytes_total": self.bytes_deduplicated,
+            "minio_api_content_index_cache_hits_total": self.index_cache.hits,
+            "minio_api_content_index_cache_misses_total": self.index_cache.misses,
+        }
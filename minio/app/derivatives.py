@@ -0,0 +1,298 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
+from pathlib import PurePosixPath
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from PIL import Image, ImageOps
+
+from content_store import is_blob_object
+
+# --- Image Derivatives ---
+# Uploaded images are resized and re-encoded in the background into variants, which read URLs can
+# ask for instead of the original: derived/{variant}/{sha256} for content-addressed images (see
+# content_store.py), {uid}/derived/{variant}/{filename} for images stored as {uid}/images/{filename}.
+# Uploads reach the pipeline, and content-addressed uploads are finalized, through:
+# - webhook: MinIO bucket notifications POSTed to /events/minio (DERIVATIVE_WEBHOOK_ARN registers
+#   them on the bucket at startup, DERIVATIVE_WEBHOOK_TOKEN is the expected Authorization). Events
+#   are only accepted with the token, since a forged one makes minio-api finalize and render at
+#   will: without one, subscribing (DERIVATIVE_WEBHOOK_ARN) is refused at startup and otherwise
+#   uploads are polled for instead.
+# - poll: a listing of the bucket every DERIVATIVE_POLL_SECONDS, for stores without notifications
+# - off: no variants are made
+# Uploads finalized through minio-api are queued directly in either mode.
+DERIVATIVE_TRIGGERS = ("webhook", "poll", "off")
+DERIVATIVE_TRIGGER = os.getenv("DERIVATIVE_TRIGGER", "webhook").lower()
+if DERIVATIVE_TRIGGER not in DERIVATIVE_TRIGGERS:
+    raise ValueError(f"DERIVATIVE_TRIGGER must be one of {', '.join(DERIVATIVE_TRIGGERS)}")
+DERIVATIVE_WEBHOOK_ARN = os.getenv("DERIVATIVE_WEBHOOK_ARN", "")
+DERIVATIVE_WEBHOOK_TOKEN = os.getenv("DERIVATIVE_WEBHOOK_TOKEN", "")
+if DERIVATIVE_TRIGGER == "webhook" and not DERIVATIVE_WEBHOOK_TOKEN:
+    if DERIVATIVE_WEBHOOK_ARN:
+        raise ValueError("DERIVATIVE_WEBHOOK_TOKEN must be set when DERIVATIVE_WEBHOOK_ARN is")
+    print("WARNING: DERIVATIVE_TRIGGER is webhook but DERIVATIVE_WEBHOOK_TOKEN is not set; "
+          "bucket notifications are refused and the bucket is polled instead")
+    DERIVATIVE_TRIGGER = "poll"
+DERIVATIVE_POLL_SECONDS = float(os.getenv("DERIVATIVE_POLL_SECONDS", "10"))
+# Image decoding and encoding is CPU work, done on a pool of worker processes
+DERIVATIVE_WORKERS = int(os.getenv("DERIVATIVE_WORKERS", str(os.cpu_count() or 1)))
+DERIVATIVE_QUEUE_SIZE = int(os.getenv("DERIVATIVE_QUEUE_SIZE", "1000"))
+# Larger originals are left alone
+DERIVATIVE_MAX_BYTES = int(os.getenv("DERIVATIVE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+class Variant(str, Enum):
+    THUMBNAIL = "thumbnail"
+    MEDIUM = "medium"
+    WEBP = "webp"
+
+
+# Longest side in pixels, and the output format (None keeps the original's)
+VARIANT_SPECS = {
+    Variant.THUMBNAIL: (320, None),
+    Variant.MEDIUM: (1280, None),
+    Variant.WEBP: (1280, "WEBP"),
+}
+CONTENT_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+
+def is_image(object_name: str) -> bool:
+    parts = object_name.split("/")
+    return len(parts) == 3 and parts[1] == "images" and PurePosixPath(parts[2]).suffix.lower() in IMAGE_EXTENSIONS
+
+
+def variant_object_name(object_name: str, variant: Variant) -> str:
+    """
+    Key of a variant of the image `object_name`, a blob or {uid}/images/{filename}.
+    """
+    if is_blob_object(object_name):
+        return f"derived/{variant.value}/{object_name.rsplit('/', 1)[1]}"
+    uid, _, filename = object_name.split("/", 2)
+    if VARIANT_SPECS[variant][1] == "WEBP":
+        filename = f"{PurePosixPath(filename).stem}.webp"
+    return f"{uid}/derived/{variant.value}/{filename}"
+
+
+def render_variants(data: bytes) -> Dict[str, Tuple[bytes, str]]:
+    """
+    Decode an image and encode every variant of it: variant name -> (encoded bytes, content type).
+    Variants that would not be smaller than the original are left out, so the original is
+    served for them. Runs in a worker process.
+    """
+    with Image.open(io.BytesIO(data)) as original:
+        source_format = original.format
+        image = ImageOps.exif_transpose(original)
+        image.load()
+    rendered = {}
+    for variant, (max_side, output_format) in VARIANT_SPECS.items():
+        output_format = output_format or source_format
+        resized = image.copy()
+        resized.thumbnail((max_side, max_side), Image.LANCZOS)
+        if output_format == "JPEG" and resized.mode not in ("RGB", "L"):
+            resized = resized.convert("RGB")
+        buffer = io.BytesIO()
+        if output_format == "JPEG":
+            resized.save(buffer, "JPEG", quality=82, optimize=True, progressive=True)
+        elif output_format == "WEBP":
+            resized.save(buffer, "WEBP", quality=80, method=4)
+        else:
+            resized.save(buffer, output_format, optimize=True)
+        encoded = buffer.getvalue()
+        if len(encoded) < len(data):
+            rendered[variant.value] = (encoded, CONTENT_TYPES.get(output_format, "application/octet-stream"))
+    return rendered
+
+
+class DerivativePipeline:
+    """
+    Queue of uploaded images waiting for their variants, drained by one background task per
+    worker process that renders on the process pool. Storage access is injected as coroutines so the pipeline runs on
+    the app's MinIO call pool:
+
+    - read(object_name) -> original bytes
+    - write(object_name, data, content_type) stores a variant
+
+    on_written is called with every variant key stored, e.g. to invalidate cached lookups.
+    """
+
+    def __init__(
+        self,
+        read: Callable[[str], Awaitable[bytes]],
+        write: Callable[[str, bytes, str], Awaitable[None]],
+        on_written: Callable[[str], None] = lambda object_name: None,
+        max_workers: int = DERIVATIVE_WORKERS,
+        max_queue: int = DERIVATIVE_QUEUE_SIZE,
+    ):
+        self.read = read
+        self.write = write
+        self.on_written = on_written
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending = set()
+        self._workers: List[asyncio.Task] = []
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.render_seconds = 0.0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn, since forking the threaded server process is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def start(self):
+        self._queue = asyncio.Queue(self.max_queue)
+        self._pending.clear()
+        loop = asyncio.get_running_loop()
+        self._workers = [loop.create_task(self._run()) for _ in range(self.max_workers)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def enqueue(self, object_name: str, size: Optional[int] = None) -> bool:
+        """
+        Queue an uploaded image, or the blob of one, for its variants. Returns whether it was
+        queued: objects that are not images, too large, already waiting or beyond a full queue
+        are not.
+        """
+        if self._queue is None or object_name in self._pending:
+            return False
+        if not (is_image(object_name) or is_blob_object(object_name)):
+            return False
+        if size is not None and size > DERIVATIVE_MAX_BYTES:
+            return False
+        try:
+            self._queue.put_nowait(object_name)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self._pending.add(object_name)
+        return True
+
+    async def _run(self):
+        while True:
+            object_name = await self._queue.get()
+            # A re-upload while this one is processed queues the object again
+            self._pending.discard(object_name)
+            try:
+                await self.process(object_name)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                print(f"Image derivatives for {object_name} failed: {e!r}")
+
+    async def process(self, object_name: str) -> List[str]:
+        """
+        Render and store every variant of one image. Returns the variant keys written.
+        """
+        data = await self.read(object_name)
+        if len(data) > DERIVATIVE_MAX_BYTES:
+            return []
+        started_at = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        rendered = await loop.run_in_executor(self._pool(), render_variants, data)
+        self.render_seconds += time.perf_counter() - started_at
+        written = []
+        for variant, (encoded, content_type) in rendered.items():
+            variant_name = variant_object_name(object_name, Variant(variant))
+            await self.write(variant_name, encoded, content_type)
+            self.on_written(variant_name)
+            written.append(variant_name)
+            self.bytes_out += len(encoded)
+        self.processed += 1
+        self.bytes_in += len(data)
+        return written
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            "minio_api_derivative_queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "minio_api_derivative_processed_total": self.processed,
+            "minio_api_derivative_failed_total": self.failed,
+            "minio_api_derivative_dropped_total": self.dropped,
+            "minio_api_derivative_bytes_in_total": self.bytes_in,
+            "minio_api_derivative_bytes_out_total": self.bytes_out,
+            "minio_api_derivative_render_seconds_total": round(self.render_seconds, 6),
+        }
+
+
+class BucketPoller:
+    """
+    Polling stand-in for bucket notifications: lists the bucket periodically and hands objects
+    that are new or changed (by ETag) since the previous listing to on_created(key, size). On
+    the first listing, objects for which processed(key, keys in the bucket) holds are skipped,
+    so a restart does not reprocess everything.
+    list_objects() returns (key, ETag, size) of every object in the bucket.
+    """
+
+    def __init__(
+        self,
+        list_objects: Callable[[], Awaitable[List[Tuple[str, str, int]]]],
+        on_created: Callable[[str, Optional[int]], None],
+        processed: Callable[[str, Set[str]], bool] = lambda key, keys: False,
+        interval: float = DERIVATIVE_POLL_SECONDS,
+    ):
+        self.list_objects = list_objects
+        self.on_created = on_created
+        self.processed = processed
+        self.interval = interval
+        self._seen: Optional[Dict[str, str]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def poll(self):
+        listing = await self.list_objects()
+        keys = {key for key, _, _ in listing}
+        first = self._seen is None
+        seen = self._seen or {}
+        for key, etag, size in listing:
+            if seen.get(key) == etag:
+                continue
+            if not first or not self.processed(key, keys):
+                self.on_created(key, size)
+            seen[key] = etag
+        self._seen = seen
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Bucket poll failed: {e!r}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
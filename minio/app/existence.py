@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+# --- Existence Check Policy ---
+# Whether read URLs are only issued for objects that exist:
+# - always: stat the object in MinIO before every presign (one S3 round trip per URL)
+# - never:  presign without checking; a missing object fails when the client follows the URL
+# - cached: stat once, then remember the answer for a while (see ExistenceCache)
+EXISTENCE_CHECK_POLICIES = ("always", "never", "cached")
+EXISTENCE_CHECK = os.getenv("EXISTENCE_CHECK", "always").lower()
+if EXISTENCE_CHECK not in EXISTENCE_CHECK_POLICIES:
+    raise ValueError(f"EXISTENCE_CHECK must be one of {', '.join(EXISTENCE_CHECK_POLICIES)}")
+# How long a present object is remembered. Objects are only ever overwritten, not deleted,
+# so this can be long.
+EXISTENCE_CACHE_TTL = float(os.getenv("EXISTENCE_CACHE_TTL", "3600"))
+# How long a missing object is remembered; short, since an upload may be in progress
+EXISTENCE_MISSING_TTL = float(os.getenv("EXISTENCE_MISSING_TTL", "30"))
+EXISTENCE_CACHE_SIZE = int(os.getenv("EXISTENCE_CACHE_SIZE", "100000"))
+
+
+class TTLCache:
+    """
+    In-memory cache of values that expire, least recently used entries dropped first.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key: str) -> Tuple[bool, Any]:
+        """
+        Returns (True, value) for a cached key, (False, None) otherwise.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def store(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class ExistenceCache(TTLCache):
+    """
+    Object keys known to be present or missing. Issuing an upload URL for a key invalidates it,
+    and until that URL expires the key is not remembered as missing: the upload may land any
+    moment, with no notification to tell.
+    """
+
+    def __init__(
+        self,
+        present_ttl: float = EXISTENCE_CACHE_TTL,
+        missing_ttl: float = EXISTENCE_MISSING_TTL,
+        max_entries: int = EXISTENCE_CACHE_SIZE,
+    ):
+        super().__init__(max_entries)
+        self.present_ttl = present_ttl
+        self.missing_ttl = missing_ttl
+        # Keys with an upload URL that has not expired yet
+        self._uploading = TTLCache(max_entries)
+
+    def get(self, object_name: str) -> Optional[bool]:
+        """
+        Returns whether the object is known to exist, or None if it is not cached.
+        """
+        found, exists = self.lookup(object_name)
+        return exists if found else None
+
+    def set(self, object_name: str, exists: bool):
+        if not exists and self._uploading.lookup(object_name)[0]:
+            return
+        self.store(object_name, exists, self.present_ttl if exists else self.missing_ttl)
+
+    def expect_upload(self, object_name: str, expires: float):
+        """
+        An upload URL valid for `expires` seconds was issued for the key.
+        """
+        self.invalidate(object_name)
+        self._uploading.store(object_name, True, expires)
@@ -1,12 +1,56 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from minio import Minio
+from minio.datatypes import Part
+from minio.notificationconfig import NotificationConfig, QueueConfig
 from minio.error import S3Error
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, Response, StreamingResponse
 from pydantic import BaseModel
-import json
+import certifi
+import hmac
+import io
+import time
+import urllib3
 from pathlib import Path
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Iterable, List, Optional, Set, Tuple
+from urllib.parse import unquote_plus
 import os
+from content_store import (
+    ContentRef,
+    ContentStore,
+    CONTENT_ADDRESSED_STORAGE,
+    blob_object_name,
+    parse_staging_object_name,
+    staging_object_name,
+)
+from derivatives import (
+    BucketPoller,
+    DerivativePipeline,
+    Variant,
+    DERIVATIVE_TRIGGER,
+    DERIVATIVE_WEBHOOK_ARN,
+    DERIVATIVE_WEBHOOK_TOKEN,
+    is_image,
+    variant_object_name,
+)
+from existence import ExistenceCache, EXISTENCE_CHECK
+from multipart import (
+    MultipartCompleteRequest,
+    MultipartInitiateRequest,
+    PartUrlsRequest,
+    MULTIPART_PRESIGN_BATCH,
+    MULTIPART_URL_EXPIRY_SECONDS,
+    plan_parts,
+)
+import multipart_calls
+from published import (
+    PublishedAssets,
+    ASSET_CACHE_CONTROL,
+    EXTERNAL_API_ENDPOINT,
+    SHA256_PATTERN,
+    asset_path,
+)
+from s3_calls import S3CallExecutor, S3Unavailable, MINIO_CALL_TIMEOUT_SECONDS, MINIO_TRANSFER_TIMEOUT_SECONDS, MINIO_WORKERS
 
 app = FastAPI()
 
@@ -19,23 +63,223 @@ MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY", "admin1234")
 MINIO_SECURE = os.getenv("MINIO_SECURE", "false").lower() == "true"
 BUCKET_NAME = "documents"
 
-# Initialize MinIO client
-minio_client = Minio(
-    MINIO_ENDPOINT,
-    access_key=MINIO_ACCESS_KEY,
-    secret_key=MINIO_SECRET_KEY,
-    secure=MINIO_SECURE
-)
+# Read URLs stay valid for READ_URL_EXPIRY_SECONDS. They are signed as of the start of a
+# READ_URL_SIGNING_WINDOW_SECONDS window, so within a window an object always gets the same URL,
+# valid for at least the expiry minus the window.
+READ_URL_EXPIRY_SECONDS = int(os.getenv("READ_URL_EXPIRY_SECONDS", "3600"))
+READ_URL_SIGNING_WINDOW_SECONDS = int(os.getenv("READ_URL_SIGNING_WINDOW_SECONDS", "600"))
+# Seconds before a URL expires that responses carrying it stop being cacheable, for clock skew
+READ_URL_CACHE_MARGIN_SECONDS = 60
+if not 0 < READ_URL_SIGNING_WINDOW_SECONDS < READ_URL_EXPIRY_SECONDS - READ_URL_CACHE_MARGIN_SECONDS:
+    raise ValueError("READ_URL_SIGNING_WINDOW_SECONDS must be positive and well below READ_URL_EXPIRY_SECONDS")
+
+def create_minio_client(read_timeout: float) -> Minio:
+    # The SDK default waits up to 5 minutes per attempt and pools 10 connections; size the pool
+    # to the call workers and let no attempt outlive the timeout of the calls made with it
+    return Minio(
+        MINIO_ENDPOINT,
+        access_key=MINIO_ACCESS_KEY,
+        secret_key=MINIO_SECRET_KEY,
+        secure=MINIO_SECURE,
+        http_client=urllib3.PoolManager(
+            timeout=urllib3.Timeout(connect=MINIO_CALL_TIMEOUT_SECONDS, read=read_timeout),
+            maxsize=MINIO_WORKERS,
+            cert_reqs="CERT_REQUIRED",
+            ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+            retries=urllib3.Retry(total=2, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]),
+        ),
+    )
+
+# Initialize MinIO clients: one for metadata and presign calls, which must answer quickly, and one
+# for calls moving object data, whose responses may take as long as the object is large
+minio_client = create_minio_client(MINIO_CALL_TIMEOUT_SECONDS)
+minio_transfer_client = create_minio_client(MINIO_TRANSFER_TIMEOUT_SECONDS)
+
+# Every SDK call blocks, so it runs on this bounded pool instead of the event loop
+s3_calls = S3CallExecutor()
+
+@app.exception_handler(S3Unavailable)
+async def s3_unavailable(request: Request, e: S3Unavailable):
+    return JSONResponse(
+        status_code=e.status_code,
+        content={"detail": f"MinIO unavailable: {e}"},
+        headers={"Retry-After": "1"},
+    )
 
 # Ensure bucket exists
-def ensure_bucket():
+@app.on_event("startup")
+async def ensure_bucket():
+    if not await s3_calls.run("bucket_exists", minio_client.bucket_exists, BUCKET_NAME):
+        await s3_calls.run("make_bucket", minio_client.make_bucket, BUCKET_NAME)
+
+@app.on_event("shutdown")
+def shutdown_s3_calls():
+    s3_calls.shutdown()
+
+# Known-present and known-missing object keys, used by the "cached" existence check policy
+existence_cache = ExistenceCache()
+
+async def object_exists(object_name: str, policy: str = EXISTENCE_CHECK) -> bool:
+    """
+    Check whether an object exists according to the EXISTENCE_CHECK policy.
+    With "cached", only keys not seen recently cost a stat_object call.
+    """
+    if policy == "never":
+        return True
+    if policy == "cached":
+        exists = existence_cache.get(object_name)
+        if exists is not None:
+            return exists
     try:
-        if not minio_client.bucket_exists(BUCKET_NAME):
-            minio_client.make_bucket(BUCKET_NAME)
+        await s3_calls.run("stat_object", minio_client.stat_object, BUCKET_NAME, object_name)
+        exists = True
     except S3Error as e:
-        raise HTTPException(status_code=500, detail=f"MinIO error: {e}")
+        if e.code != "NoSuchKey":
+            raise
+        exists = False
+    if policy == "cached":
+        existence_cache.set(object_name, exists)
+    return exists
+
+# A variant that has not been made yet falls back to the original, so its existence is always
+# checked; with the "never" policy, through the cache
+VARIANT_EXISTENCE_CHECK = "cached" if EXISTENCE_CHECK == "never" else EXISTENCE_CHECK
+# How long a response serving the original in place of a variant not made yet may be cached
+VARIANT_FALLBACK_MAX_AGE = 60
+
+async def read_object(object_name: str) -> bytes:
+    def read() -> bytes:
+        response = minio_transfer_client.get_object(BUCKET_NAME, object_name)
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+    return await s3_calls.transfer("get_object", read)
+
+async def write_object(object_name: str, data: bytes, content_type: str):
+    await s3_calls.transfer(
+        "put_object",
+        minio_transfer_client.put_object,
+        BUCKET_NAME,
+        object_name,
+        io.BytesIO(data),
+        len(data),
+        content_type=content_type,
+    )
+
+# Chunk size of objects streamed through minio-api
+STREAM_CHUNK_BYTES = 256 * 1024
+
+async def stream_object(response) -> AsyncIterator[bytes]:
+    """
+    Stream the body of a get_object response, one chunk per call on the MinIO call pool.
+    """
+    try:
+        while True:
+            chunk = await s3_calls.transfer("read_object", response.read, STREAM_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        response.close()
+        response.release_conn()
+
+def list_objects_blocking() -> List[Tuple[str, str, int]]:
+    return [
+        (obj.object_name, obj.etag, obj.size)
+        for obj in minio_client.list_objects(BUCKET_NAME, recursive=True)
+    ]
+
+async def list_objects() -> List[Tuple[str, str, int]]:
+    # One call for every page of the listing, so it gets the transfer timeout
+    return await s3_calls.transfer("list_objects", list_objects_blocking)
+
+# Resized and re-encoded variants of uploaded images, made in the background
+derivative_pipeline = DerivativePipeline(read_object, write_object, on_written=existence_cache.invalidate)
+
+def content_finalized(object_name: str, ref: ContentRef, deduplicated: bool):
+    # Content stored before already has its variants
+    if is_image(object_name) and not deduplicated:
+        derivative_pipeline.enqueue(blob_object_name(ref.sha256), ref.size)
+
+# Files stored once per distinct content, under their SHA-256
+content_store = ContentStore(
+    minio_client, BUCKET_NAME, s3_calls, on_finalized=content_finalized, transfer_client=minio_transfer_client
+)
+
+# Hashes of published content, served through immutable asset URLs
+published_assets = PublishedAssets(
+    read_object,
+    write_object,
+    lambda object_name: object_exists(object_name, "always"),
+    content_store.lookup,
+)
+
+def object_created(object_name: str, size: Optional[int] = None):
+    """
+    An object was written to the bucket: finalize it if it is a staged upload, else queue it
+    for variants if it is an image stored as is.
+    """
+    existence_cache.invalidate(object_name)
+    if parse_staging_object_name(object_name) is not None:
+        if CONTENT_ADDRESSED_STORAGE:
+            content_store.finalize_later(object_name)
+    elif is_image(object_name):
+        derivative_pipeline.enqueue(object_name, size)
 
-ensure_bucket()
+def object_processed(object_name: str, keys: Set[str]) -> bool:
+    # Staged uploads left over from before a restart are still finalized
+    if is_image(object_name):
+        return variant_object_name(object_name, Variant.THUMBNAIL) in keys
+    return parse_staging_object_name(object_name) is None
+
+bucket_poller = BucketPoller(list_objects, object_created, object_processed)
+
+@app.on_event("startup")
+async def start_derivatives():
+    if DERIVATIVE_TRIGGER == "off":
+        return
+    derivative_pipeline.start()
+    if DERIVATIVE_TRIGGER == "poll":
+        bucket_poller.start()
+    elif DERIVATIVE_WEBHOOK_ARN:
+        # Have MinIO notify /events/minio of every upload to the bucket
+        config = NotificationConfig(queue_config_list=[
+            QueueConfig(DERIVATIVE_WEBHOOK_ARN, ["s3:ObjectCreated:*"], config_id="image-derivatives"),
+        ])
+        await s3_calls.run("set_bucket_notification", minio_client.set_bucket_notification, BUCKET_NAME, config)
+
+@app.on_event("shutdown")
+async def stop_derivatives():
+    await bucket_poller.stop()
+    await content_store.stop()
+    await derivative_pipeline.stop()
+
+@app.post("/events/minio", status_code=204)
+async def receive_bucket_event(request: Request):
+    """
+    Receive MinIO bucket notifications (webhook target): staged uploads are finalized and
+    uploaded images queued for their variants. Uploaded objects are also forgotten by the
+    existence cache.
+    """
+    authorization = request.headers.get("Authorization", "")
+    token = authorization[len("Bearer "):] if authorization.startswith("Bearer ") else authorization
+    # Without a configured token (only allowed when notifications are off) every event is refused
+    if not DERIVATIVE_WEBHOOK_TOKEN or not hmac.compare_digest(token, DERIVATIVE_WEBHOOK_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid webhook token")
+    try:
+        event = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid event")
+    for record in event.get("Records") or []:
+        s3 = record.get("s3") or {}
+        if not record.get("eventName", "").startswith("s3:ObjectCreated:"):
+            continue
+        if (s3.get("bucket") or {}).get("name") != BUCKET_NAME:
+            continue
+        object_name = unquote_plus((s3.get("object") or {}).get("key", ""))
+        object_created(object_name, (s3.get("object") or {}).get("size"))
 
 class UploadUrlRequest(BaseModel):
     filename: str
@@ -44,6 +288,8 @@ class UploadUrlRequest(BaseModel):
 async def generate_upload_url(uid: str, request: UploadUrlRequest):
     """
     Generate a presigned URL for uploading a file to MinIO under uid-specific path.
+    With content-addressed storage the URL is for a staging key, and the response has the
+    upload id to finalize the upload with.
     """
     try:
         # Determine file type based on extension
@@ -57,13 +303,22 @@ async def generate_upload_url(uid: str, request: UploadUrlRequest):
 
         # Construct object name
         object_name = f"{folder}/{request.filename}"
+        upload_id = None
+        upload_name = object_name
+        if CONTENT_ADDRESSED_STORAGE:
+            upload_id = content_store.new_upload(object_name, 3600)
+            upload_name = staging_object_name(object_name, upload_id)
 
         # Generate presigned URL for upload (PUT request)
-        presigned_url = minio_client.presigned_put_object(
+        presigned_url = await s3_calls.run(
+            "presigned_put_object",
+            minio_client.presigned_put_object,
             BUCKET_NAME,
-            object_name,
+            upload_name,
             expires=timedelta(seconds=3600)  # 1-hour expiry
         )
+        # The object may be (re)written any time until the URL expires
+        existence_cache.expect_upload(object_name, 3600)
 
         # Replace the MinIO endpoint with the external endpoint for client use
         presigned_url = presigned_url.replace(
@@ -74,92 +329,464 @@ async def generate_upload_url(uid: str, request: UploadUrlRequest):
 
         return JSONResponse(
             status_code=200,
-            content={"message": "Upload URL generated successfully", "url": presigned_url}
+            content={"message": "Upload URL generated successfully", "url": presigned_url, "upload_id": upload_id}
         )
     except S3Error as e:
         raise HTTPException(status_code=500, detail=f"MinIO error: {e}")
+    except S3Unavailable:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Server error: {e}")
 
-@app.get("/files/{uid}/{filename}")
-async def redirect_file(uid: str, filename: str):
+def object_name_for_file(uid: str, filename: str) -> str:
     """
-    Redirect a file from MinIO under uid-specific path.
+    Object key of a file under the uid-specific path, in a folder chosen by file extension.
     """
-    # get file type based on file extension
     file_ext = Path(filename).suffix.lower()
     if file_ext in [".md", ".markdown"]:
-        folder = f"markdown"
+        folder = "markdown"
     elif file_ext in [".png", ".jpg", ".jpeg"]:
-        folder = f"images"
+        folder = "images"
     else:
         raise HTTPException(status_code=400, detail="Unsupported file type")
+    return f"{uid}/{folder}/{filename}"
+
+def external_url(presigned_url: str) -> str:
+    # Replace the MinIO endpoint with the external endpoint for client use
+    return presigned_url.replace(f"http://{MINIO_ENDPOINT}", f"{EXTERNAL_ENDPOINT}", 1)
+
+async def presign_read_url(object_name: str) -> Tuple[str, int]:
+    """
+    Presign a read (GET) URL for an object, without checking that it exists.
+    Returns the URL and the seconds for which it stays valid.
+
+    URLs are signed as of the start of the current signing window, so every request for an
+    object within one window gets the same URL and browsers can cache both the URL and the file.
+    """
+    now = time.time()
+    signed_at = now - now % READ_URL_SIGNING_WINDOW_SECONDS
+    presigned_url = await s3_calls.run(
+        "presigned_get_object",
+        minio_client.presigned_get_object,
+        BUCKET_NAME,
+        object_name,
+        expires=timedelta(seconds=READ_URL_EXPIRY_SECONDS),
+        request_date=datetime.fromtimestamp(signed_at, timezone.utc),
+    )
+    return external_url(presigned_url), int(READ_URL_EXPIRY_SECONDS - (now - signed_at))
+
+def read_url_cache_control(valid_seconds: int, max_age: Optional[int] = None) -> str:
+    # A cached response must never hand out a URL that has already expired
+    valid_seconds = max(0, valid_seconds - READ_URL_CACHE_MARGIN_SECONDS)
+    return f"private, max-age={valid_seconds if max_age is None else min(valid_seconds, max_age)}"
+
+async def resolve_read_object(
+    object_name: str, variant: Optional[Variant]
+) -> Tuple[str, Optional[Variant], Optional[ContentRef]]:
+    """
+    The object to serve for a read: the requested variant if it has been made, else the original,
+    from its blob if the file is content-addressed. Returns its key, the variant served and the
+    file's content (None for a file stored as is).
+
+    Raises:
+        HTTPException: 400 for a variant of a file that is not an image, 404 if the original
+            is missing.
+    """
+    ref = await content_store.lookup(object_name) if CONTENT_ADDRESSED_STORAGE else None
+    source_name = blob_object_name(ref.sha256) if ref else object_name
+    if variant is not None:
+        if not is_image(object_name):
+            raise HTTPException(status_code=400, detail="Variants are only made of images")
+        variant_name = variant_object_name(source_name, variant)
+        if await object_exists(variant_name, VARIANT_EXISTENCE_CHECK):
+            return variant_name, variant, ref
+    # Blobs are never deleted, so an index entry is proof enough
+    if ref is None and not await object_exists(object_name):
+        raise HTTPException(status_code=404, detail="File not found")
+    return source_name, None, ref
+
+def content_headers(ref: Optional[ContentRef]) -> dict:
+    # Lets caches in front of minio-api key on the content rather than the file name
+    return {"X-Content-SHA256": ref.sha256} if ref else {}
+
+@app.get("/files/{uid}/{filename}")
+async def redirect_file(uid: str, filename: str, variant: Optional[Variant] = None):
+    """
+    Redirect to a file in MinIO under uid-specific path, or to a variant of an image
+    (thumbnail, medium, webp) once it has been made.
+    The redirect may be cached by the browser for as long as the URL it points to stays valid.
+    """
+    try:
+        object_name = object_name_for_file(uid, filename)
+        served_name, served_variant, ref = await resolve_read_object(object_name, variant)
 
-    # Construct full object name
-    object_name = f"{uid}/{folder}/{filename}"
+        presigned_url, valid_seconds = await presign_read_url(served_name)
+        max_age = VARIANT_FALLBACK_MAX_AGE if variant is not None and served_variant is None else None
+        return RedirectResponse(
+            presigned_url,
+            headers={"Cache-Control": read_url_cache_control(valid_seconds, max_age), **content_headers(ref)}
+        )
+    except S3Error as e:
+        raise HTTPException(status_code=500, detail=f"MinIO error: {e}")
+    except (HTTPException, S3Unavailable):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Server error: {e}")
+
+@app.get("/generate-read-url/{uid}/{filename}")
+async def generate_read_url(uid: str, filename: str, variant: Optional[Variant] = None):
+    """
+    Generate a presigned URL for reading a file from MinIO under uid-specific path.
+    With `variant`, the URL is for that variant of an image if it has been made, else for the
+    original; `variant` in the response tells which. `sha256` is the hash of the file's content,
+    or null for a file stored before content-addressed storage.
+    """
+    try:
+        object_name = object_name_for_file(uid, filename)
+        served_name, served_variant, ref = await resolve_read_object(object_name, variant)
 
-    # Verify object exists
+        presigned_url, valid_seconds = await presign_read_url(served_name)
+        max_age = VARIANT_FALLBACK_MAX_AGE if variant is not None and served_variant is None else None
+        return JSONResponse(
+            status_code=200,
+            content={
+                "message": "Read URL generated successfully",
+                "url": presigned_url,
+                "variant": served_variant.value if served_variant else None,
+                "sha256": ref.sha256 if ref else None,
+            },
+            headers={"Cache-Control": read_url_cache_control(valid_seconds, max_age), **content_headers(ref)}
+        )
+    except S3Error as e:
+        raise HTTPException(status_code=500, detail=f"MinIO error: {e}")
+    except (HTTPException, S3Unavailable):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Server error: {e}")
+
+@app.api_route("/content/{uid}/{filename}", methods=["GET", "HEAD"])
+async def get_content(request: Request, uid: str, filename: str):
+    """
+    Stream a file's current content, for services that read files themselves (flow renders
+    documents) and cannot follow read URLs, which point at the browser-facing endpoint.
+    `ETag` names the content: its SHA-256, or MinIO's ETag for a file stored before
+    content-addressed storage. HEAD answers with the ETag alone, without reading the content.
+    Meant for services only: the proxy does not forward it.
+    """
     try:
-        minio_client.stat_object(BUCKET_NAME, object_name)
+        object_name = object_name_for_file(uid, filename)
+        served_name, _, ref = await resolve_read_object(object_name, None)
+        if request.method == "HEAD":
+            etag = ref.sha256 if ref else (await s3_calls.run(
+                "stat_object", minio_client.stat_object, BUCKET_NAME, served_name
+            )).etag
+            return Response(headers={"ETag": f'"{etag}"'})
+        response = await s3_calls.transfer("get_object", minio_transfer_client.get_object, BUCKET_NAME, served_name)
     except S3Error as e:
         if e.code == "NoSuchKey":
             raise HTTPException(status_code=404, detail="File not found")
+        raise HTTPException(status_code=500, detail=f"MinIO error: {e}")
+    etag = f'"{ref.sha256}"' if ref else response.headers.get("ETag", "")
+    headers = {"ETag": etag, "Content-Length": response.headers.get("Content-Length", "")}
+    return StreamingResponse(
+        stream_object(response),
+        media_type=response.headers.get("Content-Type", "application/octet-stream"),
+        headers={name: value for name, value in headers.items() if value},
+    )
+
+def published_response(sha256: str) -> dict:
+    return {
+        "message": "Published URL generated successfully",
+        "url": f"{EXTERNAL_API_ENDPOINT}{asset_path(sha256)}",
+        "sha256": sha256,
+    }
+
+@app.post("/publications/{uid}/{filename}")
+async def publish_file(uid: str, filename: str):
+    """
+    Publish a file of a document that is being published and return its immutable asset URL,
+    which may be cached for good. Markdown is published as its rendition, which links the images
+    it shows by their asset URLs too. Files stored before content-addressed storage cannot be
+    published and get a presigned read URL, as from generate-read-url, with a null `sha256`.
+    Meant for flow only: the proxy does not forward it.
+    """
+    try:
+        object_name = object_name_for_file(uid, filename)
+        ref = await content_store.lookup(object_name) if CONTENT_ADDRESSED_STORAGE else None
+        if ref is None:
+            if not await object_exists(object_name):
+                raise HTTPException(status_code=404, detail="File not found")
+            presigned_url, _ = await presign_read_url(object_name)
+            return {"message": "Read URL generated successfully", "url": presigned_url, "sha256": None}
+
+        if is_image(object_name):
+            sha256 = ref.sha256
+            await published_assets.publish(sha256)
+        else:
+            sha256 = await published_assets.publish_markdown(ref)
+        return published_response(sha256)
+    except S3Error as e:
+        raise HTTPException(status_code=500, detail=f"MinIO error: {e}")
+    except (HTTPException, S3Unavailable):
         raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Server error: {e}")
 
-    temp_read = await generate_read_url(uid, f"{filename}")
-    if temp_read.status_code != 200:
-        raise HTTPException(status_code=temp_read.status_code)
+@app.get("/published-url/{uid}/{filename}")
+async def generate_published_url(uid: str, filename: str):
+    """
+    Look up the immutable asset URL of a file whose current content has been published.
+    Answers 404 for files that have not been published; nothing is published here.
+    """
+    try:
+        object_name = object_name_for_file(uid, filename)
+        ref = await content_store.lookup(object_name) if CONTENT_ADDRESSED_STORAGE else None
+        sha256 = await published_assets.find(ref, not is_image(object_name)) if ref else None
+        if sha256 is None:
+            raise HTTPException(status_code=404, detail="File not published")
+        # Not cacheable: the file may be changed, and then is published under another hash
+        return published_response(sha256)
+    except S3Error as e:
+        raise HTTPException(status_code=500, detail=f"MinIO error: {e}")
+    except (HTTPException, S3Unavailable):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Server error: {e}")
 
-    return RedirectResponse(
-        json.loads(temp_read.body.decode()).get("url")
+@app.get("/assets/{sha256}")
+@app.get("/assets/{sha256}/{variant}")
+async def get_asset(request: Request, sha256: str, variant: Optional[Variant] = None):
+    """
+    Serve published content by its SHA-256, or a variant of a published image. The response
+    never changes, so it is cacheable for a year as immutable, by browsers and the proxy alike.
+    """
+    if not SHA256_PATTERN.fullmatch(sha256) or not await published_assets.is_published(sha256):
+        raise HTTPException(status_code=404, detail="Asset not found")
+    etag = f'"{sha256}"' if variant is None else f'"{sha256}-{variant.value}"'
+    headers = {"Cache-Control": ASSET_CACHE_CONTROL, "ETag": etag}
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status_code=304, headers=headers)
+    object_name = blob_object_name(sha256)
+    if variant is not None:
+        object_name = variant_object_name(object_name, variant)
+    try:
+        response = await s3_calls.transfer("get_object", minio_transfer_client.get_object, BUCKET_NAME, object_name)
+    except S3Error as e:
+        if e.code == "NoSuchKey":
+            raise HTTPException(status_code=404, detail="Asset not found")
+        raise HTTPException(status_code=500, detail=f"MinIO error: {e}")
+    headers["Content-Length"] = response.headers.get("Content-Length", "")
+    return StreamingResponse(
+        stream_object(response),
+        media_type=response.headers.get("Content-Type", "application/octet-stream"),
+        headers={name: value for name, value in headers.items() if value},
     )
 
-@app.get("/generate-read-url/{uid}/{filename}")
-async def generate_read_url(uid: str, filename: str):
+def content_response(ref: ContentRef) -> dict:
+    return {"sha256": ref.sha256, "size": ref.size, "content_type": ref.content_type}
+
+@app.post("/uploads/{uid}/{filename}/{upload_id}/finalize")
+async def finalize_upload(uid: str, filename: str, upload_id: str):
     """
-    Generate a presigned URL for reading a file from MinIO under uid-specific path.
+    Finalize an upload made with a URL from generate-upload-url: store its content once, under
+    its SHA-256, and point the file at it. Uploads are also finalized in the background and
+    before the file is next read, so this only makes it happen now and returns the hash.
     """
+    if not CONTENT_ADDRESSED_STORAGE:
+        raise HTTPException(status_code=404, detail="Content-addressed storage is disabled")
+    object_name = object_name_for_file(uid, filename)
     try:
-        # get file type based on file extension
-        file_ext = Path(filename).suffix.lower()
-        if file_ext in [".md", ".markdown"]:
-            folder = f"markdown"
-        elif file_ext in [".png", ".jpg", ".jpeg"]:
-            folder = f"images"
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file type")
+        ref = await content_store.finalize(staging_object_name(object_name, upload_id))
+        if ref is None:
+            # Finalized already, e.g. on its bucket notification
+            ref = await content_store.lookup(object_name)
+            if ref is None or ref.upload_id != upload_id:
+                raise HTTPException(status_code=404, detail="Upload not found")
+    except S3Error as e:
+        raise HTTPException(status_code=500, detail=f"MinIO error: {e}")
+    return {"message": "Upload finalized successfully", **content_response(ref)}
 
-        # Construct full object name
-        object_name = f"{uid}/{folder}/{filename}"
+def multipart_error(e: S3Error) -> HTTPException:
+    if e.code == "NoSuchUpload":
+        return HTTPException(status_code=404, detail="Upload not found")
+    if e.code in ("InvalidPart", "InvalidPartOrder", "EntityTooSmall"):
+        return HTTPException(status_code=400, detail=f"Invalid parts: {e.message}")
+    return HTTPException(status_code=500, detail=f"MinIO error: {e}")
 
-        # Verify object exists
-        try:
-            minio_client.stat_object(BUCKET_NAME, object_name)
-        except S3Error as e:
-            if e.code == "NoSuchKey":
-                raise HTTPException(status_code=404, detail="File not found")
-            raise
+def multipart_object_name(object_name: str, upload_id: str) -> Tuple[str, str]:
+    """
+    The key a multipart upload is assembled at and its MinIO upload id. With content-addressed
+    storage that is a staging key, and the upload id handed out is "{staging upload id}.{MinIO upload id}".
+    """
+    if not CONTENT_ADDRESSED_STORAGE:
+        return object_name, upload_id
+    staging_upload_id, _, s3_upload_id = upload_id.partition(".")
+    if not s3_upload_id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return staging_object_name(object_name, staging_upload_id), s3_upload_id
+
+def presign_part_urls_blocking(object_name: str, upload_id: str, part_numbers: Iterable[int]) -> List[dict]:
+    return [
+        {
+            "part_number": part_number,
+            "url": external_url(minio_client.get_presigned_url(
+                "PUT",
+                BUCKET_NAME,
+                object_name,
+                expires=timedelta(seconds=MULTIPART_URL_EXPIRY_SECONDS),
+                extra_query_params={"uploadId": upload_id, "partNumber": str(part_number)},
+            )),
+        }
+        for part_number in part_numbers
+    ]
 
-        # Generate presigned URL for read (GET request)
-        presigned_url = minio_client.presigned_get_object(
+@app.post("/multipart-uploads/{uid}/{filename}")
+async def initiate_multipart_upload(uid: str, filename: str, request: MultipartInitiateRequest):
+    """
+    Start a multipart upload of a large file to MinIO under uid-specific path.
+    Returns the upload id, the part size and count, and presigned PUT URLs for the first parts;
+    URLs for the remaining parts come from the part-urls endpoint.
+    """
+    object_name = object_name_for_file(uid, filename)
+    part_size, part_count = plan_parts(request.size)
+    headers = {"Content-Type": request.content_type} if request.content_type else {}
+    staging_upload_id = None
+    existence_cache.expect_upload(object_name, MULTIPART_URL_EXPIRY_SECONDS)
+    if CONTENT_ADDRESSED_STORAGE:
+        staging_upload_id = content_store.new_upload(object_name, MULTIPART_URL_EXPIRY_SECONDS)
+        object_name = staging_object_name(object_name, staging_upload_id)
+    try:
+        s3_upload_id = await s3_calls.run(
+            "create_multipart_upload",
+            multipart_calls.create_upload,
+            minio_client,
             BUCKET_NAME,
             object_name,
-            expires=timedelta(seconds=3600)  # 1-hour expiry
+            headers,
+        )
+        parts = await s3_calls.run(
+            "presigned_upload_part",
+            presign_part_urls_blocking,
+            object_name,
+            s3_upload_id,
+            range(1, min(part_count, MULTIPART_PRESIGN_BATCH) + 1),
         )
+    except S3Error as e:
+        raise HTTPException(status_code=500, detail=f"MinIO error: {e}")
+    return {
+        "upload_id": f"{staging_upload_id}.{s3_upload_id}" if staging_upload_id else s3_upload_id,
+        "part_size": part_size,
+        "part_count": part_count,
+        "parts": parts,
+    }
 
-        presigned_url = presigned_url.replace(
-            f"http://{MINIO_ENDPOINT}",
-            f"{EXTERNAL_ENDPOINT}",
-            1  # Replace only the first occurrence
+@app.post("/multipart-uploads/{uid}/{filename}/{upload_id}/part-urls")
+async def presign_multipart_parts(uid: str, filename: str, upload_id: str, request: PartUrlsRequest):
+    """
+    Presign PUT URLs for a batch of parts of a multipart upload, e.g. the next batch or parts
+    to retry after a failure.
+    """
+    object_name, s3_upload_id = multipart_object_name(object_name_for_file(uid, filename), upload_id)
+    parts = await s3_calls.run(
+        "presigned_upload_part",
+        presign_part_urls_blocking,
+        object_name,
+        s3_upload_id,
+        request.part_numbers,
+    )
+    return {"upload_id": upload_id, "parts": parts}
+
+@app.get("/multipart-uploads/{uid}/{filename}/{upload_id}/parts")
+async def list_multipart_parts(uid: str, filename: str, upload_id: str):
+    """
+    List the parts MinIO has received so far, so an interrupted upload can resume with the rest.
+    """
+    object_name, s3_upload_id = multipart_object_name(object_name_for_file(uid, filename), upload_id)
+    try:
+        parts = await s3_calls.run(
+            "list_parts", multipart_calls.list_parts, minio_client, BUCKET_NAME, object_name, s3_upload_id
         )
+    except S3Error as e:
+        raise multipart_error(e)
+    return {
+        "upload_id": upload_id,
+        "parts": [{"part_number": part.part_number, "etag": part.etag, "size": part.size} for part in parts],
+    }
 
-        return JSONResponse(
-            status_code=200,
-            content={"message": "Read URL generated successfully", "url": presigned_url}
+@app.post("/multipart-uploads/{uid}/{filename}/{upload_id}/complete")
+async def complete_multipart_upload(uid: str, filename: str, upload_id: str, request: MultipartCompleteRequest):
+    """
+    Assemble the uploaded parts into the file. Without a part list, every part MinIO has
+    received is used, in part number order. A content-addressed upload is finalized right away.
+    """
+    file_name = object_name_for_file(uid, filename)
+    object_name, s3_upload_id = multipart_object_name(file_name, upload_id)
+    try:
+        if request.parts is None:
+            parts = await s3_calls.run(
+                "list_parts", multipart_calls.list_parts, minio_client, BUCKET_NAME, object_name, s3_upload_id
+            )
+        else:
+            parts = [
+                Part(part.part_number, part.etag.strip('"'))
+                for part in sorted(request.parts, key=lambda part: part.part_number)
+            ]
+        if not parts:
+            raise HTTPException(status_code=400, detail="No parts uploaded")
+        # MinIO answers once the parts are assembled, which takes as long as the file is large
+        etag = await s3_calls.transfer(
+            "complete_multipart_upload",
+            multipart_calls.complete_upload,
+            minio_transfer_client,
+            BUCKET_NAME,
+            object_name,
+            s3_upload_id,
+            parts,
         )
+    except S3Error as e:
+        raise multipart_error(e)
+    completed = {"message": "Upload completed successfully", "etag": etag, "parts": len(parts)}
+    if object_name == file_name:
+        existence_cache.invalidate(object_name)
+        derivative_pipeline.enqueue(object_name)
+        return completed
+    try:
+        ref = await content_store.finalize(object_name)
     except S3Error as e:
         raise HTTPException(status_code=500, detail=f"MinIO error: {e}")
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Server error: {e}")
+    # None if finalized already, on the upload's bucket notification
+    return {**completed, **(content_response(ref) if ref else {})}
+
+@app.delete("/multipart-uploads/{uid}/{filename}/{upload_id}", status_code=204)
+async def abort_multipart_upload(uid: str, filename: str, upload_id: str):
+    """
+    Abort a multipart upload and discard its parts.
+    """
+    object_name, s3_upload_id = multipart_object_name(object_name_for_file(uid, filename), upload_id)
+    try:
+        await s3_calls.run(
+            "abort_multipart_upload",
+            multipart_calls.abort_upload,
+            minio_client,
+            BUCKET_NAME,
+            object_name,
+            s3_upload_id,
+        )
+    except S3Error as e:
+        raise multipart_error(e)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Expose MinIO call, content store, published asset, image derivative and existence cache
+    metrics in the Prometheus text format.
+    """
+    metrics = {
+        **s3_calls.metrics(),
+        **content_store.metrics(),
+        **published_assets.metrics(),
+        **derivative_pipeline.metrics(),
+        "minio_api_existence_cache_hits_total": existence_cache.hits,
+        "minio_api_existence_cache_misses_total": existence_cache.misses,
+    }
+    return "".join(f"{name} {value}\n" for name, value in metrics.items())
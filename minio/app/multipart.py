@@ -0,0 +1,48 @@
+import math
+import os
+from typing import Annotated, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+# --- Multipart Uploads ---
+# Large files are uploaded as parts, each PUT straight to MinIO on its own presigned URL, so a
+# client can upload several parts at once and retry or resume a failed part on its own.
+# S3 limits: every part but the last is 5 MiB to 5 GiB, and an upload has at most 10000 parts.
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+S3_MAX_PART_SIZE = 5 * 1024 * 1024 * 1024
+S3_MAX_PARTS = 10000
+MULTIPART_PART_SIZE = max(S3_MIN_PART_SIZE, int(os.getenv("MULTIPART_PART_SIZE", str(8 * 1024 * 1024))))
+# Most part URLs presigned per request; clients ask for more batches as they go
+MULTIPART_PRESIGN_BATCH = int(os.getenv("MULTIPART_PRESIGN_BATCH", "100"))
+MULTIPART_URL_EXPIRY_SECONDS = int(os.getenv("MULTIPART_URL_EXPIRY_SECONDS", "3600"))
+
+
+class MultipartInitiateRequest(BaseModel):
+    size: int = Field(ge=1, le=S3_MAX_PART_SIZE * S3_MAX_PARTS, description="Size of the whole file in bytes")
+    content_type: Optional[str] = None
+
+
+PartNumber = Annotated[int, Field(ge=1, le=S3_MAX_PARTS)]
+
+
+class PartUrlsRequest(BaseModel):
+    part_numbers: List[PartNumber] = Field(min_length=1, max_length=MULTIPART_PRESIGN_BATCH)
+
+
+class CompletedPart(BaseModel):
+    part_number: PartNumber
+    etag: str
+
+
+class MultipartCompleteRequest(BaseModel):
+    # Omitted: complete with every part MinIO has received, so clients need not read ETag headers
+    parts: Optional[List[CompletedPart]] = None
+
+
+def plan_parts(size: int) -> Tuple[int, int]:
+    """
+    Returns (part size, part count) for a file of `size` bytes: the configured part size, or
+    larger when the file would otherwise need more than S3_MAX_PARTS parts.
+    """
+    part_size = max(MULTIPART_PART_SIZE, math.ceil(size / S3_MAX_PARTS))
+    return part_size, math.ceil(size / part_size)
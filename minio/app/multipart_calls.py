@@ -0,0 +1,57 @@
+from typing import Dict, List
+
+import minio
+from minio import Minio
+from minio.datatypes import Part
+
+# --- Multipart Upload Calls ---
+# The MinIO SDK only exposes multipart uploads whole (put_object), so starting, listing,
+# completing and aborting an upload whose parts clients PUT themselves uses the SDK's private
+# methods. They are called from here and nowhere else, and only on SDK versions they have been
+# checked against: an upgrade that renames or changes them fails at startup, not mid-upload.
+SUPPORTED_MINIO_VERSIONS = ((7, 2),)
+_PRIVATE_METHODS = ("_create_multipart_upload", "_list_parts", "_complete_multipart_upload", "_abort_multipart_upload")
+
+
+def check_minio_version(version: str = minio.__version__):
+    """
+    Raises:
+        RuntimeError: If the installed MinIO SDK is not a supported version or lacks a method used here.
+    """
+    major_minor = tuple(int(number) for number in version.split(".")[:2])
+    if major_minor not in SUPPORTED_MINIO_VERSIONS:
+        supported = ", ".join(".".join(map(str, v)) + ".x" for v in SUPPORTED_MINIO_VERSIONS)
+        raise RuntimeError(f"Multipart uploads support MinIO SDK {supported}, not {version}")
+    missing = [name for name in _PRIVATE_METHODS if not callable(getattr(Minio, name, None))]
+    if missing:
+        raise RuntimeError(f"MinIO SDK {version} lacks {', '.join(missing)}")
+
+
+check_minio_version()
+
+
+def create_upload(client: Minio, bucket: str, object_name: str, headers: Dict[str, str]) -> str:
+    """Start a multipart upload and return its upload id."""
+    return client._create_multipart_upload(bucket, object_name, headers)
+
+
+def list_parts(client: Minio, bucket: str, object_name: str, upload_id: str) -> List[Part]:
+    """Every part received so far, in part number order, across as many pages as it takes."""
+    parts = []
+    marker = None
+    while True:
+        result = client._list_parts(bucket, object_name, upload_id, part_number_marker=marker)
+        parts.extend(result.parts)
+        if not result.is_truncated:
+            return parts
+        marker = result.next_part_number_marker
+
+
+def complete_upload(client: Minio, bucket: str, object_name: str, upload_id: str, parts: List[Part]) -> str:
+    """Assemble `parts` into the object and return its ETag."""
+    return client._complete_multipart_upload(bucket, object_name, upload_id, parts).etag
+
+
+def abort_upload(client: Minio, bucket: str, object_name: str, upload_id: str):
+    """Abort a multipart upload and discard its parts."""
+    client._abort_multipart_upload(bucket, object_name, upload_id)
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import re
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from minio.error import S3Error
+
+from content_store import ContentRef, blob_object_name
+from derivatives import Variant, is_image, variant_object_name
+from existence import TTLCache, EXISTENCE_CACHE_SIZE, EXISTENCE_CACHE_TTL, EXISTENCE_MISSING_TTL
+
+# --- Published Assets ---
+# Files of published documents are read through immutable URLs, {EXTERNAL_API_ENDPOINT}/assets/{sha256}
+# (/assets/{sha256}/{variant} for an image variant), which browsers and the proxy may cache for
+# good, since the content at a hash never changes. A document's markdown is served as its published
+# rendition: a copy in which links to images ({EXTERNAL_API_ENDPOINT}/files/{uid}/{filename}) are
+# replaced by the images' asset URLs. Only published hashes are served, and only content-addressed
+# files (see content_store.py) can be published; drafts keep presigned URLs.
+EXTERNAL_API_ENDPOINT = os.getenv("EXTERNAL_API_ENDPOINT", "http://localhost:8080/minio-api").rstrip("/")
+# Path of minio-api behind the proxy, e.g. /minio-api
+EXTERNAL_API_PATH = urlsplit(EXTERNAL_API_ENDPOINT).path
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# How long a rendition is reused that links an image variant not made yet in place of its original
+RENDITION_FALLBACK_TTL = 60
+
+PUBLISHED_PREFIX = "published/"
+RENDITION_PREFIX = "renditions/"
+
+SHA256_PATTERN = re.compile(r"[0-9a-f]{64}")
+# Image links as the editor inserts them, with or without scheme and host
+FILE_LINK_PATTERN = re.compile(
+    re.escape(EXTERNAL_API_PATH.encode())
+    + rb"/files/(?P<uid>[^/\s()\[\]<>\"'?#]+)/(?P<filename>[^/\s()\[\]<>\"'?#]+)(?:\?variant=(?P<variant>[a-z]+))?"
+)
+
+
+def published_object_name(sha256: str) -> str:
+    # Empty marker: the content with this hash may be served as an asset
+    return f"{PUBLISHED_PREFIX}{sha256}"
+
+
+def rendition_object_name(sha256: str) -> str:
+    # {"sha256": hash of the rendition} of the markdown with this hash
+    return f"{RENDITION_PREFIX}{sha256}"
+
+
+def asset_path(sha256: str, variant: Optional[Variant] = None) -> str:
+    return f"/assets/{sha256}" if variant is None else f"/assets/{sha256}/{variant.value}"
+
+
+class PublishedAssets:
+    """
+    Published hashes and renditions of published markdown. Storage access is injected as
+    coroutines, like for DerivativePipeline:
+
+    - read(object_name) -> bytes
+    - write(object_name, data, content_type)
+    - exists(object_name) -> whether the object exists
+    - lookup(object_name) -> the ContentRef a file points to, or None
+    """
+
+    def __init__(
+        self,
+        read: Callable[[str], Awaitable[bytes]],
+        write: Callable[[str, bytes, str], Awaitable[None]],
+        exists: Callable[[str], Awaitable[bool]],
+        lookup: Callable[[str], Awaitable[Optional[ContentRef]]],
+    ):
+        self.read = read
+        self.write = write
+        self.exists = exists
+        self.lookup = lookup
+        # Both are only ever added to, so present entries are kept long
+        self._published = TTLCache(EXISTENCE_CACHE_SIZE)
+        self._renditions = TTLCache(EXISTENCE_CACHE_SIZE)
+        self.published = 0
+        self.renditions = 0
+
+    async def is_published(self, sha256: str) -> bool:
+        found, published = self._published.lookup(sha256)
+        if not found:
+            published = await self.exists(published_object_name(sha256))
+            self._published.store(sha256, published, EXISTENCE_CACHE_TTL if published else EXISTENCE_MISSING_TTL)
+        return published
+
+    async def publish(self, sha256: str):
+        """
+        Allow the content with this hash to be served as an asset.
+        """
+        if not await self.is_published(sha256):
+            await self.write(published_object_name(sha256), b"", "application/octet-stream")
+            self._published.store(sha256, True, EXISTENCE_CACHE_TTL)
+            self.published += 1
+
+    async def publish_markdown(self, ref: ContentRef) -> str:
+        """
+        Publish a markdown file's rendition and the images it links to. Returns the rendition's hash.
+        """
+        rendition = await self._rendition(ref.sha256)
+        if rendition is not None:
+            return rendition
+
+        rendered, complete = await self._render(await self.read(blob_object_name(ref.sha256)))
+        rendition = hashlib.sha256(rendered).hexdigest()
+        if not await self.exists(blob_object_name(rendition)):
+            await self.write(blob_object_name(rendition), rendered, ref.content_type)
+        await self.publish(rendition)
+        self.renditions += 1
+        if complete:
+            entry = json.dumps({"sha256": rendition}).encode()
+            await self.write(rendition_object_name(ref.sha256), entry, "application/json")
+            self._renditions.store(ref.sha256, rendition, EXISTENCE_CACHE_TTL)
+        else:
+            # Rendered again once the missing variants may have been made
+            self._renditions.store(ref.sha256, rendition, RENDITION_FALLBACK_TTL)
+        return rendition
+
+    async def find(self, ref: ContentRef, markdown: bool) -> Optional[str]:
+        """
+        The hash a file's content is published under (its rendition's for markdown), or None if
+        it has not been published. Never publishes anything.
+        """
+        sha256 = await self._rendition(ref.sha256) if markdown else ref.sha256
+        return sha256 if sha256 is not None and await self.is_published(sha256) else None
+
+    async def _rendition(self, sha256: str) -> Optional[str]:
+        found, rendition = self._renditions.lookup(sha256)
+        if found:
+            return rendition
+        try:
+            rendition = json.loads(await self.read(rendition_object_name(sha256)))["sha256"]
+        except S3Error as e:
+            if e.code != "NoSuchKey":
+                raise
+            return None
+        self._renditions.store(sha256, rendition, EXISTENCE_CACHE_TTL)
+        return rendition
+
+    async def _render(self, markdown: bytes) -> Tuple[bytes, bool]:
+        """
+        Replace links to content-addressed images with their asset URLs, publishing the images.
+        Links to files stored as is are left alone. Returns the rendition, and False if a linked
+        variant was not made yet and the original is linked instead.
+        """
+        complete = True
+        replacements: Dict[bytes, bytes] = {}
+        for match in FILE_LINK_PATTERN.finditer(markdown):
+            link = match.group(0)
+            if link in replacements:
+                continue
+            object_name = f"{unquote(match.group('uid').decode())}/images/{unquote(match.group('filename').decode())}"
+            ref = await self.lookup(object_name) if is_image(object_name) else None
+            if ref is None:
+                continue
+            try:
+                variant = Variant(match.group("variant").decode()) if match.group("variant") else None
+            except ValueError:
+                variant = None
+            if variant is not None and not await self.exists(variant_object_name(blob_object_name(ref.sha256), variant)):
+                variant = None
+                complete = False
+            await self.publish(ref.sha256)
+            replacements[link] = f"{EXTERNAL_API_PATH}{asset_path(ref.sha256, variant)}".encode()
+        rendered = FILE_LINK_PATTERN.sub(lambda match: replacements.get(match.group(0), match.group(0)), markdown)
+        return rendered, complete
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            "minio_api_published_assets_total": self.published,
+            "minio_api_published_renditions_total": self.renditions,
+        }
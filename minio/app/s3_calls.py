@@ -0,0 +1,154 @@
+import asyncio
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+# --- Blocking MinIO Calls ---
+# The MinIO SDK is synchronous, so every SDK call runs on a bounded pool of worker threads and
+# never on the event loop; one slow MinIO response then only holds up its own request.
+# - MINIO_WORKERS caps how many calls run at once (and how many connections are pooled)
+# - MINIO_MAX_QUEUE caps how many calls may wait for a worker before requests are shed with 503
+# - MINIO_CALL_TIMEOUT_SECONDS bounds each metadata or presign call, including its wait for a
+#   worker, with 504
+# - MINIO_TRANSFER_TIMEOUT_SECONDS bounds calls that move object data (reads, writes, copies,
+#   assembling multipart uploads), which take as long as the object is large
+MINIO_WORKERS = int(os.getenv("MINIO_WORKERS", "32"))
+MINIO_MAX_QUEUE = int(os.getenv("MINIO_MAX_QUEUE", "256"))
+MINIO_CALL_TIMEOUT_SECONDS = float(os.getenv("MINIO_CALL_TIMEOUT_SECONDS", "5"))
+MINIO_TRANSFER_TIMEOUT_SECONDS = float(os.getenv("MINIO_TRANSFER_TIMEOUT_SECONDS", "300"))
+
+
+class S3Unavailable(Exception):
+    """Base class for MinIO calls that were not completed and may be retried later."""
+
+    status_code = 503
+
+
+class S3Overloaded(S3Unavailable):
+    """Raised when every worker is busy and the queue is full."""
+
+
+class S3CallTimeout(S3Unavailable):
+    """Raised when a call does not complete within the call timeout."""
+
+    status_code = 504
+
+
+class S3CallExecutor:
+    """
+    Runs blocking MinIO SDK calls on a bounded thread pool with a per-call timeout, and keeps
+    per-operation call, error, timeout and latency metrics.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = MINIO_WORKERS,
+        max_queue: int = MINIO_MAX_QUEUE,
+        timeout: float = MINIO_CALL_TIMEOUT_SECONDS,
+        transfer_timeout: float = MINIO_TRANSFER_TIMEOUT_SECONDS,
+    ):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.transfer_timeout = transfer_timeout
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.max_queued = 0
+        self.in_flight = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.calls = Counter()
+        self.errors = Counter()
+        self.timeouts = Counter()
+        self.call_seconds = Counter()
+
+    async def run(self, operation: str, fn: Callable, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) on a worker thread and return its result; the SDK's own
+        exceptions are raised unchanged.
+
+        Raises:
+            S3Overloaded: If the queue is full.
+            S3CallTimeout: If the call does not complete within the call timeout.
+        """
+        return await self._submit(self.timeout, operation, fn, args, kwargs)
+
+    async def transfer(self, operation: str, fn: Callable, *args, **kwargs):
+        """
+        Like run, for a call that moves object data: bounded by the transfer timeout instead.
+        """
+        return await self._submit(self.transfer_timeout, operation, fn, args, kwargs)
+
+    async def _submit(self, timeout: float, operation: str, fn: Callable, args: tuple, kwargs: dict):
+        with self._lock:
+            # Idle workers pick up queued calls first; beyond them at most max_queue calls may wait
+            if self.queued >= self.max_queue + self.max_workers - self.in_flight:
+                self.rejected += 1
+                raise S3Overloaded(f"MinIO call queue is full ({operation})")
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="minio")
+            executor = self._executor
+        future = executor.submit(self._run, time.perf_counter(), operation, fn, args, kwargs)
+        future.add_done_callback(self._dequeue_if_cancelled)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            # A call still waiting for a worker is dropped; a running one finishes in the background
+            with self._lock:
+                self.timeouts[operation] += 1
+            raise S3CallTimeout(f"MinIO {operation} timed out after {timeout}s")
+
+    def _dequeue_if_cancelled(self, future: Future):
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    def _run(self, submitted_at: float, operation: str, fn: Callable, args: tuple, kwargs: dict):
+        started_at = time.perf_counter()
+        with self._lock:
+            self.queued -= 1
+            self.in_flight += 1
+            self.wait_seconds += started_at - submitted_at
+        failed = True
+        try:
+            result = fn(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.calls[operation] += 1
+                self.call_seconds[operation] += time.perf_counter() - started_at
+                if failed:
+                    self.errors[operation] += 1
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            metrics = {
+                "minio_api_s3_workers": self.max_workers,
+                "minio_api_s3_in_flight": self.in_flight,
+                "minio_api_s3_queue_depth": self.queued,
+                "minio_api_s3_queue_depth_max": self.max_queued,
+                "minio_api_s3_rejected_total": self.rejected,
+                "minio_api_s3_wait_seconds_total": round(self.wait_seconds, 6),
+            }
+            for operation in sorted(self.calls.keys() | self.timeouts.keys()):
+                label = f'{{operation="{operation}"}}'
+                metrics[f"minio_api_s3_calls_total{label}"] = self.calls[operation]
+                metrics[f"minio_api_s3_errors_total{label}"] = self.errors[operation]
+                metrics[f"minio_api_s3_timeouts_total{label}"] = self.timeouts[operation]
+                metrics[f"minio_api_s3_call_seconds_total{label}"] = round(self.call_seconds[operation], 6)
+            return metrics
+
+    def shutdown(self):
+        # The pool is started again by the next call
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
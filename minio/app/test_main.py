@@ -0,0 +1,333 @@
+import asyncio
+import hashlib
+import io
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+# --- Test Object Store Setup ---
+# The load test's in-process S3 stand-in, which supports ranges, If-Match, copies and multipart
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "loadtest"))
+from fake_s3 import FakeS3Server
+
+fake_s3 = FakeS3Server().start()
+os.environ.update({
+    "MINIO_ENDPOINT": fake_s3.endpoint,
+    "EXTERNAL_ENDPOINT": fake_s3.url,
+    "MINIO_ACCESS_KEY": "test",
+    "MINIO_SECRET_KEY": "test",
+    "DERIVATIVE_WEBHOOK_TOKEN": "test-webhook-token",
+    "DERIVATIVE_WORKERS": "1",
+})
+
+import main
+from derivatives import BucketPoller, render_variants
+from content_store import ContentStore, new_upload_id, staging_object_name
+from existence import ExistenceCache
+from multipart_calls import check_minio_version
+from s3_calls import S3CallExecutor, S3CallTimeout
+
+
+@pytest.fixture(name="client", scope="module")
+def client_fixture():
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def uid():
+    # Every test writes under its own user id, so tests never see each other's files
+    return f"test-{uuid.uuid4().hex[:8]}"
+
+
+def test_existence_cache_outstanding_upload():
+    """Test that a key with an outstanding upload URL is not remembered as missing."""
+    cache = ExistenceCache(present_ttl=60, missing_ttl=60)
+    cache.set("1/images/a.png", False)
+    assert cache.get("1/images/a.png") is False
+
+    cache.expect_upload("1/images/a.png", 60)
+    assert cache.get("1/images/a.png") is None
+    # A read before the PUT lands is answered, but not cached
+    cache.set("1/images/a.png", False)
+    assert cache.get("1/images/a.png") is None
+    cache.set("1/images/a.png", True)
+    assert cache.get("1/images/a.png") is True
+
+    # Once the upload URL has expired, misses are cached again
+    cache.expect_upload("1/images/b.png", 0)
+    cache.set("1/images/b.png", False)
+    assert cache.get("1/images/b.png") is False
+
+
+def test_upload_url_read_before_upload(client, uid):
+    """Test that a read between issuing an upload URL and the upload does not hide the file."""
+    object_name = f"{uid}/images/a.png"
+    assert client.post(f"/generate-upload-url/{uid}", json={"filename": "a.png"}).status_code == 200
+    assert asyncio.run(main.object_exists(object_name, "cached")) is False
+
+    fake_s3.store.put(main.BUCKET_NAME, object_name, b"image")
+    assert asyncio.run(main.object_exists(object_name, "cached")) is True
+
+
+def test_transfer_timeout():
+    """Test that calls moving object data get the transfer timeout, and other calls the short one."""
+    calls = S3CallExecutor(max_workers=2, timeout=0.05, transfer_timeout=5)
+
+    async def call(run):
+        return await run("get_object", time.sleep, 0.2)
+
+    with pytest.raises(S3CallTimeout):
+        asyncio.run(call(calls.run))
+    asyncio.run(call(calls.transfer))
+    assert calls.metrics()['minio_api_s3_timeouts_total{operation="get_object"}'] == 1
+    calls.shutdown()
+
+
+def read_file(client, uid, filename) -> bytes:
+    response = client.get(f"/generate-read-url/{uid}/{filename}")
+    assert response.status_code == 200
+    return httpx.get(response.json()["url"]).content
+
+
+def test_multipart_upload(client, uid):
+    """Test starting, listing, completing and aborting multipart uploads through the SDK's private calls."""
+    data = os.urandom(9 * 1024 * 1024)
+    upload = client.post(f"/multipart-uploads/{uid}/big.png", json={"size": len(data)}).json()
+    assert upload["part_count"] == 2
+    for part in upload["parts"]:
+        start = (part["part_number"] - 1) * upload["part_size"]
+        assert httpx.put(part["url"], content=data[start:start + upload["part_size"]]).status_code == 200
+
+    parts = client.get(f"/multipart-uploads/{uid}/big.png/{upload['upload_id']}/parts").json()["parts"]
+    assert [part["part_number"] for part in parts] == [1, 2]
+    completed = client.post(f"/multipart-uploads/{uid}/big.png/{upload['upload_id']}/complete", json={}).json()
+    assert completed["parts"] == 2
+    assert read_file(client, uid, "big.png") == data
+
+    aborted = client.post(f"/multipart-uploads/{uid}/other.png", json={"size": 1}).json()
+    upload_path = f"/multipart-uploads/{uid}/other.png/{aborted['upload_id']}"
+    assert client.delete(upload_path).status_code == 204
+    assert client.get(f"{upload_path}/parts").status_code == 404
+
+
+def test_check_minio_version():
+    """Test that the multipart calls refuse SDK versions they have not been checked against."""
+    check_minio_version("7.2.8")
+    with pytest.raises(RuntimeError):
+        check_minio_version("8.0.0")
+
+
+def encode_png(image: Image.Image, **options) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG", **options)
+    return buffer.getvalue()
+
+
+def test_render_variants():
+    """Test that variants are resized and re-encoded, and left out when not smaller than the original."""
+    original = encode_png(Image.frombytes("RGB", (800, 600), os.urandom(800 * 600 * 3)))
+    rendered = render_variants(original)
+    thumbnail, content_type = rendered["thumbnail"]
+    assert content_type == "image/png"
+    assert Image.open(io.BytesIO(thumbnail)).size == (320, 240)
+    assert rendered["webp"][1] == "image/webp"
+
+    # A tiny, already optimized image gains nothing from being resized or re-encoded as PNG
+    tiny = encode_png(Image.new("RGB", (16, 16), (200, 10, 10)), optimize=True)
+    rendered = render_variants(tiny)
+    assert "thumbnail" not in rendered
+    assert "medium" not in rendered
+    assert all(len(encoded) < len(tiny) for encoded, _ in rendered.values())
+
+
+def test_bucket_poller():
+    """Test that the first listing skips processed objects, and later ones report new and changed objects."""
+    listing = [("1/images/done.png", "a", 10), ("1/images/new.png", "b", 20)]
+    created = []
+
+    async def list_objects():
+        return list(listing)
+
+    poller = BucketPoller(
+        list_objects,
+        lambda key, size: created.append((key, size)),
+        lambda key, keys: key == "1/images/done.png",
+    )
+    asyncio.run(poller.poll())
+    assert created == [("1/images/new.png", 20)]
+
+    created.clear()
+    asyncio.run(poller.poll())
+    assert created == []
+
+    listing[0] = ("1/images/done.png", "c", 30)
+    listing.append(("1/images/later.png", "d", 40))
+    asyncio.run(poller.poll())
+    assert created == [("1/images/done.png", 30), ("1/images/later.png", 40)]
+
+
+def test_bucket_event_token(client, uid):
+    """Test that bucket notifications are only accepted with the webhook token."""
+    event = {"Records": [{
+        "eventName": "s3:ObjectCreated:Put",
+        "s3": {"bucket": {"name": main.BUCKET_NAME}, "object": {"key": f"{uid}/images/a.png", "size": 1}},
+    }]}
+    assert client.post("/events/minio", json=event).status_code == 401
+    assert client.post("/events/minio", json=event, headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.post(
+        "/events/minio", json=event, headers={"Authorization": "Bearer test-webhook-token"}
+    ).status_code == 204
+
+
+def upload_file(client, uid, filename, data) -> str:
+    response = client.post(f"/generate-upload-url/{uid}", json={"filename": filename}).json()
+    assert httpx.put(response["url"], content=data).status_code == 200
+    return response["upload_id"]
+
+
+def bucket_keys(prefix: str):
+    with fake_s3.store.lock:
+        return [key for key in fake_s3.store.buckets[main.BUCKET_NAME] if key.startswith(prefix)]
+
+
+def wait_for_finalized(staging_name: str, timeout: float = 5):
+    # The staging object is deleted last
+    deadline = time.monotonic() + timeout
+    while bucket_keys(staging_name):
+        assert time.monotonic() < deadline, f"{staging_name} was not finalized"
+        time.sleep(0.05)
+
+
+def test_finalize_deduplicates(client, uid):
+    """Test that identical uploads of different files are stored once."""
+    data = f"# {uid}\n".encode()
+    deduplicated = main.content_store.deduplicated
+    first = client.post(f"/uploads/{uid}/a.md/{upload_file(client, uid, 'a.md', data)}/finalize").json()
+    second = client.post(f"/uploads/{uid}/b.md/{upload_file(client, uid, 'b.md', data)}/finalize").json()
+    assert first["sha256"] == second["sha256"]
+    assert main.content_store.deduplicated == deduplicated + 1
+    assert bucket_keys(f"blobs/{first['sha256'][:2]}/{first['sha256']}") != []
+    assert bucket_keys(f"staging/{uid}/") == []
+    assert read_file(client, uid, "a.md") == read_file(client, uid, "b.md") == data
+
+
+def test_rewrite_visible_on_next_read(client, uid):
+    """Test that a read right after an upload, without finalizing it, returns the new content."""
+    upload_file(client, uid, "a.md", b"# first\n")
+    assert read_file(client, uid, "a.md") == b"# first\n"
+    upload_file(client, uid, "a.md", b"# second\n")
+    assert read_file(client, uid, "a.md") == b"# second\n"
+
+
+def test_finalize_out_of_order(client, uid):
+    """Test that finalizing an earlier upload after a later one keeps the later content."""
+    urls = [client.post(f"/generate-upload-url/{uid}", json={"filename": "a.md"}).json() for _ in range(2)]
+    for response, data in zip(urls, (b"# earlier\n", b"# later\n")):
+        assert httpx.put(response["url"], content=data).status_code == 200
+    later = client.post(f"/uploads/{uid}/a.md/{urls[1]['upload_id']}/finalize").json()
+    earlier = client.post(f"/uploads/{uid}/a.md/{urls[0]['upload_id']}/finalize").json()
+    assert earlier["sha256"] != later["sha256"]
+    assert read_file(client, uid, "a.md") == b"# later\n"
+    assert client.post(f"/uploads/{uid}/a.md/{urls[0]['upload_id']}/finalize").status_code == 404
+
+
+def test_read_upload_never_finalized(client, uid):
+    """Test that reads find uploads this process did not hand out, e.g. from before a restart."""
+    object_name = f"{uid}/markdown/a.md"
+    upload_file(client, uid, "a.md", b"# first\n")
+    assert read_file(client, uid, "a.md") == b"# first\n"
+    # Uploaded with a URL from another process, and no notification arrived
+    fake_s3.store.put(main.BUCKET_NAME, staging_object_name(object_name, new_upload_id()), b"# second\n")
+
+    restarted = ContentStore(main.minio_client, main.BUCKET_NAME, main.s3_calls)
+    ref = asyncio.run(restarted.lookup(object_name))
+    assert ref.size == len(b"# second\n")
+    assert bucket_keys(f"staging/{object_name}/") == []
+    main.content_store.index_cache.clear()
+    assert read_file(client, uid, "a.md") == b"# second\n"
+
+
+def test_bucket_event_finalizes_upload(client, uid):
+    """Test that a bucket notification of an upload finalizes it in the background."""
+    object_name = f"{uid}/markdown/a.md"
+    staging_name = staging_object_name(object_name, new_upload_id())
+    fake_s3.store.put(main.BUCKET_NAME, staging_name, b"# notified\n")
+    event = {"Records": [{
+        "eventName": "s3:ObjectCreated:Put",
+        "s3": {"bucket": {"name": main.BUCKET_NAME}, "object": {"key": staging_name, "size": 11}},
+    }]}
+    response = client.post("/events/minio", json=event, headers={"Authorization": "Bearer test-webhook-token"})
+    assert response.status_code == 204
+    wait_for_finalized(staging_name)
+    assert bucket_keys(f"index/{object_name}") != []
+
+
+def test_bucket_poll_finalizes_upload(client, uid):
+    """Test that a bucket listing finalizes uploads left in staging."""
+    object_name = f"{uid}/markdown/a.md"
+    staging_name = staging_object_name(object_name, new_upload_id())
+    fake_s3.store.put(main.BUCKET_NAME, staging_name, b"# polled\n")
+    poller = BucketPoller(main.list_objects, main.object_created, main.object_processed)
+    client.portal.call(poller.poll)
+    wait_for_finalized(staging_name)
+    assert bucket_keys(f"index/{object_name}") != []
+
+
+def test_publish_file(client, uid):
+    """Test that files are only published by POST, and the GET only looks publications up."""
+    upload_file(client, uid, "a.png", encode_png(Image.new("RGB", (16, 16), (1, 2, 3))))
+    upload_file(client, uid, "a.md", f"![a](/minio-api/files/{uid}/a.png)\n".encode())
+    assert client.get(f"/published-url/{uid}/a.md").status_code == 404
+
+    published = client.post(f"/publications/{uid}/a.md").json()
+    assert published["url"].endswith(f"/assets/{published['sha256']}")
+    assert client.get(f"/published-url/{uid}/a.md").json() == published
+    rendition = client.get(f"/assets/{published['sha256']}")
+    assert rendition.status_code == 200
+    assert b"/minio-api/assets/" in rendition.content
+
+    # Changed content is not published until it is published again
+    upload_file(client, uid, "a.md", b"# changed\n")
+    assert client.get(f"/published-url/{uid}/a.md").status_code == 404
+    assert client.post(f"/publications/{uid}/missing.md").status_code == 404
+
+
+def test_unused_upload_url_checked_once(uid):
+    """Test that reads do not look for an upload that was found missing on every read."""
+    object_name = f"{uid}/markdown/a.md"
+    store = ContentStore(main.minio_client, main.BUCKET_NAME, main.s3_calls)
+    store.new_upload(object_name, 3600)
+
+    def stats():
+        return fake_s3.store.operations["head_object"]
+
+    before = stats()
+    for _ in range(3):
+        assert asyncio.run(store.lookup(object_name)) is None
+    assert stats() == before + 1
+
+
+def test_get_content(client, uid):
+    """Test that services read a file's current content, named by its ETag, through minio-api itself."""
+    upload_file(client, uid, "a.md", b"# first\n")
+    sha256 = '"' + hashlib.sha256(b"# first\n").hexdigest() + '"'
+    assert client.head(f"/content/{uid}/a.md").headers["etag"] == sha256
+    response = client.get(f"/content/{uid}/a.md")
+    assert response.content == b"# first\n"
+    assert response.headers["etag"] == sha256
+
+    # Files stored before content-addressed storage are named by MinIO's ETag
+    etag = fake_s3.store.put(main.BUCKET_NAME, f"{uid}/markdown/legacy.md", b"# legacy\n")
+    assert client.head(f"/content/{uid}/legacy.md").headers["etag"] == f'"{etag}"'
+    response = client.get(f"/content/{uid}/legacy.md")
+    assert response.content == b"# legacy\n"
+    assert response.headers["etag"] == f'"{etag}"'
+    assert client.get(f"/content/{uid}/missing.md").status_code == 404